@@ -45,6 +45,11 @@ CSRF_TRUSTED_ORIGINS = [SITE_URL] if SITE_URL else []
 # Configurações do Mercado Pago (lidas do .env)
 MERCADOPAGO_ACCESS_TOKEN = os.environ.get('MERCADOPAGO_ACCESS_TOKEN')
 MERCADOPAGO_PUBLIC_KEY = os.environ.get('MERCADOPAGO_PUBLIC_KEY')
+# Cliente HTTP do Mercado Pago (LihStudio/gateway.py): 'mercadopago' (API real)
+# ou 'falso' (em memória, para testes e benchmarks sem rede)
+MERCADOPAGO_GATEWAY = os.environ.get('MERCADOPAGO_GATEWAY', 'mercadopago')
+MERCADOPAGO_TIMEOUT_CONEXAO = float(os.environ.get('MERCADOPAGO_TIMEOUT_CONEXAO', 3.05))
+MERCADOPAGO_TIMEOUT_LEITURA = float(os.environ.get('MERCADOPAGO_TIMEOUT_LEITURA', 10))
 
 
 # Application definition
@@ -141,6 +146,11 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# PDFs gerados pelo comando gerar_relatorios (fora do controle de versão)
+RELATORIOS_DIR = os.environ.get('RELATORIOS_DIR', os.path.join(BASE_DIR, 'relatorios'))
+# 'reportlab' desenha os PDFs direto; 'html' usa os templates *_pdf.html com xhtml2pdf
+RELATORIOS_MOTOR = os.environ.get('RELATORIOS_MOTOR', 'reportlab')
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
@@ -161,5 +171,6 @@ if 'DATABASE_URL' in os.environ:
     # Substitui a configuração 'default' pela do Supabase/Postgres
     DATABASES['default'] = dj_database_url.config(
         conn_max_age=600,  # Mantém conexões abertas por 600s
-        ssl_require=True   # O Supabase exige conexão segura (SSL)
+        # O Supabase exige conexão segura (SSL); desligue só para um Postgres local
+        ssl_require=os.environ.get('DATABASE_SSL_REQUIRE', 'True') == 'True'
     )
\ No newline at end of file
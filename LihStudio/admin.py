@@ -1,10 +1,14 @@
 from django.contrib import admin
-from .models import Profissional, HorarioDisponivel, Agendamento
+from .models import (
+    Profissional, HorarioDisponivel, Agendamento, EmailSaida,
+    RegraDisponibilidade, ExcecaoDisponibilidade, Cliente, ExportacaoRelatorio,
+    FaturamentoMensal, NotificacaoPagamento,
+)
 
 
 @admin.register(Profissional)
 class ProfissionalAdmin(admin.ModelAdmin):
-    list_display  = ("nome", "slug", "ativo")
+    list_display  = ("nome", "slug", "comissao_percentual", "ativo")
     list_editable = ("ativo",)
     search_fields = ("nome",)
     prepopulated_fields = {"slug": ("nome",)}
@@ -25,6 +29,20 @@ class HorarioDisponivelAdmin(admin.ModelAdmin):
     hora_formatada.short_description = "Hora"
 
 
+@admin.register(RegraDisponibilidade)
+class RegraDisponibilidadeAdmin(admin.ModelAdmin):
+    list_display = ("profissional", "dias_semana", "hora_inicio", "hora_fim", "intervalo",
+                    "valida_de", "valida_ate", "ativa", "materializada_ate")
+    list_filter  = ("profissional", "ativa")
+    readonly_fields = ("materializada_ate",)
+
+
+@admin.register(ExcecaoDisponibilidade)
+class ExcecaoDisponibilidadeAdmin(admin.ModelAdmin):
+    list_display = ("profissional", "data", "hora_inicio", "hora_fim", "motivo")
+    list_filter  = ("profissional", "data")
+
+
 @admin.register(Agendamento)
 class AgendamentoAdmin(admin.ModelAdmin):
     list_display  = ("nome", "profissional", "servico", "data_formatada", "hora_formatada", "status")
@@ -37,4 +55,41 @@ class AgendamentoAdmin(admin.ModelAdmin):
 
     def hora_formatada(self, obj):
         return obj.hora_backup.strftime("%H:%M") if obj.hora_backup else ""
-    hora_formatada.short_description = "Hora"
\ No newline at end of file
+    hora_formatada.short_description = "Hora"
+
+
+@admin.register(Cliente)
+class ClienteAdmin(admin.ModelAdmin):
+    list_display  = ("nome", "telefone", "email", "ultima_visita", "ultimo_profissional", "visitas_concluidas")
+    search_fields = ("nome", "telefone_normalizado", "email")
+    readonly_fields = ("ultima_visita", "ultimo_profissional", "ultimo_servico", "visitas_concluidas")
+
+
+@admin.register(EmailSaida)
+class EmailSaidaAdmin(admin.ModelAdmin):
+    list_display  = ("assunto", "destinatarios", "status", "tentativas", "proxima_tentativa", "enviado_em")
+    list_filter   = ("status",)
+    search_fields = ("assunto", "destinatarios")
+    readonly_fields = ("criado_em", "enviado_em")
+
+
+@admin.register(NotificacaoPagamento)
+class NotificacaoPagamentoAdmin(admin.ModelAdmin):
+    list_display  = ("topico", "recurso_id", "acao", "status", "tentativas", "recebida_em", "processada_em")
+    list_filter   = ("status", "topico")
+    search_fields = ("recurso_id",)
+    readonly_fields = ("payload", "resultado", "ultimo_erro", "recebida_em", "processada_em")
+
+
+@admin.register(ExportacaoRelatorio)
+class ExportacaoRelatorioAdmin(admin.ModelAdmin):
+    list_display  = ("tipo", "status", "nome_download", "versao_dados", "tentativas", "criado_em", "concluido_em")
+    list_filter   = ("tipo", "status")
+    readonly_fields = ("chave", "arquivo", "erro")
+
+
+@admin.register(FaturamentoMensal)
+class FaturamentoMensalAdmin(admin.ModelAdmin):
+    list_display  = ("profissional", "mes", "ano", "faturamento_bruto", "total_servicos", "comissao", "atualizado_em")
+    list_filter   = ("ano", "profissional")
+    readonly_fields = ("profissional", "ano", "mes", "faturamento_bruto", "total_servicos", "comissao")
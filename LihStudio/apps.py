@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class LihstudioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'LihStudio'
+
+    def ready(self):
+        # Registra os sinais que invalidam o cache de disponibilidade e dos
+        # contadores do painel, os que mantêm os horários das regras recorrentes,
+        # o cadastro (e o nome de busca) de clientes, o faturamento consolidado
+        # e a versão dos relatórios
+        from . import busca, clientes, disponibilidade, faturamento, horarios, painel, relatorios  # noqa: F401
@@ -0,0 +1,60 @@
+"""
+Busca de clientes por nome, sem diferenciar acentos e maiúsculas.
+
+O Cliente guarda `nome_busca` (nome sem acento, minúsculo, espaços
+normalizados) e o banco indexa essa coluna para busca por trecho:
+
+- SQLite: tabela FTS5 `lihstudio_cliente_busca` com tokenizador trigram,
+  mantida por triggers (migração 0010);
+- Postgres: índice GIN `gin_trgm_ops` (extensão pg_trgm), que atende o
+  LIKE '%trecho%' gerado por `__contains`.
+
+As views usam só `filtro_nome()`, que devolve um Q pronto para Cliente ou
+para Agendamento (pelo cliente_id), independente do banco.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from .models import Cliente
+
+TABELA_FTS = "lihstudio_cliente_busca"
+# O trigram do FTS5 só casa trechos com 3 caracteres ou mais
+MINIMO_FTS = 3
+
+
+def normalizar_nome(nome):
+    """'  Cláudia  MARIA ' → 'claudia maria'."""
+    sem_acento = "".join(
+        c for c in unicodedata.normalize("NFKD", nome or "") if not unicodedata.combining(c)
+    )
+    return re.sub(r"\s+", " ", sem_acento).strip().casefold()
+
+
+def filtro_nome(termo, campo="id"):
+    """
+    Q que restringe `campo` (o id do cliente: "id" em Cliente, "cliente_id"
+    em Agendamento) aos clientes cujo nome contém `termo`.
+    """
+    termo = normalizar_nome(termo)
+    if not termo:
+        return Q()
+
+    if connection.vendor == "sqlite" and len(termo) >= MINIMO_FTS:
+        # Frase entre aspas: o termo é buscado como trecho literal
+        frase = '"' + termo.replace('"', '""') + '"'
+        ids = RawSQL(f"SELECT rowid FROM {TABELA_FTS} WHERE {TABELA_FTS} MATCH %s", (frase,))
+    else:
+        # Postgres (índice trigram) ou termo curto no SQLite (varre só a tabela de clientes)
+        ids = Cliente.objects.filter(nome_busca__contains=termo).values("id")
+    return Q(**{f"{campo}__in": ids})
+
+
+@receiver(pre_save, sender=Cliente)
+def _preencher_nome_busca(sender, instance, **kwargs):
+    instance.nome_busca = normalizar_nome(instance.nome)
@@ -0,0 +1,122 @@
+"""
+Manutenção incremental do cadastro de clientes.
+
+Todo Agendamento salvo é ligado ao Cliente de mesmo nome + telefone
+normalizado (criado na hora se preciso) e, depois do save/delete, só os
+números desse cliente são recalculados, a partir dos agendamentos dele
+(consulta pelo índice de cliente_id). Assim a lista de clientes vira uma
+leitura simples da tabela Cliente, sem agrupar a tabela de agendamentos.
+"""
+import re
+
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Agendamento, Cliente
+
+
+def normalizar_telefone(telefone):
+    """'(83) 99999-0000', '+55 83 99999 0000' → '83999990000'."""
+    digitos = re.sub(r"\D", "", telefone or "")
+    if digitos.startswith("55") and len(digitos) >= 12:
+        digitos = digitos[2:]
+    return digitos.lstrip("0")
+
+
+def cliente_para(nome, telefone):
+    cliente, _ = Cliente.objects.get_or_create(
+        nome=nome.strip(),
+        telefone_normalizado=normalizar_telefone(telefone),
+        defaults={"telefone": telefone},
+    )
+    return cliente
+
+
+def atualizar(cliente_id):
+    """Recalcula os números de um cliente; exclui o cliente se não sobrou agendamento."""
+    agendamentos = Agendamento.objects.filter(cliente_id=cliente_id)
+    ultimo = (
+        agendamentos.order_by("-data", F("hora_backup").desc(nulls_last=True), "-id")
+        .values("data", "telefone", "email", "profissional_id", "servico_nome_snapshot", "servico__nome")
+        .first()
+    )
+    if ultimo is None:
+        Cliente.objects.filter(pk=cliente_id).delete()
+        return
+
+    Cliente.objects.filter(pk=cliente_id).update(
+        telefone=ultimo["telefone"],
+        email=ultimo["email"],
+        ultima_visita=ultimo["data"],
+        ultimo_profissional_id=ultimo["profissional_id"],
+        ultimo_servico=ultimo["servico_nome_snapshot"] or ultimo["servico__nome"] or "",
+        visitas_concluidas=agendamentos.filter(status="concluido").count(),
+    )
+
+
+def resumo_por_cliente(agendamentos):
+    """
+    Uma linha por cliente dos `agendamentos` (já filtrados), agregada no
+    banco e lida em blocos: a memória não cresce com o histórico. Os dados
+    do "último" são os do agendamento mais recente dentro do mesmo filtro.
+    """
+    ultimo = agendamentos.filter(cliente_id=OuterRef("cliente_id")).order_by(
+        "-data", F("hora_backup").desc(nulls_last=True), "-id"
+    )
+    consulta = (
+        agendamentos.filter(cliente__isnull=False)
+        .values("cliente_id", "cliente__nome", "cliente__telefone")
+        .annotate(
+            total_visitas=Count("id", filter=Q(status="concluido")),
+            ultima_visita=Max("data"),
+            ultimo_profissional=Subquery(ultimo.values("profissional__nome")[:1]),
+            ultimo_servico=Subquery(ultimo.annotate(
+                servico_exibido=Coalesce(NullIf("servico_nome_snapshot", Value("")), "servico__nome")
+            ).values("servico_exibido")[:1]),
+            ultimo_status=Subquery(ultimo.values("status")[:1]),
+        )
+        .order_by("cliente__nome", "cliente_id")
+    )
+    for c in consulta.iterator(chunk_size=2000):
+        yield {
+            "id": c["cliente_id"],
+            "nome": c["cliente__nome"],
+            "telefone": c["cliente__telefone"],
+            "profissional": c["ultimo_profissional"] or "",
+            "total_visitas": c["total_visitas"],
+            "ultima_visita": c["ultima_visita"],
+            "ultimo_servico": c["ultimo_servico"] or "",
+            "status": c["ultimo_status"],
+        }
+
+
+@receiver(pre_save, sender=Agendamento)
+def _ligar_cliente(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._cliente_anterior = instance.cliente_id
+    cliente = instance.cliente
+    if (
+        cliente is None
+        or cliente.nome != instance.nome.strip()
+        or cliente.telefone_normalizado != normalizar_telefone(instance.telefone)
+    ):
+        instance.cliente = cliente_para(instance.nome, instance.telefone)
+
+
+@receiver(post_save, sender=Agendamento)
+def _agendamento_salvo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    atualizar(instance.cliente_id)
+    anterior = getattr(instance, "_cliente_anterior", None)
+    if anterior and anterior != instance.cliente_id:
+        atualizar(anterior)
+
+
+@receiver(post_delete, sender=Agendamento)
+def _agendamento_excluido(sender, instance, **kwargs):
+    if instance.cliente_id:
+        atualizar(instance.cliente_id)
@@ -0,0 +1,131 @@
+"""
+Modelo de leitura da disponibilidade pública (datas → horários livres).
+
+Cada Profissional carrega o contador `versao_disponibilidade`, incrementado
+sempre que um HorarioDisponivel dela é criado, liberado, ocupado ou excluído.
+O calendário fica no cache sob (profissional, versão, dia), então com o
+cache quente a página de agendamento custa uma única consulta: a lista de
+profissionais, que já traz a versão atual de cada agenda. Os serviços do
+formulário também ficam no cache e saem dele quando um Servico muda.
+
+A leitura nunca grava: as regras recorrentes viram horários no comando
+`materializar_horarios` (diário) e nos sinais de RegraDisponibilidade
+(ver horarios.py), não a partir das views públicas.
+"""
+from contextlib import contextmanager
+import threading
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import HorarioDisponivel, Profissional, Servico
+
+CACHE_TIMEOUT = 60 * 60  # 1 hora; a versão já garante que nada fica velho
+CHAVE_SERVICOS = "disponibilidade:servicos"
+
+_estado = threading.local()
+
+
+def profissionais_ativos():
+    """Profissionais ativos, já com a versão da agenda, em uma consulta."""
+    return list(
+        Profissional.objects.filter(ativo=True)
+        .only("id", "nome", "slug", "versao_disponibilidade")
+    )
+
+
+def calendario(profissional):
+    """
+    Retorna {data: [(horario_id, hora), ...]} com os horários livres da
+    profissional de hoje em diante, ordenados. Só consulta o banco quando
+    a versão (ou o dia) mudou desde a última montagem.
+    """
+    hoje = timezone.now().date()
+    chave = f"disponibilidade:{profissional.pk}:{profissional.versao_disponibilidade}:{hoje.isoformat()}"
+
+    dados = cache.get(chave)
+    if dados is None:
+        dados = {}
+        livres = (
+            HorarioDisponivel.objects
+            .filter(profissional_id=profissional.pk, disponivel=True, data__gte=hoje)
+            .order_by("data", "hora")
+            .values_list("id", "data", "hora")
+        )
+        for horario_id, data, hora in livres:
+            dados.setdefault(data, []).append((horario_id, hora))
+        cache.set(chave, dados, CACHE_TIMEOUT)
+    return dados
+
+
+def servicos_ativos():
+    """Serviços ativos do formulário de agendamento, na ordem do <select>."""
+    servicos = cache.get(CHAVE_SERVICOS)
+    if servicos is None:
+        servicos = list(
+            Servico.objects.filter(ativo=True)
+            .order_by("ordem", "nome")
+            .only("id", "nome", "preco")
+        )
+        cache.set(CHAVE_SERVICOS, servicos, CACHE_TIMEOUT)
+    return servicos
+
+
+def invalidar(*profissional_ids):
+    """
+    Incrementa a versão da agenda das profissionais informadas.
+
+    Chame dentro da mesma transação que alterou os horários. Caminhos que
+    usam QuerySet.update() precisam chamar explicitamente; save()/delete()
+    já são cobertos pelos sinais abaixo.
+    """
+    ids = {pid for pid in profissional_ids if pid}
+    if not ids:
+        return
+
+    lote = getattr(_estado, "lote", None)
+    if lote is not None:
+        lote.update(ids)
+        return
+
+    Profissional.objects.filter(pk__in=ids).update(
+        versao_disponibilidade=F("versao_disponibilidade") + 1,
+        disponibilidade_atualizada_em=timezone.now(),
+    )
+
+
+@contextmanager
+def alteracao_em_lote():
+    """
+    Agrupa as invalidações de um bloco (ex.: exclusão em massa, geração
+    semanal) em um único UPDATE no final, em vez de um por horário.
+    """
+    if getattr(_estado, "lote", None) is not None:
+        yield
+        return
+
+    _estado.lote = set()
+    try:
+        yield
+    finally:
+        ids = _estado.lote
+        _estado.lote = None
+        invalidar(*ids)
+
+
+@receiver(post_save, sender=HorarioDisponivel)
+@receiver(post_delete, sender=HorarioDisponivel)
+def _horario_alterado(sender, instance, **kwargs):
+    invalidar(instance.profissional_id)
+
+
+@receiver(post_save, sender=Servico)
+@receiver(post_delete, sender=Servico)
+def _servico_alterado(sender, instance, **kwargs):
+    cache.delete(CHAVE_SERVICOS)
+    # De novo no commit: uma página montada antes dele pode ter guardado a lista antiga
+    transaction.on_commit(lambda: cache.delete(CHAVE_SERVICOS))
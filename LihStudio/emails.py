@@ -0,0 +1,41 @@
+"""
+Envio de e-mails pela caixa de saída (EmailSaida).
+
+As views montam o EmailMultiAlternatives como sempre e chamam
+`enfileirar(msg)` no lugar de `msg.send()`; o comando `enviar_emails`
+entrega a fila usando uma única conexão SMTP.
+"""
+from django.core.mail import EmailMultiAlternatives
+
+from .models import EmailSaida
+
+
+def enfileirar(msg):
+    """Grava a mensagem na caixa de saída (na transação corrente)."""
+    html = ""
+    for conteudo, mimetype in getattr(msg, "alternatives", []):
+        if mimetype == "text/html":
+            html = conteudo
+            break
+
+    return EmailSaida.objects.create(
+        assunto=msg.subject,
+        texto=msg.body,
+        html=html,
+        remetente=msg.from_email or "",
+        destinatarios=list(msg.to),
+    )
+
+
+def montar_mensagem(email, connection=None):
+    """Reconstrói o EmailMultiAlternatives a partir de um EmailSaida."""
+    msg = EmailMultiAlternatives(
+        email.assunto,
+        email.texto,
+        email.remetente or None,
+        email.destinatarios,
+        connection=connection,
+    )
+    if email.html:
+        msg.attach_alternative(email.html, "text/html")
+    return msg
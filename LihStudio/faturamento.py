@@ -0,0 +1,281 @@
+"""
+Faturamento consolidado por profissional e mês (FaturamentoMensal).
+
+Um agendamento entra no faturamento quando está concluído, tem valor e
+está marcado para contabilizar. A cada save/delete que mexe nisso, só o
+mês da profissional afetada é recalculado, pelo índice parcial de
+faturamento (agend_faturamento_idx): o custo não cresce com o histórico.
+Caminhos com QuerySet.update() chamam `atualizar_meses()` explicitamente.
+O recálculo trava a linha da profissional antes de somar, então duas
+conclusões simultâneas no mesmo mês não gravam um total sem a outra.
+
+`resumo_mes()` é o serviço único de faturamento (tela, PDF e APIs): lê o
+consolidado e guarda o resultado no cache por (filtros, versão). A versão
+sobe a cada mudança no consolidado, então abrir o relatório e exportar o
+PDF logo depois calcula tudo uma vez só. `serie_mensal()` usa o mesmo
+cache para a evolução mês a mês (24 meses = uma consulta).
+
+A comissão usa o percentual de cada profissional (Profissional.comissao_percentual);
+mudar o percentual recalcula a comissão de todos os meses dela.
+"""
+import calendar
+from datetime import date
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Agendamento, FaturamentoMensal, Profissional, VersaoDados
+
+VERSAO = "faturamento"
+MAX_MESES_SERIE = 60
+CACHE_TIMEOUT = 60 * 60  # segundos; a versão já invalida a cada mudança
+CENTAVOS = Decimal("0.01")
+
+
+def comissao(bruto, percentual):
+    return (bruto * percentual / 100).quantize(CENTAVOS)
+
+
+def versao():
+    return VersaoDados.atual(VERSAO)
+
+
+def invalidar():
+    VersaoDados.incrementar(VERSAO)
+
+
+def periodo(ano, mes=None):
+    """(primeiro dia, último dia) do mês, ou do ano se `mes` for None."""
+    if mes is None:
+        return date(ano, 1, 1), date(ano, 12, 31)
+    return date(ano, mes, 1), date(ano, mes, calendar.monthrange(ano, mes)[1])
+
+
+def faturados():
+    """Agendamentos que contam no faturamento (mesma condição do índice parcial)."""
+    return Agendamento.objects.filter(status="concluido", contabilizar=True, valor_total__isnull=False)
+
+
+def _conta(status, contabilizar, valor_total):
+    return status == "concluido" and contabilizar and valor_total is not None
+
+
+@transaction.atomic
+def atualizar_mes(profissional_id, ano, mes):
+    """
+    Recalcula o consolidado de uma profissional em um mês. A soma só roda
+    depois de travar a profissional (a linha do mês pode ainda não existir):
+    quem recalcula em seguida espera o commit e soma vendo o agendamento do outro.
+    """
+    percentual = (
+        Profissional.objects.select_for_update()
+        .values_list("comissao_percentual", flat=True).get(pk=profissional_id)
+    )
+    totais = faturados().filter(profissional_id=profissional_id, data__range=periodo(ano, mes)).aggregate(
+        bruto=Sum("valor_total"), servicos=Count("id")
+    )
+    invalidar()
+    if not totais["servicos"]:
+        FaturamentoMensal.objects.filter(profissional_id=profissional_id, ano=ano, mes=mes).delete()
+        return
+
+    FaturamentoMensal.objects.update_or_create(
+        profissional_id=profissional_id, ano=ano, mes=mes,
+        defaults={
+            "faturamento_bruto": totais["bruto"],
+            "total_servicos": totais["servicos"],
+            "comissao": comissao(totais["bruto"], percentual),
+        },
+    )
+
+
+def atualizar_meses(agendamentos):
+    """Recalcula os meses tocados por uma lista/QuerySet de agendamentos (após um update em massa)."""
+    meses = {
+        (profissional_id, data.year, data.month)
+        for profissional_id, data in (
+            agendamentos.values_list("profissional_id", "data") if hasattr(agendamentos, "values_list")
+            else ((a.profissional_id, a.data) for a in agendamentos)
+        )
+    }
+    for profissional_id, ano, mes in meses:
+        atualizar_mes(profissional_id, ano, mes)
+
+
+def _memorizado(chave, calcular):
+    chave = f"faturamento:{versao()}:{chave}"
+    dados = cache.get(chave)
+    if dados is None:
+        dados = calcular()
+        cache.set(chave, dados, CACHE_TIMEOUT)
+    return dados
+
+
+def _slug(profissional_slug):
+    return profissional_slug if profissional_slug and profissional_slug != "todos" else ""
+
+
+def resumo_mes(ano, mes, profissional_slug=None):
+    """
+    Totais do mês, do histórico inteiro e a análise por profissional, lidos
+    do consolidado e memorizados por (ano, mês, profissional, versão).
+    """
+    slug = _slug(profissional_slug)
+    return _memorizado(f"resumo:{ano}:{mes}:{slug}", lambda: _calcular_resumo(ano, mes, slug))
+
+
+def _calcular_resumo(ano, mes, slug):
+    do_mes = FaturamentoMensal.objects.filter(ano=ano, mes=mes)
+    if slug:
+        do_mes = do_mes.filter(profissional__slug=slug)
+
+    totais = do_mes.aggregate(bruto=Sum("faturamento_bruto"), servicos=Sum("total_servicos"), comissao=Sum("comissao"))
+    geral = FaturamentoMensal.objects.aggregate(bruto=Sum("faturamento_bruto"))["bruto"]
+
+    return {
+        "faturamento_total_bruto": geral or Decimal("0.00"),
+        "total_bruto_mes": totais["bruto"] or Decimal("0.00"),
+        "total_servicos_mes": totais["servicos"] or 0,
+        "total_comissao_mes": totais["comissao"] or Decimal("0.00"),
+        "analise_profissionais": list(
+            do_mes.values("profissional__nome", "profissional__slug", "profissional__comissao_percentual",
+                          "total_servicos", "faturamento_bruto")
+            .annotate(comissao_prof=F("comissao"))
+            .order_by("-faturamento_bruto")
+        ),
+    }
+
+
+def meses_entre(inicio, fim):
+    """[(ano, mes), ...] de `inicio` a `fim` (pares (ano, mes)), inclusive."""
+    ano, mes = inicio
+    meses = []
+    while (ano, mes) <= fim:
+        meses.append((ano, mes))
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+def serie_mensal(inicio, fim, profissional_slug=None):
+    """
+    Faturamento, serviços e repasse mês a mês entre `inicio` e `fim` (pares
+    (ano, mes), inclusive), no total e por profissional. Uma única consulta
+    agrupada no consolidado; meses sem faturamento entram com zero.
+    """
+    meses = meses_entre(inicio, fim)
+    if not meses:
+        raise ValueError("O início da série é depois do fim.")
+    if len(meses) > MAX_MESES_SERIE:
+        raise ValueError(f"A série pode ter no máximo {MAX_MESES_SERIE} meses.")
+    slug = _slug(profissional_slug)
+    return _memorizado(
+        f"serie:{inicio[0]}-{inicio[1]}:{fim[0]}-{fim[1]}:{slug}", lambda: _calcular_serie(meses, slug)
+    )
+
+
+def _calcular_serie(meses, slug):
+    (ano_ini, mes_ini), (ano_fim, mes_fim) = meses[0], meses[-1]
+    # Comparações diretas em (ano, mes) para o índice do consolidado servir
+    linhas = FaturamentoMensal.objects.filter(
+        Q(ano__gt=ano_ini) | Q(ano=ano_ini, mes__gte=mes_ini),
+        Q(ano__lt=ano_fim) | Q(ano=ano_fim, mes__lte=mes_fim),
+    )
+    if slug:
+        linhas = linhas.filter(profissional__slug=slug)
+
+    posicao = {m: i for i, m in enumerate(meses)}
+
+    def zeros(valor):
+        return [valor] * len(meses)
+
+    total = {"faturamento": zeros(Decimal("0.00")), "servicos": zeros(0), "comissao": zeros(Decimal("0.00"))}
+    profissionais = {}
+    for linha in linhas.values_list("profissional__slug", "profissional__nome", "ano", "mes",
+                                    "faturamento_bruto", "total_servicos", "comissao").order_by("profissional__nome"):
+        prof_slug, nome, ano, mes, bruto, servicos, comissao_mes = linha
+        serie = profissionais.setdefault(prof_slug, {
+            "slug": prof_slug, "nome": nome,
+            "faturamento": zeros(Decimal("0.00")), "servicos": zeros(0), "comissao": zeros(Decimal("0.00")),
+        })
+        i = posicao[(ano, mes)]
+        for dados in (serie, total):
+            dados["faturamento"][i] += bruto
+            dados["servicos"][i] += servicos
+            dados["comissao"][i] += comissao_mes
+
+    return {
+        "meses": [f"{ano:04d}-{mes:02d}" for ano, mes in meses],
+        "total": total,
+        "profissionais": list(profissionais.values()),
+    }
+
+
+# ------------------------------------------------------------------
+# Sinais
+# ------------------------------------------------------------------
+
+def _mes_se_conta(profissional_id, data, status, contabilizar, valor_total):
+    data = Agendamento._meta.get_field("data").to_python(data)  # pode ter vindo como texto
+    if data and _conta(status, contabilizar, valor_total):
+        return (profissional_id, data.year, data.month), valor_total
+    return None
+
+
+@receiver(pre_save, sender=Agendamento)
+def _guardar_anterior(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = None
+    if instance.pk:
+        anterior = (
+            Agendamento.objects.filter(pk=instance.pk)
+            .values_list("profissional_id", "data", "status", "contabilizar", "valor_total")
+            .first()
+        )
+    instance._faturamento_anterior = _mes_se_conta(*anterior) if anterior else None
+
+
+@receiver(post_save, sender=Agendamento)
+def _agendamento_salvo(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior = getattr(instance, "_faturamento_anterior", None)
+    atual = _mes_se_conta(instance.profissional_id, instance.data, instance.status,
+                          instance.contabilizar, instance.valor_total)
+    if anterior == atual:
+        return  # nada que conte no faturamento mudou
+    for mes in {m for m, _ in filter(None, (anterior, atual))}:
+        atualizar_mes(*mes)
+
+
+@receiver(post_delete, sender=Agendamento)
+def _agendamento_excluido(sender, instance, **kwargs):
+    atual = _mes_se_conta(instance.profissional_id, instance.data, instance.status,
+                          instance.contabilizar, instance.valor_total)
+    if atual:
+        atualizar_mes(*atual[0])
+
+
+@receiver(pre_save, sender=Profissional)
+def _guardar_percentual(sender, instance, raw=False, **kwargs):
+    instance._percentual_anterior = None
+    if instance.pk and not raw:
+        instance._percentual_anterior = (
+            Profissional.objects.filter(pk=instance.pk).values_list("comissao_percentual", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Profissional)
+def _profissional_salva(sender, instance, raw=False, **kwargs):
+    anterior = getattr(instance, "_percentual_anterior", None)
+    if raw or anterior is None or anterior == instance.comissao_percentual:
+        return
+    meses = list(FaturamentoMensal.objects.filter(profissional=instance))
+    for mes in meses:
+        mes.comissao = comissao(mes.faturamento_bruto, instance.comissao_percentual)
+    FaturamentoMensal.objects.bulk_update(meses, ["comissao"])
+    invalidar()
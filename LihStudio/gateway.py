@@ -0,0 +1,238 @@
+"""
+Cliente do Mercado Pago compartilhado pelo processo.
+
+O SDK oficial abre uma requests.Session nova (e um handshake TLS novo) a
+cada chamada e usa 60 s de timeout. Aqui há um cliente por processo,
+criado na primeira chamada a `gateway()`:
+
+- uma Session com pool de conexões keep-alive, reaproveitada entre requests;
+- timeouts separados de conexão e de leitura (MERCADOPAGO_TIMEOUT_*);
+- um disjuntor: depois de FALHAS_PARA_ABRIR falhas seguidas (erro de rede
+  ou 5xx), as chamadas falham na hora com GatewayIndisponivel durante
+  ESPERA_DISJUNTOR segundos, em vez de prender os workers esperando a API.
+
+Com MERCADOPAGO_GATEWAY='falso' o cliente é o GatewayFalso, em memória,
+para testes e benchmarks sem rede.
+"""
+import itertools
+import threading
+import time
+
+import mercadopago
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from mercadopago.http.http_client import HttpClient
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+FALHAS_PARA_ABRIR = 5
+ESPERA_DISJUNTOR = 30      # segundos com o disjuntor aberto
+TAMANHO_POOL = 10          # conexões keep-alive mantidas com a API
+TENTATIVAS_HTTP = 2        # novas tentativas só quando a conexão falha (nada chegou à API)
+LIMITE_BUSCA = 100         # resultados por página na busca de pagamentos
+
+
+class GatewayIndisponivel(Exception):
+    """O disjuntor está aberto: a API do Mercado Pago falhou repetidamente."""
+
+
+class Disjuntor:
+    """Conta falhas seguidas e recusa chamadas por um tempo quando passam do limite."""
+
+    def __init__(self, limite=FALHAS_PARA_ABRIR, espera=ESPERA_DISJUNTOR, relogio=time.monotonic):
+        self.limite = limite
+        self.espera = espera
+        self.relogio = relogio
+        self.falhas = 0
+        self.aberto_ate = None
+        self._trava = threading.Lock()
+
+    def verificar(self):
+        with self._trava:
+            if self.aberto_ate is None:
+                return
+            if self.relogio() < self.aberto_ate:
+                raise GatewayIndisponivel("Mercado Pago indisponível; nova tentativa em instantes.")
+            # Meio-aberto: deixa esta chamada passar; uma nova falha reabre na hora
+            self.aberto_ate = None
+            self.falhas = self.limite - 1
+
+    def sucesso(self):
+        with self._trava:
+            self.falhas = 0
+
+    def falha(self):
+        with self._trava:
+            self.falhas += 1
+            if self.falhas >= self.limite:
+                self.aberto_ate = self.relogio() + self.espera
+
+
+class ClienteHttpPersistente(HttpClient):
+    """HttpClient do SDK com Session persistente, timeouts próprios e disjuntor."""
+
+    def __init__(self, timeout_conexao, timeout_leitura, disjuntor=None):
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.disjuntor = disjuntor or Disjuntor()
+        self.sessao = requests.Session()
+        # Sem nova tentativa em timeout de leitura ou 5xx: uma chamada nunca
+        # passa de timeout_leitura esperando a API (o worker já refaz com backoff)
+        adaptador = HTTPAdapter(
+            pool_connections=TAMANHO_POOL, pool_maxsize=TAMANHO_POOL,
+            max_retries=Retry(total=TENTATIVAS_HTTP, connect=TENTATIVAS_HTTP, read=0, status=0, other=0,
+                              backoff_factor=0.3),
+        )
+        self.sessao.mount("https://", adaptador)
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        self.disjuntor.verificar()
+        kwargs["timeout"] = self.timeout
+        try:
+            resultado = self.sessao.request(method, url, **kwargs)
+        except requests.RequestException:
+            self.disjuntor.falha()
+            raise
+
+        if resultado.status_code >= 500:
+            self.disjuntor.falha()
+        else:
+            self.disjuntor.sucesso()
+
+        resposta = {"status": resultado.status_code, "response": None}
+        if resultado.status_code != 204 and resultado.content:
+            try:
+                resposta["response"] = resultado.json()
+            except ValueError:
+                pass
+        return resposta
+
+
+class GatewayMercadoPago:
+    """API real, pelo SDK oficial com o cliente HTTP persistente."""
+
+    def __init__(self, access_token, timeout_conexao, timeout_leitura):
+        self.http = ClienteHttpPersistente(timeout_conexao, timeout_leitura)
+        self.sdk = mercadopago.SDK(access_token=access_token, http_client=self.http)
+
+    def criar_preferencia(self, dados):
+        return self.sdk.preference().create(dados)
+
+    def consultar_pagamento(self, pagamento_id):
+        return self.sdk.payment().get(pagamento_id)
+
+    def buscar_pagamentos(self, referencias, desde):
+        """
+        Pagamentos atualizados desde `desde` com external_reference em
+        `referencias`. A busca da API filtra uma referência por vez, então
+        pede a janela de datas inteira e filtra aqui. O custo é uma página
+        por LIMITE_BUSCA pagamentos da conta na janela, qualquer que seja o
+        número de referências: chame uma vez para todas, não por lote.
+        """
+        referencias = {str(r) for r in referencias}
+        encontrados = []
+        offset = 0
+        while True:
+            resposta = self.sdk.payment().search({
+                "range": "date_last_updated", "begin_date": desde.isoformat(timespec="milliseconds"),
+                "end_date": "NOW", "sort": "date_last_updated", "criteria": "asc",
+                "limit": LIMITE_BUSCA, "offset": offset,
+            })
+            if resposta.get("status") != 200:
+                return resposta
+            resultados = (resposta.get("response") or {}).get("results") or []
+            encontrados += [p for p in resultados if str(p.get("external_reference")) in referencias]
+            if len(resultados) < LIMITE_BUSCA:
+                return {"status": 200, "response": {"results": encontrados}}
+            offset += LIMITE_BUSCA
+
+
+class GatewayFalso:
+    """
+    Mercado Pago em memória, com a mesma interface e o mesmo formato de
+    resposta ({"status": ..., "response": ...}). `pagar()` simula o
+    pagamento de um agendamento (na ordem em que a busca devolve);
+    `latencia` simula o tempo de rede.
+    """
+
+    def __init__(self, latencia=0):
+        self.latencia = latencia
+        self.preferencias = {}
+        self.pagamentos = {}
+        self.chamadas = []
+        self._ids = itertools.count(1)
+        self._trava = threading.Lock()
+
+    def _chamada(self, nome):
+        with self._trava:
+            self.chamadas.append(nome)
+            numero = next(self._ids)
+        if self.latencia:
+            time.sleep(self.latencia)
+        return numero
+
+    def criar_preferencia(self, dados):
+        numero = self._chamada("criar_preferencia")
+        preferencia = {
+            "id": f"pref-{numero}",
+            "init_point": f"https://mercadopago.falso/checkout/pref-{numero}",
+            "external_reference": dados.get("external_reference"),
+            "items": dados.get("items", []),
+        }
+        self.preferencias[preferencia["id"]] = preferencia
+        return {"status": 201, "response": preferencia}
+
+    def consultar_pagamento(self, pagamento_id):
+        self._chamada("consultar_pagamento")
+        pagamento = self.pagamentos.get(str(pagamento_id))
+        if pagamento is None:
+            return {"status": 404, "response": {"message": "Payment not found"}}
+        return {"status": 200, "response": pagamento}
+
+    def buscar_pagamentos(self, referencias, desde):
+        self._chamada("buscar_pagamentos")
+        referencias = {str(r) for r in referencias}
+        return {"status": 200, "response": {
+            "results": [p for p in self.pagamentos.values() if p["external_reference"] in referencias],
+        }}
+
+    def pagar(self, external_reference, status="approved", pagamento_id=None):
+        """Registra um pagamento para o agendamento e devolve o id dele."""
+        pagamento_id = str(pagamento_id or 9000 + next(self._ids))
+        self.pagamentos[pagamento_id] = {
+            "id": int(pagamento_id), "status": status, "external_reference": str(external_reference),
+        }
+        return pagamento_id
+
+
+_gateway = None
+_trava_gateway = threading.Lock()
+
+
+def gateway():
+    """Cliente do Mercado Pago do processo (criado na primeira chamada)."""
+    global _gateway
+    if _gateway is None:
+        with _trava_gateway:
+            if _gateway is None:
+                _gateway = _criar()
+    return _gateway
+
+
+def _criar():
+    if settings.MERCADOPAGO_GATEWAY == "falso":
+        return GatewayFalso()
+    return GatewayMercadoPago(
+        settings.MERCADOPAGO_ACCESS_TOKEN,
+        settings.MERCADOPAGO_TIMEOUT_CONEXAO,
+        settings.MERCADOPAGO_TIMEOUT_LEITURA,
+    )
+
+
+@receiver(setting_changed)
+def _redefinir(setting, **kwargs):
+    # override_settings nos testes troca o gateway
+    global _gateway
+    if setting.startswith("MERCADOPAGO_"):
+        _gateway = None
@@ -0,0 +1,390 @@
+"""
+Operações em massa sobre HorarioDisponivel.
+
+Tudo aqui trabalha em conjunto (set-based): calcula os horários em memória
+e fala com o banco em poucas consultas, em vez de um get_or_create/save()
+por horário. Inclui também a busca/paginação da grade de horários do admin.
+"""
+import calendar
+from datetime import date, datetime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import disponibilidade
+from .models import Agendamento, ExcecaoDisponibilidade, HorarioDisponivel, RegraDisponibilidade
+
+TAMANHO_LOTE = 500
+
+# Até quantos dias à frente as regras recorrentes viram horários de verdade
+HORIZONTE_DIAS = 60
+
+
+def candidatos(profissional_ids, data_inicio, data_fim, dias_semana, inicio, fim, intervalo):
+    """
+    Gera as chaves (profissional_id, data, hora) de todos os horários do
+    período, apenas nos dias da semana informados (isoweekday, 1 = segunda).
+    O horário de fim é inclusivo, como na geração original.
+    """
+    dias_semana = {int(d) for d in dias_semana}
+    passo = timedelta(minutes=intervalo)
+    total_dias = (data_fim - data_inicio).days + 1
+
+    horas_do_dia = []
+    atual = datetime.combine(data_inicio, inicio)
+    limite = datetime.combine(data_inicio, fim)
+    while atual <= limite:
+        horas_do_dia.append(atual.time())
+        atual += passo
+
+    chaves = []
+    for offset in range(total_dias):
+        data = data_inicio + timedelta(days=offset)
+        if data.isoweekday() not in dias_semana:
+            continue
+        for prof_id in profissional_ids:
+            for hora in horas_do_dia:
+                chaves.append((prof_id, data, hora))
+    return chaves
+
+
+def gerar_horarios(profissionais, data_inicio, data_fim, dias_semana, inicio, fim, intervalo, simular=False):
+    """
+    Cria os horários que ainda não existem no período.
+
+    Retorna (novos, existentes). Com `simular=True` só conta, sem gravar.
+    A escrita usa bulk_create(ignore_conflicts=True) em lotes, apoiada no
+    unique_together (profissional, data, hora), então gerações concorrentes
+    não duplicam horários.
+    """
+    profissionais = list(profissionais)
+    chaves = candidatos([p.pk for p in profissionais], data_inicio, data_fim, dias_semana, inicio, fim, intervalo)
+    if not chaves:
+        return 0, 0
+
+    ja_existem = set(
+        HorarioDisponivel.objects
+        .filter(profissional__in=profissionais, data__range=(data_inicio, data_fim))
+        .values_list("profissional_id", "data", "hora")
+    )
+    novas = [chave for chave in chaves if chave not in ja_existem]
+    existentes = len(chaves) - len(novas)
+
+    if simular or not novas:
+        return len(novas), existentes
+
+    HorarioDisponivel.objects.bulk_create(
+        (HorarioDisponivel(profissional_id=prof_id, data=data, hora=hora, disponivel=True)
+         for prof_id, data, hora in novas),
+        batch_size=TAMANHO_LOTE,
+        ignore_conflicts=True,
+    )
+    # bulk_create não dispara post_save: invalida o calendário uma vez por profissional
+    disponibilidade.invalidar(*{prof_id for prof_id, _, _ in novas})
+    return len(novas), existentes
+
+
+def excluir_horarios(horarios, progresso=None):
+    """
+    Exclui os horários do queryset em lotes de TAMANHO_LOTE, cada lote na
+    sua própria transação curta, para não segurar o lock de escrita do
+    SQLite durante uma limpeza grande.
+
+    Em cada lote, um único UPDATE solta os agendamentos que apontam para
+    os horários (hora = NULL, preservando hora_backup) e um DELETE direto
+    remove as linhas, sem carregar objetos nem disparar sinais por linha;
+    a versão da agenda sobe no mesmo lote. As linhas do lote são lidas com
+    SELECT ... FOR UPDATE: uma reserva concorrente espera o lote terminar
+    (e não acha mais o horário), e um horário reservado antes disso sai do
+    lote se o filtro pedia só os livres. `progresso(excluidos, total)` é
+    chamado após cada lote.
+    Retorna o total excluído.
+    """
+    total = horarios.count()
+    excluidos = 0
+    while True:
+        with transaction.atomic():
+            # of=self: o filtro pode ter LEFT JOIN (ex.: agendamento__isnull em limpar_passados)
+            lote = list(
+                horarios.select_for_update(of=("self",)).order_by("pk")
+                .values_list("pk", "profissional_id")[:TAMANHO_LOTE]
+            )
+            if not lote:
+                break
+            ids = [pk for pk, _ in lote]
+
+            Agendamento.objects.filter(hora_id__in=ids).update(
+                hora=None,
+                hora_backup=Coalesce(
+                    "hora_backup",
+                    Subquery(HorarioDisponivel.objects.filter(pk=OuterRef("hora_id")).values("hora")[:1]),
+                ),
+            )
+            # Nada mais referencia estes horários; o DELETE vai direto ao banco
+            # (QuerySet.delete() carregaria as linhas por causa do SET_NULL e dos sinais)
+            _apagar(ids)
+            disponibilidade.invalidar(*{prof_id for _, prof_id in lote})
+
+        excluidos += len(lote)
+        if progresso:
+            progresso(excluidos, total)
+    return excluidos
+
+
+def _apagar(ids):
+    tabela = connection.ops.quote_name(HorarioDisponivel._meta.db_table)
+    coluna = connection.ops.quote_name(HorarioDisponivel._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {tabela} WHERE {coluna} IN ({', '.join(['%s'] * len(ids))})", ids)
+
+
+# ------------------------------------------------------------------
+# Grade de horários do admin (busca e paginação)
+# ------------------------------------------------------------------
+
+def _datas_validas(anos, meses, dias):
+    datas = []
+    for ano in anos:
+        for mes in meses:
+            for dia in dias:
+                try:
+                    datas.append(date(ano, mes, dia))
+                except ValueError:
+                    continue  # ex.: 31/02
+    return datas
+
+
+def _meses(anos, mes):
+    """Q com um intervalo data__range por ano para o mês inteiro."""
+    filtro = Q(pk__in=[])
+    if 1 <= mes <= 12:
+        for ano in anos:
+            filtro |= Q(data__range=(date(ano, mes, 1), date(ano, mes, calendar.monthrange(ano, mes)[1])))
+    return filtro
+
+
+def filtro_dia_mes(busca):
+    """
+    Converte a busca da grade ("dd/mm", "dd/", "/mm" ou só um número, que
+    vale como dia OU mês) em igualdades/intervalos de data, que usam índice,
+    em vez de extrair dia e mês de cada linha. Os anos possíveis vêm do
+    MIN/MAX de data.
+
+    Retorna um Q, ou None quando a busca não é numérica (filtro ignorado).
+    """
+    try:
+        if "/" in busca:
+            dia_str, mes_str = (parte.strip() for parte in busca.split("/")[:2])
+            dia = int(dia_str) if dia_str else None
+            mes = int(mes_str) if mes_str else None
+        else:
+            dia = mes = int(busca)
+    except ValueError:
+        return None
+    if dia is None and mes is None:
+        return None
+
+    limites = HorarioDisponivel.objects.aggregate(inicio=Min("data"), fim=Max("data"))
+    if limites["inicio"] is None:
+        return Q(pk__in=[])
+    anos = range(limites["inicio"].year, limites["fim"].year + 1)
+
+    if "/" not in busca:
+        # Número solto: o dia N de qualquer mês OU o mês N inteiro
+        return Q(data__in=_datas_validas(anos, range(1, 13), [dia])) | _meses(anos, mes)
+    if dia is None:
+        return _meses(anos, mes)
+    return Q(data__in=_datas_validas(anos, [mes] if mes else range(1, 13), [dia]))
+
+
+def _cursor_grade(data, hora, pk):
+    return f"{data.isoformat()}|{hora.strftime('%H:%M:%S')}|{pk}"
+
+
+def pagina_grade(query, cursor, tamanho):
+    """
+    Página da grade ordenada por (data, hora, id), começando depois do
+    cursor ("" = início). Não faz COUNT: busca uma linha a mais só para
+    saber se há próxima página. Retorna (linhas, proximo_cursor) com as
+    linhas como tuplas de .values_list(); cursor inválido: ValueError.
+    """
+    if cursor:
+        data_str, hora_str, pk_str = cursor.split("|")
+        data = datetime.strptime(data_str, "%Y-%m-%d").date()
+        hora = datetime.strptime(hora_str, "%H:%M:%S").time()
+        pk = int(pk_str)
+        query = query.filter(
+            Q(data__gt=data) | Q(data=data, hora__gt=hora) | Q(data=data, hora=hora, id__gt=pk)
+        )
+
+    linhas = list(
+        query.order_by("data", "hora", "id")
+        .values_list("id", "data", "hora", "disponivel", "profissional__nome", "profissional__slug")[:tamanho + 1]
+    )
+    proximo = None
+    if len(linhas) > tamanho:
+        pk, data, hora = linhas[tamanho - 1][:3]
+        proximo = _cursor_grade(data, hora, pk)
+    return linhas[:tamanho], proximo
+
+
+# ------------------------------------------------------------------
+# Regras recorrentes → horários até o horizonte
+# ------------------------------------------------------------------
+
+def _criar_pelas_regras(janelas):
+    """
+    Cria os horários de cada janela (regra, inicio, fim), pulando datas
+    passadas, exceções e o que já existe. Retorna quantos foram criados.
+    """
+    hoje = timezone.now().date()
+    janelas = [(regra, max(inicio, hoje), fim) for regra, inicio, fim in janelas if fim >= hoje]
+    janelas = [(regra, inicio, fim) for regra, inicio, fim in janelas if inicio <= fim]
+    if not janelas:
+        return 0
+
+    prof_ids = {regra.profissional_id for regra, _, _ in janelas}
+    periodo = (min(inicio for _, inicio, _ in janelas), max(fim for _, _, fim in janelas))
+
+    excecoes = {}
+    for excecao in ExcecaoDisponibilidade.objects.filter(profissional_id__in=prof_ids, data__range=periodo):
+        excecoes.setdefault((excecao.profissional_id, excecao.data), []).append(excecao)
+    ja_existem = set(
+        HorarioDisponivel.objects
+        .filter(profissional_id__in=prof_ids, data__range=periodo)
+        .values_list("profissional_id", "data", "hora")
+    )
+
+    novas = {}
+    for regra, inicio, fim in janelas:
+        chaves = candidatos([regra.profissional_id], inicio, fim, regra.dias(),
+                            regra.hora_inicio, regra.hora_fim, regra.intervalo)
+        for chave in chaves:
+            prof_id, data, hora = chave
+            if chave in ja_existem or chave in novas:
+                continue
+            if any(excecao.bloqueia(hora) for excecao in excecoes.get((prof_id, data), ())):
+                continue
+            novas[chave] = regra.pk
+
+    if not novas:
+        return 0
+
+    HorarioDisponivel.objects.bulk_create(
+        (HorarioDisponivel(profissional_id=prof_id, data=data, hora=hora, disponivel=True, regra_id=regra_id)
+         for (prof_id, data, hora), regra_id in novas.items()),
+        batch_size=TAMANHO_LOTE,
+        ignore_conflicts=True,
+    )
+    disponibilidade.invalidar(*{prof_id for prof_id, _, _ in novas})
+    return len(novas)
+
+
+def materializar(ate, profissional_ids=None):
+    """
+    Avança as regras ativas até `ate` (inclusive), criando apenas os dias
+    que ainda não foram gerados. Quando tudo já está em dia custa uma única
+    consulta sem resultado. Retorna quantos horários foram criados.
+
+    O marcador `materializada_ate` garante que um horário excluído à mão
+    não volta na próxima chamada.
+    """
+    hoje = timezone.now().date()
+    regras = RegraDisponibilidade.objects.filter(
+        Q(valida_ate__isnull=True) | Q(valida_ate__gte=hoje),
+        Q(materializada_ate__isnull=True) | Q(materializada_ate__lt=ate),
+        ativa=True,
+        valida_de__lte=ate,
+    )
+    if profissional_ids is not None:
+        regras = regras.filter(profissional_id__in=profissional_ids)
+    regras = list(regras)
+    if not regras:
+        return 0
+
+    janelas = []
+    for regra in regras:
+        inicio = regra.valida_de
+        if regra.materializada_ate:
+            inicio = max(inicio, regra.materializada_ate + timedelta(days=1))
+        fim = min(ate, regra.valida_ate) if regra.valida_ate else ate
+        janelas.append((regra, inicio, fim))
+
+    with transaction.atomic():
+        criados = _criar_pelas_regras(janelas)
+        RegraDisponibilidade.objects.filter(pk__in=[regra.pk for regra in regras]).update(materializada_ate=ate)
+    return criados
+
+
+def limpar_passados(antes):
+    """
+    Remove os horários gerados por regras que ficaram no passado sem
+    nenhum agendamento. A regra continua lá, então nada se perde.
+    """
+    return excluir_horarios(HorarioDisponivel.objects.filter(
+        regra__isnull=False, data__lt=antes, disponivel=True, agendamento__isnull=True,
+    ))
+
+
+def _apagar_livres_futuros(horarios):
+    excluir_horarios(horarios.filter(disponivel=True, data__gte=timezone.now().date()))
+
+
+@receiver(post_save, sender=RegraDisponibilidade)
+def _regra_salva(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        # Regra editada: refaz só o futuro ainda livre; o que já foi reservado fica
+        _apagar_livres_futuros(HorarioDisponivel.objects.filter(regra=instance))
+        RegraDisponibilidade.objects.filter(pk=instance.pk).update(materializada_ate=None)
+    # Gera já até o horizonte; daí em diante o comando diário avança
+    materializar(timezone.now().date() + timedelta(days=HORIZONTE_DIAS), [instance.profissional_id])
+    disponibilidade.invalidar(instance.profissional_id)
+
+
+@receiver(pre_delete, sender=RegraDisponibilidade)
+def _regra_excluida(sender, instance, **kwargs):
+    _apagar_livres_futuros(HorarioDisponivel.objects.filter(regra=instance))
+
+
+@receiver(pre_save, sender=ExcecaoDisponibilidade)
+def _excecao_antes_de_salvar(sender, instance, **kwargs):
+    instance._anterior = ExcecaoDisponibilidade.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=ExcecaoDisponibilidade)
+def _excecao_salva(sender, instance, **kwargs):
+    # Só o que as regras geraram: _restaurar_dia não saberia recriar um horário feito à mão
+    livres = HorarioDisponivel.objects.filter(
+        profissional_id=instance.profissional_id, data=instance.data, regra__isnull=False
+    )
+    if instance.hora_inicio is not None:
+        livres = livres.filter(hora__range=(instance.hora_inicio, instance.hora_fim))
+    _apagar_livres_futuros(livres)
+
+    # Exceção movida/encurtada: devolve o que a versão anterior bloqueava
+    anterior = getattr(instance, "_anterior", None)
+    if anterior is not None:
+        _restaurar_dia(anterior)
+
+
+@receiver(post_delete, sender=ExcecaoDisponibilidade)
+def _excecao_excluida(sender, instance, **kwargs):
+    _restaurar_dia(instance)
+
+
+def _restaurar_dia(excecao):
+    # Só os dias já materializados; os demais serão gerados normalmente
+    regras = RegraDisponibilidade.objects.filter(
+        Q(valida_ate__isnull=True) | Q(valida_ate__gte=excecao.data),
+        profissional_id=excecao.profissional_id,
+        ativa=True,
+        valida_de__lte=excecao.data,
+        materializada_ate__gte=excecao.data,
+    )
+    _criar_pelas_regras([(regra, excecao.data, excecao.data) for regra in regras])
@@ -0,0 +1,203 @@
+import math
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from LihStudio.models import Agendamento, EmailSaida, HorarioDisponivel, Profissional, Servico
+
+BENCH_SLUG = "benchmark-concorrencia"
+BENCH_EMAIL = "cliente@benchmark.invalid"
+
+# Mensagens que indicam espera/conflito de lock no SQLite e no Postgres
+ERROS_DE_LOCK = ("database is locked", "database table is locked", "could not serialize",
+                 "deadlock detected", "lock timeout", "canceling statement due to lock")
+
+_erros = threading.local()
+
+
+def _registrar_erro(sender, request=None, **kwargs):
+    # Chamado na própria thread da requisição, ainda dentro do except
+    _erros.ultimo = sys.exc_info()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispara N POSTs simultâneos de agendamento (mesmo horário e horários diferentes) "
+        "contra o banco configurado e mede vazão, latência p50/p99, erros de lock e "
+        "agendamentos duplicados. Para Postgres local, rode com DATABASE_URL=postgres://... "
+        "e DATABASE_SSL_REQUIRE=False. Cria e apaga dados: só roda com DEBUG=True ou --confirmar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requisicoes", type=int, default=50, help="POSTs por cenário.")
+        parser.add_argument("--concorrencia", type=int, default=10, help="Threads simultâneas.")
+        parser.add_argument("--cenario", choices=["mesmo", "diferentes", "ambos"], default="ambos")
+        parser.add_argument("--manter", action="store_true", help="Não apaga os dados criados pelo benchmark.")
+        parser.add_argument("--confirmar", action="store_true",
+                            help="Roda mesmo com DEBUG=False (o banco configurado deve ser descartável).")
+
+    def handle(self, *args, **options):
+        if options["requisicoes"] < 1 or options["concorrencia"] < 1:
+            raise CommandError("--requisicoes e --concorrencia devem ser positivos.")
+
+        banco = connection.settings_dict
+        if not settings.DEBUG and not options["confirmar"]:
+            raise CommandError(
+                f"O benchmark cria e apaga agendamentos em {connection.vendor} ({banco.get('NAME')}). "
+                "Aponte para um banco descartável e rode com DJANGO_DEBUG=True, ou passe --confirmar."
+            )
+        self.stdout.write(f"🏁 Banco: {connection.vendor} ({banco.get('NAME')})")
+
+        cenarios = ["mesmo", "diferentes"] if options["cenario"] == "ambos" else [options["cenario"]]
+        profissional, servico = self.preparar()
+        try:
+            for cenario in cenarios:
+                resultado = self.executar(cenario, profissional, servico, options["requisicoes"], options["concorrencia"])
+                self.relatar(cenario, resultado)
+        finally:
+            if not options["manter"]:
+                self.limpar()
+
+    # ------------------------------------------------------------------
+
+    def preparar(self):
+        self.limpar()
+        # E-mails enfileirados a partir daqui são candidatos à limpeza (ver limpar)
+        self.primeiro_email = EmailSaida.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        profissional = Profissional.objects.create(nome="Benchmark", slug=BENCH_SLUG)
+        self.servico_criado = None
+        servico, criado = Servico.objects.get_or_create(
+            nome="Benchmark (concorrência)",
+            defaults={"preco": Decimal("1.00"), "ativo": True},
+        )
+        if criado:
+            self.servico_criado = servico.pk
+        return profissional, servico
+
+    def limpar(self):
+        """Apaga só o que o benchmark criou: a profissional dele, os agendamentos dela e os e-mails desta rodada."""
+        Agendamento.objects.filter(profissional__slug=BENCH_SLUG).delete()
+        HorarioDisponivel.objects.filter(profissional__slug=BENCH_SLUG).delete()
+        Profissional.objects.filter(slug=BENCH_SLUG).delete()
+        if getattr(self, "servico_criado", None):
+            Servico.objects.filter(pk=self.servico_criado).delete()
+        if hasattr(self, "primeiro_email"):
+            EmailSaida.objects.filter(
+                id__gt=self.primeiro_email, status="pendente", destinatarios__icontains=BENCH_EMAIL
+            ).delete()
+
+    def criar_horarios(self, profissional, quantidade):
+        # Começa amanhã às 08:00 e avança de minuto em minuto (sem colisão com o unique)
+        inicio = datetime.combine(timezone.now().date() + timedelta(days=1), datetime.min.time()) + timedelta(hours=8)
+        HorarioDisponivel.objects.filter(profissional=profissional).delete()
+        return [
+            HorarioDisponivel.objects.create(
+                profissional=profissional,
+                data=(inicio + timedelta(minutes=i)).date(),
+                hora=(inicio + timedelta(minutes=i)).time(),
+            )
+            for i in range(quantidade)
+        ]
+
+    def executar(self, cenario, profissional, servico, total, concorrencia):
+        horarios = self.criar_horarios(profissional, 1 if cenario == "mesmo" else total)
+        alvos = [horarios[0] if cenario == "mesmo" else horarios[i] for i in range(total)]
+
+        host = next((h for h in settings.ALLOWED_HOSTS if h and h != "*" and not h.startswith(".")), "localhost")
+        url = reverse("agendar_servico")
+        url_sucesso = reverse("sucesso")
+        largada = threading.Barrier(min(concorrencia, total))
+
+        def agendar(i):
+            horario = alvos[i]
+            # O Client não é thread-safe para exceções (usa um receiver global);
+            # por isso o erro de cada requisição vem do sinal, por thread.
+            client = Client(HTTP_HOST=host, raise_request_exception=False)
+            dados = {
+                "nome": f"Bench {i}", "telefone": "11900000000", "email": BENCH_EMAIL,
+                "servico": servico.id, "data": horario.data.isoformat(),
+                "hora": horario.id, "profissional": profissional.id,
+            }
+            if i < largada.parties:
+                try:
+                    largada.wait(timeout=10)
+                except threading.BrokenBarrierError:
+                    pass
+
+            inicio = time.perf_counter()
+            _erros.ultimo = None
+            try:
+                response = client.post(url, dados)
+            finally:
+                connections.close_all()  # cada thread tem a própria conexão
+            duracao = time.perf_counter() - inicio
+
+            erro = _erros.ultimo
+            if erro is not None:
+                if isinstance(erro, OperationalError) and any(m in str(erro).lower() for m in ERROS_DE_LOCK):
+                    return "lock", duracao
+                return "erro", duracao
+            if response.status_code == 302 and response["Location"] == url_sucesso:
+                return "sucesso", duracao
+            return "recusado", duracao
+
+        got_request_exception.connect(_registrar_erro)
+        try:
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+                respostas = list(executor.map(agendar, range(total)))
+            duracao = time.perf_counter() - inicio
+        finally:
+            got_request_exception.disconnect(_registrar_erro)
+
+        duplicados = sum(
+            linha["n"] - 1
+            for linha in Agendamento.objects.filter(hora__in=horarios)
+            .exclude(status="cancelado")
+            .values("hora").annotate(n=Count("id")).filter(n__gt=1)
+        )
+        latencias = sorted(lat for _, lat in respostas)
+        contagem = {chave: sum(1 for r, _ in respostas if r == chave) for chave in ("sucesso", "recusado", "lock", "erro")}
+
+        return {
+            "total": total,
+            "duracao": duracao,
+            "vazao": total / duracao if duracao else 0.0,
+            "p50": self.percentil(latencias, 50),
+            "p99": self.percentil(latencias, 99),
+            "duplicados": duplicados,
+            **contagem,
+        }
+
+    @staticmethod
+    def percentil(valores, p):
+        if not valores:
+            return 0.0
+        # Nearest-rank
+        indice = max(0, math.ceil(p / 100 * len(valores)) - 1)
+        return valores[indice]
+
+    def relatar(self, cenario, r):
+        titulo = "mesmo horário" if cenario == "mesmo" else "horários diferentes"
+        self.stdout.write(f"\n📊 Cenário: {titulo} ({r['total']} POSTs)")
+        self.stdout.write(f"   Vazão:        {r['vazao']:.1f} req/s em {r['duracao']:.2f}s")
+        self.stdout.write(f"   Latência:     p50 {r['p50'] * 1000:.1f} ms | p99 {r['p99'] * 1000:.1f} ms")
+        self.stdout.write(f"   Sucesso:      {r['sucesso']}")
+        self.stdout.write(f"   Recusados:    {r['recusado']} (horário já ocupado)")
+        self.stdout.write(f"   Erros lock:   {r['lock']}")
+        self.stdout.write(f"   Outros erros: {r['erro']}")
+
+        estilo = self.style.ERROR if r["duplicados"] else self.style.SUCCESS
+        self.stdout.write(estilo(f"   Duplicados:   {r['duplicados']}"))
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from LihStudio import relatorios
+
+MOTORES = ("reportlab", "html")
+
+
+def _clientes_ficticios(quantidade):
+    inicio = date(2024, 1, 1)
+    status = ("pendente", "confirmado", "cancelado", "concluido")
+    for i in range(quantidade):
+        yield {
+            "nome": f"Cliente Benchmark {i:06d}",
+            "telefone": f"(83) 9{i % 10000:04d}-{i % 9999:04d}",
+            "profissional": f"Profissional {i % 7}",
+            "ultima_visita": inicio + timedelta(days=i % 700),
+            "ultimo_servico": f"Serviço {i % 12}",
+            "status": status[i % 4],
+            "total_visitas": i % 25,
+        }
+
+
+def _medir(motor, linhas, conexao):
+    """Roda no processo filho: o pico de memória medido é só desta renderização."""
+    inicial_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    contexto = {"clientes": _clientes_ficticios(linhas), "filtros_aplicados": "Benchmark"}
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as arquivo:
+        inicio = time.perf_counter()
+        relatorios.desenhar(arquivo, "clientes", "LihStudio/clientes_pdf.html", contexto, motor_pdf=motor)
+        duracao = time.perf_counter() - inicio
+        tamanho = arquivo.tell()
+    pico_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    conexao.send((duracao, inicial_kb, pico_kb, tamanho))
+    conexao.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara o tempo de renderização e o pico de memória (RSS) do relatório de clientes "
+        "nos dois motores de PDF (reportlab e html/xhtml2pdf), com linhas fictícias. Cada "
+        "medição roda num processo separado. O motor html com 50 mil linhas pode levar minutos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--linhas", type=int, nargs="+", default=[1000, 10000, 50000],
+                            help="Quantidades de linhas a medir.")
+        parser.add_argument("--motor", choices=MOTORES, action="append",
+                            help="Motor a medir (pode repetir). Padrão: os dois.")
+
+    def handle(self, *args, **options):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Este benchmark precisa de fork (Linux/macOS).")
+        if any(n < 1 for n in options["linhas"]):
+            raise CommandError("--linhas deve ser positivo.")
+
+        contexto_mp = multiprocessing.get_context("fork")
+        motores = options["motor"] or list(MOTORES)
+        # O filho não pode herdar conexões abertas com o banco
+        connections.close_all()
+
+        self.stdout.write(f"{'motor':<10} {'linhas':>8} {'tempo':>10} {'pico RSS':>12} {'+RSS':>10} {'PDF':>10}")
+        for linhas in options["linhas"]:
+            for motor in motores:
+                receber, enviar = contexto_mp.Pipe(duplex=False)
+                processo = contexto_mp.Process(target=_medir, args=(motor, linhas, enviar))
+                processo.start()
+                enviar.close()
+                try:
+                    duracao, inicial_kb, pico_kb, tamanho = receber.recv()
+                except EOFError:
+                    processo.join()
+                    self.stderr.write(f"{motor:<10} {linhas:>8} falhou (código {processo.exitcode})")
+                    continue
+                processo.join()
+                # ru_maxrss vem em KB no Linux e em bytes no macOS
+                fator = 1 if os.uname().sysname == "Darwin" else 1024
+                self.stdout.write(
+                    f"{motor:<10} {linhas:>8} {duracao:>9.2f}s {pico_kb * fator / 2**20:>10.1f}MB "
+                    f"{(pico_kb - inicial_kb) * fator / 2**20:>8.1f}MB {tamanho / 2**10:>8.0f}KB"
+                )
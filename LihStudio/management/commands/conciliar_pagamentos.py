@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+
+from LihStudio import gateway, pagamentos
+from LihStudio.models import Agendamento
+
+
+class Command(BaseCommand):
+    help = (
+        "Confere no Mercado Pago os agendamentos com pagamento pendente ou em processamento "
+        "(webhook perdido) e aplica o status, com uma única busca por rodada. "
+        "Pode rodar a cada poucos minutos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--minutos", type=int, default=15,
+                            help="Só confere agendamentos criados há mais que isso (o webhook costuma chegar antes).")
+        parser.add_argument("--dias", type=int, default=7, help="Ignora agendamentos criados há mais que isso.")
+
+    def handle(self, *args, **options):
+        agora = timezone.now()
+        # A busca da API pagina por todos os pagamentos da conta na janela de
+        # datas, então é feita uma vez para todos os agendamentos parados
+        parados = list(
+            Agendamento.objects
+            .filter(status="pendente", pagamento_status__in=["pendente", "processando"],
+                    criado_em__range=(agora - timedelta(days=options["dias"]),
+                                      agora - timedelta(minutes=options["minutos"])))
+            # Só quem chegou a abrir o checkout
+            .filter(Q(preferencia_id__gt="") | Q(pagamento_status="processando"))
+            .only("id", "criado_em")
+            .order_by("id")
+        )
+
+        try:
+            resultados = pagamentos.conciliar(parados)
+        except (gateway.GatewayIndisponivel, pagamentos.ErroGateway) as e:
+            raise CommandError(f"Conciliação interrompida: {e}")
+
+        for resultado in resultados.values():
+            self.stdout.write(resultado)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(parados)} agendamento(s) conferido(s), {len(resultados)} com pagamento encontrado."
+        ))
@@ -0,0 +1,103 @@
+import time
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from LihStudio.emails import montar_mensagem
+from LihStudio.models import EmailSaida
+
+MAX_TENTATIVAS = 6
+BACKOFF_BASE = 60            # segundos; dobra a cada falha
+BACKOFF_MAX = 60 * 60        # no máximo 1 hora entre tentativas
+RESERVA = timedelta(minutes=5)  # tempo que um worker "segura" o e-mail enquanto envia
+
+
+class Command(BaseCommand):
+    help = "Entrega os e-mails da caixa de saída usando uma única conexão SMTP, com novas tentativas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Fica rodando e verificando a fila periodicamente.")
+        parser.add_argument("--intervalo", type=float, default=5, help="Segundos entre verificações no modo --loop.")
+        parser.add_argument("--lote", type=int, default=50, help="Máximo de e-mails por rodada.")
+
+    def handle(self, *args, **options):
+        lote = options["lote"]
+
+        if not options["loop"]:
+            enviados = self.enviar_lote(lote)
+            self.stdout.write(f"{enviados} e-mail(s) processado(s).")
+            return
+
+        self.stdout.write("📬 Worker de e-mails iniciado (Ctrl+C para parar).")
+        try:
+            while True:
+                # Se a rodada não encheu o lote, a fila está vazia: espera um pouco
+                if self.enviar_lote(lote) < lote:
+                    time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de e-mails encerrado.")
+
+    def enviar_lote(self, tamanho):
+        agora = timezone.now()
+        ids = list(
+            EmailSaida.objects
+            .filter(status="pendente", proxima_tentativa__lte=agora)
+            .values_list("id", flat=True)[:tamanho]
+        )
+        if not ids:
+            return 0
+
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            self.stderr.write(f"Servidor de e-mail indisponível: {e}")
+            return 0
+
+        processados = 0
+        try:
+            for pk in ids:
+                # Reserva atômica: se outro worker já pegou este e-mail, pula
+                reservado = EmailSaida.objects.filter(
+                    pk=pk, status="pendente", proxima_tentativa__lte=agora
+                ).update(proxima_tentativa=timezone.now() + RESERVA, tentativas=F("tentativas") + 1)
+                if not reservado:
+                    continue
+
+                email = EmailSaida.objects.get(pk=pk)
+                processados += 1
+                try:
+                    montar_mensagem(email, connection=connection).send()
+                except Exception as e:
+                    self.registrar_falha(email, e)
+                    # A conexão pode ter caído no meio do envio: reabre uma vez
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception:
+                        break
+                else:
+                    EmailSaida.objects.filter(pk=pk).update(
+                        status="enviado", enviado_em=timezone.now(), ultimo_erro=""
+                    )
+                    self.stdout.write(f"E-mail enviado para {', '.join(email.destinatarios)}")
+        finally:
+            connection.close()
+
+        return processados
+
+    def registrar_falha(self, email, erro):
+        if email.tentativas >= MAX_TENTATIVAS:
+            EmailSaida.objects.filter(pk=email.pk).update(status="falhou", ultimo_erro=str(erro))
+            self.stderr.write(f"❌ Desistindo do e-mail {email.pk} após {email.tentativas} tentativas: {erro}")
+            return
+
+        espera = min(BACKOFF_BASE * 2 ** (email.tentativas - 1), BACKOFF_MAX)
+        EmailSaida.objects.filter(pk=email.pk).update(
+            proxima_tentativa=timezone.now() + timedelta(seconds=espera),
+            ultimo_erro=str(erro),
+        )
+        self.stderr.write(f"⚠️ Falha ao enviar e-mail {email.pk} (tentativa {email.tentativas}), nova tentativa em {espera}s: {erro}")
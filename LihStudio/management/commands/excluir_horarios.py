@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from LihStudio import horarios
+from LihStudio.models import HorarioDisponivel
+
+
+class Command(BaseCommand):
+    help = (
+        "Exclui horários em lotes curtos (mesmo motor das telas de exclusão), "
+        "mostrando o progresso. Útil para limpezas grandes fora do horário de atendimento."
+    )
+
+    def add_arguments(self, parser):
+        grupo = parser.add_mutually_exclusive_group(required=True)
+        grupo.add_argument("--todos", action="store_true", help="Exclui todos os horários.")
+        grupo.add_argument("--passados", action="store_true", help="Exclui os horários anteriores a hoje.")
+        grupo.add_argument("--periodo", nargs=2, metavar=("INICIO", "FIM"), help="Datas AAAA-MM-DD, inclusivas.")
+
+    def handle(self, *args, **options):
+        if options["todos"]:
+            alvo = HorarioDisponivel.objects.all()
+        elif options["passados"]:
+            alvo = HorarioDisponivel.objects.filter(data__lt=timezone.now().date())
+        else:
+            try:
+                inicio, fim = (datetime.strptime(d, "%Y-%m-%d").date() for d in options["periodo"])
+            except ValueError:
+                raise CommandError("Datas inválidas, use AAAA-MM-DD.")
+            if inicio > fim:
+                raise CommandError("A data de início não pode ser maior que a data de fim.")
+            alvo = HorarioDisponivel.objects.filter(data__gte=inicio, data__lte=fim)
+
+        def progresso(excluidos, total):
+            self.stdout.write(f"   {excluidos}/{total} horários excluídos")
+
+        count = horarios.excluir_horarios(alvo, progresso=progresso)
+        self.stdout.write(self.style.SUCCESS(f"{count} horário(s) excluído(s)."))
@@ -0,0 +1,94 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from LihStudio import relatorios
+from LihStudio.models import ExportacaoRelatorio
+
+MAX_TENTATIVAS = 3
+RESERVA = timedelta(minutes=10)  # tempo que um worker "segura" o pedido enquanto renderiza
+OBSOLETO_APOS = timedelta(minutes=15)  # PDFs de dados antigos ainda podem estar sendo baixados
+
+
+class Command(BaseCommand):
+    help = "Renderiza os relatórios em PDF pedidos pelas telas e apaga os arquivos antigos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Fica rodando e verificando a fila periodicamente.")
+        parser.add_argument("--intervalo", type=float, default=2, help="Segundos entre verificações no modo --loop.")
+        parser.add_argument("--lote", type=int, default=5, help="Máximo de relatórios por rodada.")
+        parser.add_argument("--manter-horas", type=int, default=24, help="Apaga pedidos (e PDFs) mais antigos que isso.")
+
+    def handle(self, *args, **options):
+        lote = options["lote"]
+        self.manter = timedelta(hours=options["manter_horas"])
+
+        if not options["loop"]:
+            gerados = self.processar_lote(lote)
+            self.limpar()
+            self.stdout.write(f"{gerados} relatório(s) processado(s).")
+            return
+
+        self.stdout.write("🖨️ Worker de relatórios iniciado (Ctrl+C para parar).")
+        try:
+            while True:
+                # Se a rodada não encheu o lote, a fila está vazia: limpa e espera um pouco
+                if self.processar_lote(lote) < lote:
+                    self.limpar()
+                    time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de relatórios encerrado.")
+
+    def na_fila(self, agora):
+        # Pendentes, ou reservados por um worker que morreu no meio
+        return Q(status="pendente") | Q(status="processando", reservado_ate__lt=agora)
+
+    def processar_lote(self, tamanho):
+        agora = timezone.now()
+        ids = list(
+            ExportacaoRelatorio.objects.filter(self.na_fila(agora))
+            .order_by("id").values_list("id", flat=True)[:tamanho]
+        )
+
+        processados = 0
+        for pk in ids:
+            # Reserva atômica: se outro worker já pegou este pedido, pula
+            reservado = ExportacaoRelatorio.objects.filter(self.na_fila(agora), pk=pk).update(
+                status="processando", reservado_ate=timezone.now() + RESERVA, tentativas=F("tentativas") + 1
+            )
+            if not reservado:
+                continue
+
+            exportacao = ExportacaoRelatorio.objects.get(pk=pk)
+            processados += 1
+            inicio = time.monotonic()
+            try:
+                relatorios.renderizar(exportacao)
+            except Exception as e:
+                status = "falhou" if exportacao.tentativas >= MAX_TENTATIVAS else "pendente"
+                ExportacaoRelatorio.objects.filter(pk=pk).update(status=status, reservado_ate=None, erro=str(e))
+                self.stderr.write(f"⚠️ Falha no relatório {pk} (tentativa {exportacao.tentativas}): {e}")
+            else:
+                ExportacaoRelatorio.objects.filter(pk=pk).update(
+                    status="pronto", reservado_ate=None, erro="", concluido_em=timezone.now()
+                )
+                self.stdout.write(f"Relatório {exportacao.nome_download} gerado em {time.monotonic() - inicio:.1f}s")
+
+        return processados
+
+    def limpar(self):
+        agora = timezone.now()
+        antigos = ExportacaoRelatorio.objects.exclude(status="processando").filter(
+            Q(criado_em__lt=agora - self.manter)
+            | Q(versao_dados__lt=relatorios.versao_dados(), concluido_em__lt=agora - OBSOLETO_APOS)
+        )
+        for exportacao in antigos:
+            try:
+                os.remove(relatorios.caminho(exportacao))
+            except FileNotFoundError:
+                pass
+            exportacao.delete()
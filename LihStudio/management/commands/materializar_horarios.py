@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from LihStudio import horarios
+
+
+class Command(BaseCommand):
+    help = (
+        "Horizonte móvel das regras recorrentes: cria os horários até N dias à frente "
+        "e remove os horários gerados por regras que passaram sem agendamento. "
+        "Pensado para rodar uma vez por dia (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=horarios.HORIZONTE_DIAS,
+                            help="Quantos dias à frente materializar.")
+        parser.add_argument("--manter-passados", action="store_true",
+                            help="Não remove os horários livres que já passaram.")
+
+    def handle(self, *args, **options):
+        if options["dias"] < 0:
+            raise CommandError("--dias não pode ser negativo.")
+
+        hoje = timezone.now().date()
+        criados = horarios.materializar(hoje + timedelta(days=options["dias"]))
+        self.stdout.write(f"{criados} horário(s) criado(s) até {hoje + timedelta(days=options['dias']):%d/%m/%Y}.")
+
+        if not options["manter_passados"]:
+            excluidos = horarios.limpar_passados(hoje)
+            self.stdout.write(f"{excluidos} horário(s) passado(s) sem agendamento removido(s).")
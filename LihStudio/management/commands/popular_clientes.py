@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from LihStudio.busca import normalizar_nome
+from LihStudio.clientes import normalizar_telefone
+from LihStudio.models import Agendamento, Cliente
+
+TAMANHO_LOTE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria/atualiza a tabela Cliente a partir de todos os agendamentos e liga cada "
+        "agendamento ao seu cliente. A migração 0009 já preenche o cadastro e depois disso "
+        "ele é mantido automaticamente; use para reconstruir. Pode ser repetido sem duplicar nada."
+    )
+
+    def handle(self, *args, **options):
+        # Uma passada pelos agendamentos, do mais antigo ao mais recente:
+        # o último visto de cada cliente é o "último agendamento".
+        resumo = {}
+        ligacoes = {}
+        linhas = (
+            Agendamento.objects.order_by("data", F("hora_backup").asc(nulls_first=True), "id")
+            .values_list("id", "cliente_id", "nome", "telefone", "email", "data", "status",
+                         "profissional_id", "servico_nome_snapshot", "servico__nome")
+            .iterator(chunk_size=2000)
+        )
+        for ag_id, cliente_atual, nome, telefone, email, data, status, prof_id, snapshot, servico_nome in linhas:
+            chave = (nome.strip(), normalizar_telefone(telefone))
+            dados = resumo.setdefault(chave, {"visitas_concluidas": 0})
+            dados.update(
+                telefone=telefone, email=email, ultima_visita=data, ultimo_profissional_id=prof_id,
+                ultimo_servico=snapshot or servico_nome or "",
+            )
+            if status == "concluido":
+                dados["visitas_concluidas"] += 1
+            ligacoes.setdefault(chave, []).append((ag_id, cliente_atual))
+
+        with transaction.atomic():
+            existentes = {(c.nome, c.telefone_normalizado): c for c in Cliente.objects.all()}
+            novos = [
+                Cliente(nome=nome, nome_busca=normalizar_nome(nome), telefone_normalizado=tel, **dados)
+                for (nome, tel), dados in resumo.items() if (nome, tel) not in existentes
+            ]
+            Cliente.objects.bulk_create(novos, batch_size=TAMANHO_LOTE)
+
+            atualizar = []
+            for chave, cliente in existentes.items():
+                if chave in resumo:
+                    for campo, valor in resumo[chave].items():
+                        setattr(cliente, campo, valor)
+                    atualizar.append(cliente)
+            Cliente.objects.bulk_update(
+                atualizar,
+                ["telefone", "email", "ultima_visita", "ultimo_profissional", "ultimo_servico", "visitas_concluidas"],
+                batch_size=TAMANHO_LOTE,
+            )
+
+            # Liga só os agendamentos que ainda não apontam para o cliente certo
+            ids_clientes = {
+                (nome, tel): pk
+                for nome, tel, pk in Cliente.objects.values_list("nome", "telefone_normalizado", "id")
+            }
+            religar = [
+                Agendamento(id=ag_id, cliente_id=ids_clientes[chave])
+                for chave, ags in ligacoes.items()
+                for ag_id, cliente_atual in ags
+                if cliente_atual != ids_clientes[chave]
+            ]
+            Agendamento.objects.bulk_update(religar, ["cliente"], batch_size=TAMANHO_LOTE)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(novos)} cliente(s) criado(s), {len(atualizar)} atualizado(s), "
+            f"{len(religar)} agendamento(s) ligado(s)."
+        ))
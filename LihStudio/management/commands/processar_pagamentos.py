@@ -0,0 +1,83 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.utils import timezone
+
+from LihStudio import gateway, pagamentos
+from LihStudio.models import NotificacaoPagamento
+
+MAX_TENTATIVAS = 8
+BACKOFF_BASE = 30            # segundos; dobra a cada falha
+BACKOFF_MAX = 60 * 60        # no máximo 1 hora entre tentativas
+RESERVA = timedelta(minutes=2)  # tempo que um worker "segura" a notificação enquanto processa
+
+
+class Command(BaseCommand):
+    help = "Processa as notificações do Mercado Pago: consulta cada pagamento e atualiza o agendamento uma única vez."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Fica rodando e verificando a fila periodicamente.")
+        parser.add_argument("--intervalo", type=float, default=2, help="Segundos entre verificações no modo --loop.")
+        parser.add_argument("--lote", type=int, default=50, help="Máximo de notificações por rodada.")
+
+    def handle(self, *args, **options):
+        lote = options["lote"]
+
+        if not options["loop"]:
+            processadas = self.processar_lote(lote)
+            self.stdout.write(f"{processadas} notificação(ões) processada(s).")
+            return
+
+        self.stdout.write("💳 Worker de pagamentos iniciado (Ctrl+C para parar).")
+        try:
+            while True:
+                if self.processar_lote(lote) < lote:
+                    time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker de pagamentos encerrado.")
+
+    def processar_lote(self, tamanho):
+        agora = timezone.now()
+        ids = list(
+            NotificacaoPagamento.objects
+            .filter(status="pendente", proxima_tentativa__lte=agora)
+            .values_list("id", flat=True)[:tamanho]
+        )
+
+        processadas = 0
+        for pk in ids:
+            # Reserva atômica: se outro worker já pegou esta notificação, pula
+            reservada = NotificacaoPagamento.objects.filter(
+                pk=pk, status="pendente", proxima_tentativa__lte=agora
+            ).update(proxima_tentativa=timezone.now() + RESERVA, tentativas=F("tentativas") + 1)
+            if not reservada:
+                continue
+
+            notificacao = NotificacaoPagamento.objects.get(pk=pk)
+            processadas += 1
+            try:
+                resultado = pagamentos.processar(notificacao)
+            except gateway.GatewayIndisponivel as e:
+                # Disjuntor aberto: o resto do lote falharia igual, espera a próxima rodada
+                self.registrar_falha(notificacao, e)
+                break
+            except Exception as e:
+                self.registrar_falha(notificacao, e)
+            else:
+                self.stdout.write(f"Pagamento {notificacao.recurso_id}: {resultado}")
+        return processadas
+
+    def registrar_falha(self, notificacao, erro):
+        if notificacao.tentativas >= MAX_TENTATIVAS:
+            NotificacaoPagamento.objects.filter(pk=notificacao.pk).update(status="falhou", ultimo_erro=str(erro))
+            self.stderr.write(f"❌ Desistindo da notificação {notificacao.pk} após {notificacao.tentativas} tentativas: {erro}")
+            return
+
+        espera = min(BACKOFF_BASE * 2 ** (notificacao.tentativas - 1), BACKOFF_MAX)
+        NotificacaoPagamento.objects.filter(pk=notificacao.pk).update(
+            proxima_tentativa=timezone.now() + timedelta(seconds=espera),
+            ultimo_erro=str(erro),
+        )
+        self.stderr.write(f"⚠️ Falha ao processar a notificação {notificacao.pk} (tentativa {notificacao.tentativas}), nova tentativa em {espera}s: {erro}")
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from LihStudio import faturamento
+from LihStudio.models import FaturamentoMensal
+
+TAMANHO_LOTE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula do zero o faturamento consolidado por profissional e mês a partir dos "
+        "agendamentos. A migração 0012 já preenche o consolidado e depois disso ele é mantido "
+        "automaticamente; use para reconstruir. Pode ser repetido sem duplicar nada."
+    )
+
+    def handle(self, *args, **options):
+        meses = (
+            faturamento.faturados()
+            .annotate(ano=ExtractYear("data"), mes=ExtractMonth("data"))
+            .values("profissional_id", "profissional__comissao_percentual", "ano", "mes")
+            .annotate(bruto=Sum("valor_total"), servicos=Count("id"))
+            .order_by()
+        )
+        with transaction.atomic():
+            consolidado = [
+                FaturamentoMensal(
+                    profissional_id=m["profissional_id"], ano=m["ano"], mes=m["mes"],
+                    faturamento_bruto=m["bruto"], total_servicos=m["servicos"],
+                    comissao=faturamento.comissao(m["bruto"], m["profissional__comissao_percentual"]),
+                )
+                for m in meses.iterator()
+            ]
+            FaturamentoMensal.objects.all().delete()
+            FaturamentoMensal.objects.bulk_create(consolidado, batch_size=TAMANHO_LOTE)
+            faturamento.invalidar()
+
+        self.stdout.write(self.style.SUCCESS(f"{len(consolidado)} mês(es) de faturamento consolidado(s)."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profissional',
+            name='versao_disponibilidade',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0002_profissional_versao_disponibilidade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profissional',
+            name='disponibilidade_atualizada_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0003_profissional_disponibilidade_atualizada_em'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['data', 'status'], name='agend_data_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['status', 'pagamento_status'], name='agend_status_pgto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['nome', 'telefone'], name='agend_nome_telefone_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['status', 'contabilizar', 'data'], name='agend_status_contab_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('contabilizar', True), ('status', 'concluido'), ('valor_total__isnull', False)), fields=['data', 'profissional'], name='agend_faturamento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='horariodisponivel',
+            index=models.Index(fields=['profissional', 'disponivel', 'data'], name='horario_prof_disp_data_idx'),
+        ),
+    ]
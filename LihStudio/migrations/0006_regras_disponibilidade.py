@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0005_email_saida'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExcecaoDisponibilidade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('hora_inicio', models.TimeField(blank=True, help_text='Vazio = dia inteiro', null=True, verbose_name='Início')),
+                ('hora_fim', models.TimeField(blank=True, help_text='Vazio = dia inteiro', null=True, verbose_name='Fim')),
+                ('motivo', models.CharField(blank=True, max_length=100)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excecoes', to='LihStudio.profissional')),
+            ],
+            options={
+                'verbose_name': 'Exceção de disponibilidade',
+                'verbose_name_plural': 'Exceções de disponibilidade',
+                'ordering': ['data', 'hora_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RegraDisponibilidade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias_semana', models.CharField(help_text='Números separados por vírgula (1 = segunda … 7 = domingo) – ex.: 1,3,5', max_length=13, verbose_name='Dias da semana')),
+                ('hora_inicio', models.TimeField(verbose_name='Início')),
+                ('hora_fim', models.TimeField(help_text='Último horário do dia (inclusivo)', verbose_name='Fim')),
+                ('intervalo', models.PositiveSmallIntegerField(default=30, verbose_name='Intervalo (minutos)')),
+                ('valida_de', models.DateField(verbose_name='Válida a partir de')),
+                ('valida_ate', models.DateField(blank=True, help_text='Vazio = sem data de término', null=True, verbose_name='Válida até')),
+                ('ativa', models.BooleanField(default=True)),
+                ('materializada_ate', models.DateField(blank=True, editable=False, null=True)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regras', to='LihStudio.profissional')),
+            ],
+            options={
+                'verbose_name': 'Regra de disponibilidade',
+                'verbose_name_plural': 'Regras de disponibilidade',
+                'ordering': ['profissional', 'valida_de'],
+            },
+        ),
+        migrations.AddField(
+            model_name='horariodisponivel',
+            name='regra',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='horarios', to='LihStudio.regradisponibilidade'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0006_regras_disponibilidade'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='agendamento',
+            name='agend_nome_telefone_idx',
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['nome', 'telefone', 'status', 'pagamento_status', 'data'], name='agend_cliente_painel_idx'),
+        ),
+    ]
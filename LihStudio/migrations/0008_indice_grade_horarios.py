@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0007_indice_contadores_painel'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='horariodisponivel',
+            index=models.Index(fields=['data', 'hora'], name='horario_data_hora_idx'),
+        ),
+    ]
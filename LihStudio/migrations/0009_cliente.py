@@ -0,0 +1,97 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:54
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def _normalizar_telefone(telefone):
+    # Cópia de clientes.normalizar_telefone: a migração não depende do código atual
+    digitos = re.sub(r"\D", "", telefone or "")
+    if digitos.startswith("55") and len(digitos) >= 12:
+        digitos = digitos[2:]
+    return digitos.lstrip("0")
+
+
+def popular_clientes(apps, schema_editor):
+    """
+    Preenche o cadastro a partir dos agendamentos existentes (mesma conta do
+    comando popular_clientes), para a lista e o relatório de clientes não
+    ficarem vazios depois do deploy. O nome_busca vem na 0010.
+    """
+    Agendamento = apps.get_model("LihStudio", "Agendamento")
+    Cliente = apps.get_model("LihStudio", "Cliente")
+
+    resumo = {}
+    ligacoes = {}
+    linhas = (
+        Agendamento.objects.order_by("data", F("hora_backup").asc(nulls_first=True), "id")
+        .values_list("id", "nome", "telefone", "email", "data", "status", "profissional_id",
+                     "servico_nome_snapshot", "servico__nome")
+        .iterator(chunk_size=2000)
+    )
+    for ag_id, nome, telefone, email, data, status, prof_id, snapshot, servico_nome in linhas:
+        chave = (nome.strip(), _normalizar_telefone(telefone))
+        dados = resumo.setdefault(chave, {"visitas_concluidas": 0})
+        dados.update(
+            telefone=telefone, email=email, ultima_visita=data, ultimo_profissional_id=prof_id,
+            ultimo_servico=snapshot or servico_nome or "",
+        )
+        if status == "concluido":
+            dados["visitas_concluidas"] += 1
+        ligacoes.setdefault(chave, []).append(ag_id)
+
+    Cliente.objects.bulk_create(
+        [Cliente(nome=nome, telefone_normalizado=tel, **dados) for (nome, tel), dados in resumo.items()],
+        batch_size=500,
+    )
+    ids_clientes = {
+        (nome, tel): pk for nome, tel, pk in Cliente.objects.values_list("nome", "telefone_normalizado", "id")
+    }
+    Agendamento.objects.bulk_update(
+        [Agendamento(id=ag_id, cliente_id=ids_clientes[chave]) for chave, ags in ligacoes.items() for ag_id in ags],
+        ["cliente"], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0008_indice_grade_horarios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cliente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('telefone', models.CharField(help_text='Como digitado no último agendamento', max_length=20)),
+                ('telefone_normalizado', models.CharField(db_index=True, help_text='Só dígitos, sem o 55', max_length=20)),
+                ('email', models.EmailField(blank=True, max_length=254)),
+                ('ultima_visita', models.DateField(blank=True, null=True)),
+                ('ultimo_servico', models.CharField(blank=True, max_length=100)),
+                ('visitas_concluidas', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('ultimo_profissional', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='LihStudio.profissional')),
+            ],
+            options={
+                'verbose_name': 'Cliente',
+                'verbose_name_plural': 'Clientes',
+                'ordering': ['nome'],
+            },
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='cliente',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agendamentos', to='LihStudio.cliente'),
+        ),
+        migrations.AddConstraint(
+            model_name='cliente',
+            constraint=models.UniqueConstraint(fields=('nome', 'telefone_normalizado'), name='cliente_nome_telefone_uniq'),
+        ),
+        migrations.RunPython(popular_clientes, migrations.RunPython.noop),
+    ]
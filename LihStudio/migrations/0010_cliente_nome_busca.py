@@ -0,0 +1,82 @@
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Índice de busca por trecho do nome (ver LihStudio/busca.py).
+# No SQLite, os triggers ficam presos à tabela LihStudio_cliente: uma
+# migração futura que recrie essa tabela precisa rodar CRIAR_SQLITE de novo.
+CRIAR_SQLITE = [
+    """CREATE VIRTUAL TABLE lihstudio_cliente_busca USING fts5(
+        nome_busca, content='LihStudio_cliente', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER lihstudio_cliente_busca_ai AFTER INSERT ON LihStudio_cliente BEGIN
+        INSERT INTO lihstudio_cliente_busca(rowid, nome_busca) VALUES (new.id, new.nome_busca);
+    END""",
+    """CREATE TRIGGER lihstudio_cliente_busca_ad AFTER DELETE ON LihStudio_cliente BEGIN
+        INSERT INTO lihstudio_cliente_busca(lihstudio_cliente_busca, rowid, nome_busca)
+        VALUES ('delete', old.id, old.nome_busca);
+    END""",
+    """CREATE TRIGGER lihstudio_cliente_busca_au AFTER UPDATE OF nome_busca ON LihStudio_cliente BEGIN
+        INSERT INTO lihstudio_cliente_busca(lihstudio_cliente_busca, rowid, nome_busca)
+        VALUES ('delete', old.id, old.nome_busca);
+        INSERT INTO lihstudio_cliente_busca(rowid, nome_busca) VALUES (new.id, new.nome_busca);
+    END""",
+    "INSERT INTO lihstudio_cliente_busca(lihstudio_cliente_busca) VALUES ('rebuild')",
+]
+REMOVER_SQLITE = [
+    "DROP TRIGGER IF EXISTS lihstudio_cliente_busca_ai",
+    "DROP TRIGGER IF EXISTS lihstudio_cliente_busca_ad",
+    "DROP TRIGGER IF EXISTS lihstudio_cliente_busca_au",
+    "DROP TABLE IF EXISTS lihstudio_cliente_busca",
+]
+CRIAR_POSTGRES = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX cliente_nome_busca_trgm_idx ON "LihStudio_cliente" USING gin (nome_busca gin_trgm_ops)',
+]
+REMOVER_POSTGRES = [
+    "DROP INDEX IF EXISTS cliente_nome_busca_trgm_idx",
+]
+
+
+def _normalizar(nome):
+    sem_acento = "".join(c for c in unicodedata.normalize("NFKD", nome or "") if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", sem_acento).strip().casefold()
+
+
+def preencher_nome_busca(apps, schema_editor):
+    Cliente = apps.get_model("LihStudio", "Cliente")
+    clientes = list(Cliente.objects.only("id", "nome"))
+    for cliente in clientes:
+        cliente.nome_busca = _normalizar(cliente.nome)
+    Cliente.objects.bulk_update(clientes, ["nome_busca"], batch_size=500)
+
+
+def _executar(schema_editor, por_banco):
+    for sql in por_banco.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def criar_indice(apps, schema_editor):
+    _executar(schema_editor, {"sqlite": CRIAR_SQLITE, "postgresql": CRIAR_POSTGRES})
+
+
+def remover_indice(apps, schema_editor):
+    _executar(schema_editor, {"sqlite": REMOVER_SQLITE, "postgresql": REMOVER_POSTGRES})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0009_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='nome_busca',
+            field=models.CharField(blank=True, editable=False, help_text='Nome sem acentos, em minúsculas (busca.py)', max_length=100),
+        ),
+        migrations.RunPython(preencher_nome_busca, migrations.RunPython.noop),
+        migrations.RunPython(criar_indice, remover_indice),
+    ]
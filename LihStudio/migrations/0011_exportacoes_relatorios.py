@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0010_cliente_nome_busca'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoDados',
+            fields=[
+                ('nome', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Versão dos dados',
+                'verbose_name_plural': 'Versões dos dados',
+            },
+        ),
+        migrations.CreateModel(
+            name='ExportacaoRelatorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('clientes', 'Clientes'), ('faturamento', 'Faturamento')], max_length=20)),
+                ('filtros', models.JSONField(default=dict)),
+                ('versao_dados', models.PositiveBigIntegerField(default=0)),
+                ('chave', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('pronto', 'Pronto'), ('falhou', 'Falhou')], default='pendente', max_length=12)),
+                ('arquivo', models.CharField(help_text='Nome do arquivo dentro de RELATORIOS_DIR', max_length=100)),
+                ('nome_download', models.CharField(max_length=150)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('reservado_ate', models.DateTimeField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+                ('solicitado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportação de relatório',
+                'verbose_name_plural': 'Exportações de relatórios',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['status', 'reservado_ate'], name='exportacao_fila_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:15
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+# Percentual fixo da época; a 0013 cria Profissional.comissao_percentual com este padrão
+COMISSAO = Decimal("30.00")
+
+
+def consolidar(apps, schema_editor):
+    """
+    Preenche o consolidado a partir dos agendamentos faturados (mesma conta
+    do comando reconstruir_faturamento), para o faturamento não aparecer
+    zerado depois do deploy.
+    """
+    Agendamento = apps.get_model("LihStudio", "Agendamento")
+    FaturamentoMensal = apps.get_model("LihStudio", "FaturamentoMensal")
+    meses = (
+        Agendamento.objects.filter(status="concluido", contabilizar=True, valor_total__isnull=False)
+        .annotate(ano=ExtractYear("data"), mes=ExtractMonth("data"))
+        .values("profissional_id", "ano", "mes")
+        .annotate(bruto=Sum("valor_total"), servicos=Count("id"))
+        .order_by()
+    )
+    FaturamentoMensal.objects.bulk_create(
+        [
+            FaturamentoMensal(
+                profissional_id=m["profissional_id"], ano=m["ano"], mes=m["mes"],
+                faturamento_bruto=m["bruto"], total_servicos=m["servicos"],
+                comissao=(m["bruto"] * COMISSAO / 100).quantize(Decimal("0.01")),
+            )
+            for m in meses.iterator()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0011_exportacoes_relatorios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaturamentoMensal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ano', models.PositiveSmallIntegerField()),
+                ('mes', models.PositiveSmallIntegerField()),
+                ('faturamento_bruto', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_servicos', models.PositiveIntegerField(default=0)),
+                ('comissao', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('profissional', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faturamentos', to='LihStudio.profissional')),
+            ],
+            options={
+                'verbose_name': 'Faturamento mensal',
+                'verbose_name_plural': 'Faturamentos mensais',
+                'ordering': ['-ano', '-mes', 'profissional'],
+                'constraints': [models.UniqueConstraint(fields=('ano', 'mes', 'profissional'), name='faturamento_mensal_uniq')],
+            },
+        ),
+        migrations.RunPython(consolidar, migrations.RunPython.noop),
+    ]
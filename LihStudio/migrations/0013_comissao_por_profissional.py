@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:18
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0012_faturamento_mensal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profissional',
+            name='comissao_percentual',
+            field=models.DecimalField(decimal_places=2, default=Decimal('30.00'), help_text='Percentual do faturamento bruto repassado à profissional', max_digits=5, verbose_name='Comissão (%)'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0013_comissao_por_profissional'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacaoPagamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topico', models.CharField(max_length=30)),
+                ('recurso_id', models.CharField(max_length=64)),
+                ('acao', models.CharField(blank=True, max_length=50)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processada', 'Processada'), ('falhou', 'Falhou')], default='pendente', max_length=10)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resultado', models.CharField(blank=True, max_length=255)),
+                ('ultimo_erro', models.TextField(blank=True)),
+                ('recebida_em', models.DateTimeField(auto_now_add=True)),
+                ('processada_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Notificação de pagamento',
+                'verbose_name_plural': 'Notificações de pagamento',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa'], name='notificacao_fila_idx')],
+                'constraints': [models.UniqueConstraint(fields=('topico', 'recurso_id', 'acao'), name='notificacao_pagamento_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0014_notificacoes_pagamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='preferencia_expira_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Preferência expira em'),
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='preferencia_id',
+            field=models.CharField(blank=True, max_length=100, verbose_name='ID da Preferência'),
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='preferencia_url',
+            field=models.URLField(blank=True, max_length=500, verbose_name='Link de Pagamento'),
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='preferencia_valor',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=8, null=True, verbose_name='Valor da Preferência'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LihStudio', '0015_preferencia_pagamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacaopagamento',
+            name='entregas',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
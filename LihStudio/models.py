@@ -3,6 +3,7 @@ from django.utils import timezone
 from uuid import uuid4
 from django.core.exceptions import ValidationError
 from decimal import Decimal
+from django.conf import settings
 
 class Servico(models.Model):
     nome = models.CharField("Nome do Serviço", max_length=100, unique=True)
@@ -37,6 +38,13 @@ class Profissional(models.Model):
     nome = models.CharField("Nome", max_length=50)
     slug = models.SlugField("Slug", unique=True, help_text="Identificador sem espaços – ex.: NOME")
     ativo = models.BooleanField(default=True)
+    comissao_percentual = models.DecimalField(
+        "Comissão (%)", max_digits=5, decimal_places=2, default=Decimal("30.00"),
+        help_text="Percentual do faturamento bruto repassado à profissional",
+    )
+    # Incrementado (via UPDATE atômico) sempre que a agenda muda; chave do cache em disponibilidade.py
+    versao_disponibilidade = models.PositiveIntegerField(default=0, editable=False)
+    disponibilidade_atualizada_em = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["nome"]
@@ -46,16 +54,115 @@ class Profissional(models.Model):
     def __str__(self):
         return self.nome
 
+    def save(self, *args, **kwargs):
+        # Nunca regravar o contador a partir de uma instância antiga
+        # (ex.: admin), senão o cache voltaria a uma versão já usada.
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in ("versao_disponibilidade", "disponibilidade_atualizada_em")
+            ]
+        super().save(*args, **kwargs)
+
+
+class RegraDisponibilidade(models.Model):
+    """
+    Disponibilidade recorrente de uma profissional. Os HorarioDisponivel
+    correspondentes são criados só até um horizonte móvel (ao salvar a regra
+    e pelo comando diário `materializar_horarios`, ver horarios.materializar),
+    em vez de existirem para o calendário todo.
+    """
+    DIAS_SEMANA = [
+        (1, "Segunda"), (2, "Terça"), (3, "Quarta"), (4, "Quinta"),
+        (5, "Sexta"), (6, "Sábado"), (7, "Domingo"),
+    ]
+
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name="regras")
+    dias_semana = models.CharField("Dias da semana", max_length=13,
+                                   help_text="Números separados por vírgula (1 = segunda … 7 = domingo) – ex.: 1,3,5")
+    hora_inicio = models.TimeField("Início")
+    hora_fim = models.TimeField("Fim", help_text="Último horário do dia (inclusivo)")
+    intervalo = models.PositiveSmallIntegerField("Intervalo (minutos)", default=30)
+    valida_de = models.DateField("Válida a partir de")
+    valida_ate = models.DateField("Válida até", null=True, blank=True, help_text="Vazio = sem data de término")
+    ativa = models.BooleanField(default=True)
+    # Até onde os horários desta regra já foram criados; nunca recria o que foi excluído antes disso
+    materializada_ate = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ["profissional", "valida_de"]
+        verbose_name = "Regra de disponibilidade"
+        verbose_name_plural = "Regras de disponibilidade"
+
+    def __str__(self):
+        dias = ", ".join(dict(self.DIAS_SEMANA)[d][:3] for d in sorted(self.dias()))
+        return f"{self.profissional} - {dias} {self.hora_inicio:%H:%M}–{self.hora_fim:%H:%M}"
+
+    def dias(self):
+        return {int(d) for d in self.dias_semana.split(",") if d.strip()}
+
+    def clean(self):
+        try:
+            dias = self.dias()
+        except ValueError:
+            raise ValidationError({"dias_semana": "Use números de 1 a 7 separados por vírgula."})
+        if not dias or not dias <= set(dict(self.DIAS_SEMANA)):
+            raise ValidationError({"dias_semana": "Use números de 1 a 7 separados por vírgula."})
+        if self.hora_inicio and self.hora_fim and self.hora_inicio >= self.hora_fim:
+            raise ValidationError("Horário de início deve ser antes do horário de fim.")
+        if not self.intervalo:
+            raise ValidationError({"intervalo": "O intervalo deve ser maior que zero."})
+        if self.valida_de and self.valida_ate and self.valida_ate < self.valida_de:
+            raise ValidationError("A data de início não pode ser maior que a data de fim.")
+
+
+class ExcecaoDisponibilidade(models.Model):
+    """Folga, feriado ou bloqueio pontual: nenhuma regra gera horários nesse intervalo."""
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name="excecoes")
+    data = models.DateField()
+    hora_inicio = models.TimeField("Início", null=True, blank=True, help_text="Vazio = dia inteiro")
+    hora_fim = models.TimeField("Fim", null=True, blank=True, help_text="Vazio = dia inteiro")
+    motivo = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ["data", "hora_inicio"]
+        verbose_name = "Exceção de disponibilidade"
+        verbose_name_plural = "Exceções de disponibilidade"
+
+    def __str__(self):
+        periodo = f"{self.hora_inicio:%H:%M}–{self.hora_fim:%H:%M}" if self.hora_inicio and self.hora_fim else "dia inteiro"
+        return f"{self.profissional} - {self.data:%d/%m/%Y} ({periodo})"
+
+    def clean(self):
+        if (self.hora_inicio is None) != (self.hora_fim is None):
+            raise ValidationError("Preencha início e fim, ou deixe ambos vazios para o dia inteiro.")
+        if self.hora_inicio and self.hora_fim and self.hora_inicio >= self.hora_fim:
+            raise ValidationError("Horário de início deve ser antes do horário de fim.")
+
+    def bloqueia(self, hora):
+        if self.hora_inicio is None:
+            return True
+        return self.hora_inicio <= hora <= self.hora_fim
+
 
 class HorarioDisponivel(models.Model):
     profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name="horarios")
     data = models.DateField()
     hora = models.TimeField()
     disponivel = models.BooleanField(default=True)
+    # Preenchido quando o horário veio de uma regra recorrente
+    regra = models.ForeignKey(RegraDisponibilidade, on_delete=models.SET_NULL, null=True, blank=True,
+                              editable=False, related_name="horarios")
 
     class Meta:
         unique_together = ("profissional", "data", "hora")
         ordering = ["data", "hora"]
+        indexes = [
+            # calendário público: profissional + disponivel + data >= hoje
+            models.Index(fields=["profissional", "disponivel", "data"], name="horario_prof_disp_data_idx"),
+            # grade do admin: paginação por (data, hora, id) e MIN/MAX de data
+            models.Index(fields=["data", "hora"], name="horario_data_hora_idx"),
+        ]
 
     def __str__(self):
         dispon = "Disponível" if self.disponivel else "Indisponível"
@@ -64,6 +171,37 @@ class HorarioDisponivel(models.Model):
         return f"{self.profissional} - {data_fmt} às {hora_fmt} - {dispon}"
 
 
+class Cliente(models.Model):
+    """
+    Cliente consolidado a partir dos agendamentos (mesmo nome + mesmo telefone
+    normalizado). Mantido a cada save/delete de Agendamento por clientes.py;
+    para a base existente, rode `manage.py popular_clientes`.
+    """
+    nome = models.CharField(max_length=100)
+    nome_busca = models.CharField(max_length=100, blank=True, editable=False, help_text="Nome sem acentos, em minúsculas (busca.py)")
+    telefone = models.CharField(max_length=20, help_text="Como digitado no último agendamento")
+    telefone_normalizado = models.CharField(max_length=20, db_index=True, help_text="Só dígitos, sem o 55")
+    email = models.EmailField(blank=True)
+    ultima_visita = models.DateField(null=True, blank=True)
+    ultimo_profissional = models.ForeignKey(Profissional, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    ultimo_servico = models.CharField(max_length=100, blank=True)
+    visitas_concluidas = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["nome"]
+        verbose_name = "Cliente"
+        verbose_name_plural = "Clientes"
+        constraints = [
+            # também serve a listagem ordenada por nome
+            models.UniqueConstraint(fields=["nome", "telefone_normalizado"], name="cliente_nome_telefone_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} ({self.telefone})"
+
+
 class Agendamento(models.Model):
     STATUS_CHOICES = [
         ("pendente", "Pendente"),
@@ -80,6 +218,12 @@ class Agendamento(models.Model):
         ("rejeitado", "Rejeitado"),
         ("processando", "Processando"),
     ], verbose_name="Status do Pagamento")
+    # Preferência do Mercado Pago, reaproveitada enquanto vale e o preço não muda (ver pagamentos.py)
+    preferencia_id = models.CharField(max_length=100, blank=True, verbose_name="ID da Preferência")
+    preferencia_url = models.URLField(max_length=500, blank=True, verbose_name="Link de Pagamento")
+    preferencia_valor = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True,
+                                            verbose_name="Valor da Preferência")
+    preferencia_expira_em = models.DateTimeField(null=True, blank=True, verbose_name="Preferência expira em")
 
     contabilizar = models.BooleanField(
         default=False,
@@ -96,6 +240,9 @@ class Agendamento(models.Model):
     )
 
     profissional = models.ForeignKey(Profissional, on_delete=models.PROTECT, related_name="agendamentos")
+    # Preenchido automaticamente a partir de nome + telefone (ver clientes.py)
+    cliente = models.ForeignKey(Cliente, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                related_name="agendamentos")
     nome = models.CharField(max_length=100)
     telefone = models.CharField(max_length=20)
     email = models.EmailField()
@@ -141,6 +288,26 @@ class Agendamento(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     hora_backup = models.TimeField(null=True, blank=True, verbose_name="Hora (backup)")
 
+    class Meta:
+        indexes = [
+            # painéis: agenda do dia, futuros e passados pendentes
+            models.Index(fields=["data", "status"], name="agend_data_status_idx"),
+            # contadores por status e pagamento pendente
+            models.Index(fields=["status", "pagamento_status"], name="agend_status_pgto_idx"),
+            # lista de clientes / histórico (agrupamento por nome + telefone); as colunas
+            # extras deixam o índice cobrir a consulta única dos contadores do painel
+            models.Index(fields=["nome", "telefone", "status", "pagamento_status", "data"],
+                         name="agend_cliente_painel_idx"),
+            # faturamento
+            models.Index(fields=["status", "contabilizar", "data"], name="agend_status_contab_data_idx"),
+            # parcial: só o que entra no faturamento (Postgres e SQLite suportam)
+            models.Index(
+                fields=["data", "profissional"],
+                condition=models.Q(status="concluido", contabilizar=True, valor_total__isnull=False),
+                name="agend_faturamento_idx",
+            ),
+        ]
+
     @property
     def SERVICOS(self):
         """Retorna choices dinâmicos dos serviços ativos"""
@@ -201,4 +368,178 @@ class Agendamento(models.Model):
 
     def __str__(self):
         hora_txt = self.hora.hora.strftime("%H:%M") if self.hora else "--:--"
-        return f"{self.nome} - {self.get_servico_display()} ({hora_txt} {self.data})"
\ No newline at end of file
+        return f"{self.nome} - {self.get_servico_display()} ({hora_txt} {self.data})"
+
+class EmailSaida(models.Model):
+    """
+    Caixa de saída transacional: as views gravam o e-mail aqui, na mesma
+    transação da mudança de status, e o comando `enviar_emails` entrega.
+    """
+    STATUS_CHOICES = [
+        ("pendente", "Pendente"),
+        ("enviado", "Enviado"),
+        ("falhou", "Falhou"),
+    ]
+
+    assunto = models.CharField(max_length=255)
+    texto = models.TextField()
+    html = models.TextField(blank=True)
+    remetente = models.CharField(max_length=255, blank=True)
+    destinatarios = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pendente")
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "E-mail (caixa de saída)"
+        verbose_name_plural = "E-mails (caixa de saída)"
+        indexes = [
+            models.Index(fields=["status", "proxima_tentativa"], name="email_saida_fila_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.assunto} → {', '.join(self.destinatarios)} ({self.get_status_display()})"
+
+
+class VersaoDados(models.Model):
+    """
+    Contador incrementado a cada alteração nos dados de um relatório; entra
+    na chave das exportações para que dados novos gerem um arquivo novo.
+    """
+    nome = models.CharField(max_length=50, primary_key=True)
+    versao = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Versão dos dados"
+        verbose_name_plural = "Versões dos dados"
+
+    def __str__(self):
+        return f"{self.nome} v{self.versao}"
+
+    @classmethod
+    def atual(cls, nome):
+        return cls.objects.filter(nome=nome).values_list("versao", flat=True).first() or 0
+
+    @classmethod
+    def incrementar(cls, nome):
+        """UPDATE atômico; cria o contador na primeira vez."""
+        if not cls.objects.filter(nome=nome).update(versao=models.F("versao") + 1):
+            cls.objects.get_or_create(nome=nome, defaults={"versao": 1})
+
+
+class ExportacaoRelatorio(models.Model):
+    """
+    Pedido de relatório em PDF. A view só grava o pedido (ou reaproveita um
+    igual: mesma chave = mesmo tipo, filtros e versão dos dados) e o comando
+    `gerar_relatorios` renderiza o arquivo em RELATORIOS_DIR.
+    """
+    TIPO_CHOICES = [
+        ("clientes", "Clientes"),
+        ("faturamento", "Faturamento"),
+    ]
+    STATUS_CHOICES = [
+        ("pendente", "Pendente"),
+        ("processando", "Processando"),
+        ("pronto", "Pronto"),
+        ("falhou", "Falhou"),
+    ]
+
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    filtros = models.JSONField(default=dict)
+    versao_dados = models.PositiveBigIntegerField(default=0)
+    chave = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default="pendente")
+    arquivo = models.CharField(max_length=100, help_text="Nome do arquivo dentro de RELATORIOS_DIR")
+    nome_download = models.CharField(max_length=150)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    reservado_ate = models.DateTimeField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name="+")
+    criado_em = models.DateTimeField(auto_now_add=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-id"]
+        verbose_name = "Exportação de relatório"
+        verbose_name_plural = "Exportações de relatórios"
+        indexes = [
+            models.Index(fields=["status", "reservado_ate"], name="exportacao_fila_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.filtros} ({self.get_status_display()})"
+
+
+class FaturamentoMensal(models.Model):
+    """
+    Consolidado do faturamento por profissional e mês: só agendamentos
+    concluídos, com valor e marcados para contabilizar. Mantido por
+    faturamento.py a cada save/delete de Agendamento; para reconstruir do
+    zero, rode `manage.py reconstruir_faturamento`.
+    """
+    profissional = models.ForeignKey(Profissional, on_delete=models.CASCADE, related_name="faturamentos")
+    ano = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    faturamento_bruto = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    total_servicos = models.PositiveIntegerField(default=0)
+    comissao = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-ano", "-mes", "profissional"]
+        verbose_name = "Faturamento mensal"
+        verbose_name_plural = "Faturamentos mensais"
+        constraints = [
+            models.UniqueConstraint(fields=["ano", "mes", "profissional"], name="faturamento_mensal_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.profissional} {self.mes:02d}/{self.ano}: R$ {self.faturamento_bruto}"
+
+
+class NotificacaoPagamento(models.Model):
+    """
+    Registro das notificações (webhooks) do Mercado Pago. A view só grava a
+    notificação, uma linha por (tópico, recurso, ação), e conta as entregas;
+    uma nova entrega para uma linha já processada a devolve para a fila (o
+    pagamento pode ter mudado de novo). O comando `processar_pagamentos`
+    consulta o pagamento e aplica a mudança de status; se `entregas` mudou
+    enquanto ele consultava, o resultado é descartado e a linha volta para a fila.
+    """
+    STATUS_CHOICES = [
+        ("pendente", "Pendente"),
+        ("processada", "Processada"),
+        ("falhou", "Falhou"),
+    ]
+
+    topico = models.CharField(max_length=30)
+    recurso_id = models.CharField(max_length=64)
+    acao = models.CharField(max_length=50, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pendente")
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    entregas = models.PositiveIntegerField(default=1)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    resultado = models.CharField(max_length=255, blank=True)
+    ultimo_erro = models.TextField(blank=True)
+    recebida_em = models.DateTimeField(auto_now_add=True)
+    processada_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Notificação de pagamento"
+        verbose_name_plural = "Notificações de pagamento"
+        constraints = [
+            models.UniqueConstraint(fields=["topico", "recurso_id", "acao"], name="notificacao_pagamento_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "proxima_tentativa"], name="notificacao_fila_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topico} {self.recurso_id} {self.acao} ({self.get_status_display()})"
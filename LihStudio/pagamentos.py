@@ -0,0 +1,219 @@
+"""
+Pagamentos do Mercado Pago: registro das notificações e aplicação do status.
+
+O webhook só valida e grava a notificação (`registrar`) e responde 200 na
+hora; a restrição única mantém uma linha por (tópico, recurso, ação) e
+cada entrega soma 1 em `entregas`, no mesmo INSERT. O Mercado Pago repete
+essa chave quando o mesmo pagamento muda de novo (em processamento →
+aprovado → estornado; no IPN antigo a ação é vazia), então uma entrega para
+uma linha já tratada a devolve para a fila. O comando `processar_pagamentos`
+consulta o pagamento (`processar`) e aplica a mudança no agendamento
+(`aplicar`, pelas transições de transicoes.py) na mesma transação que marca
+a notificação como processada, uma única vez; se chegou outra entrega
+durante a consulta, a transação é desfeita e a notificação é consultada de novo.
+
+Quando um webhook se perde, o comando `conciliar_pagamentos` busca os
+pagamentos de todos os agendamentos parados numa busca só (`conciliar`) e
+aplica as mesmas transições.
+
+A preferência de pagamento (link do checkout) fica guardada no agendamento
+e é reaproveitada enquanto não expira e o preço não muda
+(`preferencia_valida`): reabrir o link do e-mail não chama a API.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import gateway, transicoes
+from .models import NotificacaoPagamento
+
+TOPICO = "payment"
+VALIDADE_PREFERENCIA = timedelta(hours=24)
+# Não reaproveita uma preferência que expira antes de a cliente terminar de pagar
+MARGEM_PREFERENCIA = timedelta(minutes=15)
+
+
+class ErroGateway(Exception):
+    """Resposta inesperada do Mercado Pago; a notificação volta para a fila."""
+
+
+def ler_notificacao(dados, params):
+    """
+    (tópico, id do recurso, ação) de uma notificação, no formato de webhook
+    (JSON no corpo) ou no formato IPN antigo (?topic=payment&id=...).
+    """
+    recurso = dados.get("data") if isinstance(dados.get("data"), dict) else {}
+    topico = dados.get("topic") or dados.get("type") or params.get("topic") or params.get("type")
+    recurso_id = recurso.get("id") or dados.get("id") or params.get("data.id") or params.get("id")
+    acao = dados.get("action") or ""
+    return topico, str(recurso_id or ""), acao
+
+
+def registrar(topico, recurso_id, acao, payload):
+    """
+    Grava a notificação num único INSERT ... ON CONFLICT DO UPDATE. Uma
+    entrega repetida só soma 1 em `entregas` (o worker que estiver
+    consultando o pagamento percebe e consulta de novo); se a linha já tinha
+    sido tratada, volta para a fila com as tentativas zeradas.
+    """
+    notificacao = NotificacaoPagamento(topico=topico, recurso_id=recurso_id, acao=acao, payload=payload)
+    campos = [f for f in NotificacaoPagamento._meta.concrete_fields if not f.primary_key]
+    valores = [f.get_db_prep_save(f.pre_save(notificacao, True), connection) for f in campos]
+
+    q = connection.ops.quote_name
+    tabela = q(NotificacaoPagamento._meta.db_table)
+    colunas = {f.name: q(f.column) for f in campos}
+    tratada = f"{tabela}.{colunas['status']} <> 'pendente'"
+    sql = (
+        f"INSERT INTO {tabela} ({', '.join(colunas.values())}) VALUES ({', '.join(['%s'] * len(campos))}) "
+        f"ON CONFLICT ({colunas['topico']}, {colunas['recurso_id']}, {colunas['acao']}) DO UPDATE SET "
+        f"{colunas['entregas']} = {tabela}.{colunas['entregas']} + 1, "
+        f"{colunas['payload']} = EXCLUDED.{colunas['payload']}, "
+        f"{colunas['proxima_tentativa']} = CASE WHEN {tratada} THEN EXCLUDED.{colunas['proxima_tentativa']} "
+        f"ELSE {tabela}.{colunas['proxima_tentativa']} END, "
+        f"{colunas['tentativas']} = CASE WHEN {tratada} THEN 0 ELSE {tabela}.{colunas['tentativas']} END, "
+        f"{colunas['ultimo_erro']} = CASE WHEN {tratada} THEN '' ELSE {tabela}.{colunas['ultimo_erro']} END, "
+        f"{colunas['status']} = 'pendente'"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, valores)
+
+
+def consultar(recurso_id, cliente=None):
+    resposta = (cliente or gateway.gateway()).consultar_pagamento(recurso_id)
+    if resposta.get("status") != 200:
+        raise ErroGateway(f"HTTP {resposta.get('status')} ao consultar o pagamento {recurso_id}")
+    return resposta.get("response") or {}
+
+
+def processar(notificacao, cliente=None):
+    """
+    Consulta o pagamento da notificação e aplica o status; devolve o resumo
+    do que mudou. `notificacao.entregas` é o valor lido antes da consulta.
+    """
+    pagamento = consultar(notificacao.recurso_id, cliente)
+    with transaction.atomic():
+        resultado = aplicar(pagamento)
+        # Só quem ainda vê a notificação pendente, com as mesmas entregas, grava:
+        # outro worker que a tenha processado antes, ou uma entrega nova (o
+        # pagamento pode ter mudado depois da consulta), desfaz esta transação
+        marcada = NotificacaoPagamento.objects.filter(
+            pk=notificacao.pk, status="pendente", entregas=notificacao.entregas
+        ).update(status="processada", processada_em=timezone.now(), resultado=resultado[:255], ultimo_erro="")
+        if not marcada:
+            transaction.set_rollback(True)
+    if marcada:
+        return resultado
+
+    # A reserva do worker não conta como tentativa: a nova entrega é consultada já
+    reenfileirada = NotificacaoPagamento.objects.filter(
+        pk=notificacao.pk, status="pendente"
+    ).exclude(entregas=notificacao.entregas).update(
+        proxima_tentativa=timezone.now(), tentativas=Greatest(F("tentativas") - 1, 0)
+    )
+    return "Nova entrega durante a consulta; volta para a fila" if reenfileirada else "Já processada"
+
+
+def conciliar(agendamentos, cliente=None):
+    """
+    Busca de uma vez os pagamentos de `agendamentos` (pelo external_reference)
+    e aplica o status de cada um. Devolve {id do agendamento: resumo}; quem
+    ainda não tem pagamento fica de fora.
+    """
+    por_id = {str(a.pk): a for a in agendamentos}
+    if not por_id:
+        return {}
+    desde = min(a.criado_em for a in agendamentos)
+    resposta = (cliente or gateway.gateway()).buscar_pagamentos(list(por_id), desde)
+    if resposta.get("status") != 200:
+        raise ErroGateway(f"HTTP {resposta.get('status')} ao buscar {len(por_id)} pagamento(s)")
+
+    por_referencia = defaultdict(list)
+    for pagamento in (resposta.get("response") or {}).get("results") or []:
+        referencia = str(pagamento.get("external_reference"))
+        if referencia in por_id:
+            por_referencia[referencia].append(pagamento)
+
+    resultados = {}
+    for referencia, pagamentos_ag in por_referencia.items():
+        # Um pagamento aprovado decide; senão vale o mais recente (a busca vem em ordem de atualização)
+        aprovados = [p for p in pagamentos_ag if p.get("status") == "approved"]
+        with transaction.atomic():
+            resultados[int(referencia)] = aplicar(aprovados[-1] if aprovados else pagamentos_ag[-1])
+    return resultados
+
+
+def preferencia_valida(agendamento, preco):
+    """
+    A preferência guardada ainda serve para cobrar `preco`? Uma recusa não a
+    invalida: o Mercado Pago aceita uma nova tentativa no mesmo checkout.
+    """
+    return bool(
+        agendamento.preferencia_id and agendamento.preferencia_url
+        and agendamento.preferencia_valor == preco
+        and agendamento.preferencia_expira_em
+        and agendamento.preferencia_expira_em > timezone.now() + MARGEM_PREFERENCIA
+    )
+
+
+def validade_preferencia():
+    """(início, fim) da validade de uma preferência criada agora."""
+    inicio = timezone.localtime()
+    fim = inicio + VALIDADE_PREFERENCIA
+    return inicio, fim
+
+
+def guardar_preferencia(agendamento, preferencia, preco, expira_em):
+    """
+    Grava só os campos da preferência. O status do pagamento muda apenas
+    pelas transições: um save() aqui poderia sobrescrever um 'processando'
+    ou 'aprovado' gravado pelo worker enquanto a API respondia.
+    """
+    agendamento.preferencia_id = preferencia["id"]
+    agendamento.preferencia_url = preferencia["init_point"]
+    agendamento.preferencia_valor = preco
+    agendamento.preferencia_expira_em = expira_em
+    agendamento.save(update_fields=["preferencia_id", "preferencia_url", "preferencia_valor",
+                                    "preferencia_expira_em"])
+
+
+def aplicar(pagamento):
+    """Aplica o status de um pagamento ao agendamento do external_reference (ver transicoes.py)."""
+    from .views import enviar_email_confirmacao_automatica  # views importa este módulo
+
+    status = pagamento.get("status")
+    referencia = pagamento.get("external_reference")
+    pagamento_id = pagamento.get("id")
+    try:
+        agendamento_id = int(referencia)
+    except (TypeError, ValueError):
+        return f"Agendamento não encontrado ({referencia})"
+
+    if status == "approved":
+        try:
+            agendamento = transicoes.aprovar_pagamento(agendamento_id, pagamento_id)
+        except transicoes.HorarioOcupado:
+            transicoes.registrar_pagamento(agendamento_id, pagamento_id)
+            return f"Agendamento {agendamento_id}: pagamento aprovado, mas o horário já foi ocupado (remarcar ou estornar)"
+        if agendamento:
+            enviar_email_confirmacao_automatica(agendamento)
+            return f"Agendamento {agendamento_id}: pagamento aprovado, agendamento confirmado"
+        # Se o admin já cancelou ou concluiu, só registra o pagamento
+        if transicoes.registrar_pagamento(agendamento_id, pagamento_id):
+            return f"Agendamento {agendamento_id}: pagamento aprovado registrado"
+    elif status == "rejected":
+        if transicoes.recusar_pagamento(agendamento_id, pagamento_id):
+            return f"Agendamento {agendamento_id}: pagamento recusado"
+    elif status in ("cancelled", "refunded", "charged_back"):
+        if transicoes.recusar_pagamento(agendamento_id, pagamento_id, estorno=True):
+            return f"Agendamento {agendamento_id}: pagamento {status}"
+    elif status in ("in_process", "pending"):
+        if transicoes.pagamento_em_processo(agendamento_id, pagamento_id):
+            return f"Agendamento {agendamento_id}: pagamento em processamento"
+    else:
+        return f"Agendamento {agendamento_id}: status '{status}' ignorado"
+    return f"Agendamento {agendamento_id}: '{status}' sem mudança (já aplicado ou agendamento inexistente)"
@@ -0,0 +1,132 @@
+"""
+Contadores e listas dos painéis (dona e funcionário).
+
+Os contadores saem de uma única consulta com agregação condicional (mais a
+contagem da tabela Cliente) e ficam alguns segundos no cache: o painel fica
+aberto o dia todo e recarrega o tempo inteiro. Qualquer save/delete de
+Agendamento apaga o cache na hora.
+
+As listas longas são paginadas por chave (keyset): cada página continua
+depois da última linha da anterior, sem OFFSET nem COUNT.
+"""
+from datetime import date, datetime
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Agendamento, Cliente
+
+CACHE_TIMEOUT = 10  # segundos
+TAMANHO_PAGINA = 25
+
+# Só o que as linhas dos painéis exibem
+CAMPOS_LISTA = (
+    "id", "nome", "telefone", "status", "data", "hora_backup", "observacoes",
+    "servico_nome_snapshot", "servico__nome", "profissional__nome",
+)
+
+
+def _chave(hoje):
+    return f"painel:contadores:{hoje.isoformat()}"
+
+
+def contadores(hoje=None):
+    hoje = hoje or date.today()
+    chave = _chave(hoje)
+
+    dados = cache.get(chave)
+    if dados is None:
+        ativo = ~Q(status="cancelado")
+        dados = Agendamento.objects.aggregate(
+            hoje=Count("id", filter=Q(data=hoje) & ativo),
+            confirmados=Count("id", filter=Q(status="confirmado")),
+            pendentes=Count("id", filter=Q(status="pendente")),
+            cancelados=Count("id", filter=Q(status="cancelado")),
+            futuros=Count("id", filter=Q(data__gt=hoje) & ativo),
+            pagamento_pendente=Count("id", filter=Q(status="pendente", pagamento_status="pendente")),
+            passados_pendentes=Count("id", filter=Q(data__lt=hoje, status__in=["pendente", "confirmado"])),
+        )
+        dados["clientes"] = Cliente.objects.count()
+        cache.set(chave, dados, CACHE_TIMEOUT)
+    return dados
+
+
+def invalidar():
+    cache.delete(_chave(date.today()))
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+def _agendamento_alterado(sender, **kwargs):
+    invalidar()
+
+
+# ------------------------------------------------------------------
+# Listas paginadas
+# ------------------------------------------------------------------
+
+def agendamentos_futuros(hoje):
+    return (
+        Agendamento.objects.filter(data__gt=hoje).exclude(status="cancelado")
+        .select_related("profissional", "servico").only(*CAMPOS_LISTA)
+    )
+
+
+def agendamentos_passados_pendentes(hoje):
+    return (
+        Agendamento.objects.filter(data__lt=hoje, status__in=["pendente", "confirmado"])
+        .select_related("profissional", "servico").only(*CAMPOS_LISTA)
+    )
+
+
+def _cursor(ag):
+    hora = ag.hora_backup.strftime("%H:%M:%S") if ag.hora_backup else ""
+    return f"{ag.data.isoformat()}|{hora}|{ag.id}"
+
+
+def _ler_cursor(cursor):
+    """'AAAA-MM-DD|HH:MM:SS|id' → (data, hora ou None, id); ValueError se inválido."""
+    data_str, hora_str, id_str = cursor.split("|")
+    data = datetime.strptime(data_str, "%Y-%m-%d").date()
+    hora = datetime.strptime(hora_str, "%H:%M:%S").time() if hora_str else None
+    return data, hora, int(id_str)
+
+
+def _depois_de(data, hora, pk, descendente):
+    """
+    Linhas que vêm depois de (data, hora, id) na ordem da lista. A hora pode
+    ser nula em agendamentos antigos: nulos vêm primeiro na ordem crescente
+    e por último na decrescente, nos dois bancos.
+    """
+    if descendente:
+        if hora is None:
+            mesmo_dia = Q(hora_backup__isnull=True, id__lt=pk)
+        else:
+            mesmo_dia = Q(hora_backup__lt=hora) | Q(hora_backup__isnull=True) | Q(hora_backup=hora, id__lt=pk)
+        return Q(data__lt=data) | (Q(data=data) & mesmo_dia)
+
+    if hora is None:
+        mesmo_dia = Q(hora_backup__isnull=True, id__gt=pk) | Q(hora_backup__isnull=False)
+    else:
+        mesmo_dia = Q(hora_backup__gt=hora) | Q(hora_backup=hora, id__gt=pk)
+    return Q(data__gt=data) | (Q(data=data) & mesmo_dia)
+
+
+def pagina(queryset, cursor=None, descendente=False, tamanho=TAMANHO_PAGINA):
+    """
+    Retorna (itens, proximo_cursor) ordenando por (data, hora, id).
+    `proximo_cursor` é None na última página. Cursor inválido: ValueError.
+    """
+    if descendente:
+        ordem = (F("data").desc(), F("hora_backup").desc(nulls_last=True), F("id").desc())
+    else:
+        ordem = (F("data").asc(), F("hora_backup").asc(nulls_first=True), F("id").asc())
+
+    if cursor:
+        queryset = queryset.filter(_depois_de(*_ler_cursor(cursor), descendente))
+
+    itens = list(queryset.order_by(*ordem)[:tamanho + 1])
+    proximo = _cursor(itens[tamanho - 1]) if len(itens) > tamanho else None
+    return itens[:tamanho], proximo
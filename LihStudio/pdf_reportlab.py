@@ -0,0 +1,205 @@
+"""
+Relatórios em PDF desenhados direto com o ReportLab (Platypus).
+
+Recebem o mesmo contexto dos templates clientes_pdf.html e
+faturamento_pdf.html (ver relatorios.MONTADORES), mas não passam por HTML
+nem pelo layout CSS do xhtml2pdf: as linhas vêm do iterador da consulta e
+viram tabelas de LINHAS_POR_TABELA linhas, com larguras fixas e cabeçalho
+repetido a cada página. Com centenas de milhares de linhas isso é várias
+vezes mais rápido e usa uma fração da memória (ver `benchmark_relatorios`).
+"""
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import cm
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .models import Agendamento
+
+ROSA = colors.HexColor("#d63384")
+CINZA = colors.HexColor("#666666")
+LINHAS_POR_TABELA = 250
+
+TITULO = ParagraphStyle("titulo", fontName="Helvetica-Bold", fontSize=16, textColor=ROSA,
+                        alignment=TA_CENTER, spaceAfter=4)
+SUBTITULO = ParagraphStyle("subtitulo", fontName="Helvetica", fontSize=9, textColor=CINZA,
+                           alignment=TA_CENTER, spaceAfter=12)
+SECAO = ParagraphStyle("secao", fontName="Helvetica-Bold", fontSize=12, textColor=ROSA,
+                       spaceBefore=12, spaceAfter=6)
+TEXTO = ParagraphStyle("texto", fontName="Helvetica", fontSize=9, textColor=CINZA, spaceAfter=6)
+
+ESTILO_TABELA = TableStyle([
+    ("FONT", (0, 0), (-1, -1), "Helvetica", 8),
+    ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", 8),
+    ("BACKGROUND", (0, 0), (-1, 0), ROSA),
+    ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+    ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f9f9f9")]),
+    ("LINEBELOW", (0, 1), (-1, -1), 0.25, colors.HexColor("#dddddd")),
+    ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ("TOPPADDING", (0, 0), (-1, -1), 3),
+    ("BOTTOMPADDING", (0, 0), (-1, -1), 3),
+])
+ESTILO_TOTAL = TableStyle([("FONT", (0, -1), (-1, -1), "Helvetica-Bold", 8)])
+
+
+def _iterar(linhas):
+    # QuerySets em blocos; listas/geradores como vieram
+    return linhas.iterator(chunk_size=2000) if hasattr(linhas, "iterator") else linhas
+
+
+def _cortar(texto, limite):
+    texto = "" if texto is None else str(texto)
+    return texto if len(texto) <= limite else texto[:limite - 1] + "…"
+
+
+def _data(valor, formato="%d/%m/%Y"):
+    return valor.strftime(formato) if valor else ""
+
+
+def _reais(valor):
+    return f"R$ {valor or 0:.2f}"
+
+
+def _tabelas(cabecalho, linhas, larguras):
+    """Quebra as linhas em tabelas menores: o Platypus mede e divide cada uma rapidamente."""
+    bloco = []
+    for linha in linhas:
+        bloco.append(linha)
+        if len(bloco) == LINHAS_POR_TABELA:
+            yield Table([cabecalho] + bloco, colWidths=larguras, repeatRows=1, style=ESTILO_TABELA)
+            bloco = []
+    if bloco:
+        yield Table([cabecalho] + bloco, colWidths=larguras, repeatRows=1, style=ESTILO_TABELA)
+
+
+class _HistoriaEmFluxo(list):
+    """
+    Lista de flowables que se completa sob demanda a partir de um gerador.
+    O build do Platypus só consome o começo da lista (e devolve pedaços ao
+    começo quando divide uma tabela), então as tabelas são criadas à medida
+    que as páginas são desenhadas e descartadas logo depois.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._resto = iter(flowables)
+
+    def _encher(self):
+        while self._resto is not None and list.__len__(self) < 2:
+            try:
+                self.append(next(self._resto))
+            except StopIteration:
+                self._resto = None
+
+    def __len__(self):
+        self._encher()
+        return list.__len__(self)
+
+    def __getitem__(self, indice):
+        self._encher()
+        return list.__getitem__(self, indice)
+
+
+def _construir(destino, titulo, historia, retrato=True):
+    _documento(destino, titulo, retrato).build(
+        _HistoriaEmFluxo(historia), onFirstPage=_rodape("RM Studio"), onLaterPages=_rodape("RM Studio")
+    )
+
+
+def _documento(destino, titulo, retrato=True):
+    tamanho = A4 if retrato else landscape(A4)
+    return SimpleDocTemplate(destino, pagesize=tamanho, title=titulo, author="RM Studio",
+                             leftMargin=1.5 * cm, rightMargin=1.5 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm)
+
+
+def _rodape(texto):
+    def desenhar(canvas, doc):
+        canvas.saveState()
+        canvas.setFont("Helvetica", 7)
+        canvas.setFillColor(CINZA)
+        canvas.drawCentredString(doc.pagesize[0] / 2, 0.8 * cm, f"{texto} • Página {doc.page}")
+        canvas.restoreState()
+    return desenhar
+
+
+def clientes(destino, contexto):
+    status = dict(Agendamento.STATUS_CHOICES)
+    total = 0
+
+    def linhas():
+        nonlocal total
+        for c in _iterar(contexto["clientes"]):
+            total += 1
+            yield (
+                _cortar(c["nome"], 40), c["telefone"], _cortar(c["profissional"], 22), _data(c["ultima_visita"]),
+                _cortar(c["ultimo_servico"], 30), status.get(c["status"], "Pendente"), c["total_visitas"],
+            )
+
+    def historia():
+        yield Paragraph("Relatório de Clientes - RM Studio", TITULO)
+        yield Paragraph(f"Relatório gerado em {timezone.localtime():%d/%m/%Y %H:%M}", SUBTITULO)
+        yield Paragraph(f"<b>Filtros aplicados:</b> {escape(contexto['filtros_aplicados'])}", TEXTO)
+        yield from _tabelas(
+            ("Nome", "Telefone", "Profissional", "Última Visita", "Último Serviço", "Status", "Total Visitas"),
+            linhas(),
+            [6.5 * cm, 3.2 * cm, 4 * cm, 2.6 * cm, 5.2 * cm, 2.4 * cm, 2.4 * cm],
+        )
+        yield Spacer(1, 0.4 * cm)
+        yield Paragraph(f"Total de clientes: {total}", TEXTO)
+
+    _construir(destino, "Relatório de Clientes", historia(), retrato=False)
+
+
+def faturamento(destino, contexto):
+    mes_nome = contexto["mes_nome"]
+    historia = [
+        Paragraph("RELATÓRIO DE FATURAMENTO RM STUDIO", TITULO),
+        Paragraph(f"Período: {mes_nome.upper()} / {contexto['ano_atual']} | "
+                  f"Gerado em: {timezone.localtime(contexto['hoje']):%d/%m/%Y %H:%M}", SUBTITULO),
+        Paragraph("Resumo Financeiro do Mês", SECAO),
+        Table([
+            ("Faturamento Bruto (Este Mês)", "Repasse Profissionais (Mês)", "Serviços Concluídos",
+             "Faturamento Bruto (Total Geral)"),
+            (_reais(contexto["total_bruto_mes"]), _reais(contexto["total_comissao_mes"]),
+             contexto["total_servicos_mes"], _reais(contexto["faturamento_total_bruto"])),
+        ], colWidths=[4.5 * cm] * 4, style=ESTILO_TABELA),
+        Paragraph(f"Desempenho por Profissional ({mes_nome})", SECAO),
+    ]
+
+    analise = [
+        (_cortar(a["profissional__nome"], 35), a["total_servicos"], _reais(a["faturamento_bruto"]),
+         _reais(a["comissao_prof"]))
+        for a in contexto["analise_profissionais"]
+    ] or [("Nenhum serviço concluído neste mês.", "", "", "")]
+    analise.append(("TOTAL GERAL", contexto["total_servicos_mes"], _reais(contexto["total_bruto_mes"]),
+                    _reais(contexto["total_comissao_mes"])))
+    tabela = Table([("Profissional", "Serviços Concluídos", "Faturamento Bruto (R$)", "Repasse (Comissão)")]
+                   + analise, colWidths=[6 * cm, 3.5 * cm, 4 * cm, 4.5 * cm], repeatRows=1, style=ESTILO_TABELA)
+    tabela.setStyle(ESTILO_TOTAL)
+    historia.append(tabela)
+
+    historia.append(Paragraph(f"Detalhe de Agendamentos Concluídos ({mes_nome})", SECAO))
+    detalhes = (
+        (_data(ag.data), _data(ag.hora.hora if ag.hora else ag.hora_backup, "%H:%M"), _cortar(ag.nome, 30),
+         _cortar(ag.get_servico_display(), 26), _cortar(ag.profissional.nome, 20), _reais(ag.valor_total))
+        for ag in _iterar(contexto["agendamentos_detalhados"])
+    )
+    tabelas = _tabelas(("Data", "Hora", "Cliente", "Serviço", "Profissional", "Valor (R$)"), detalhes,
+                       [2.2 * cm, 1.4 * cm, 5 * cm, 4.2 * cm, 3.4 * cm, 2 * cm])
+    if contexto["total_servicos_mes"]:
+        historia = chain(historia, tabelas)
+    else:
+        historia.append(Paragraph("Nenhum agendamento detalhado para o período.", TEXTO))
+
+    _construir(destino, f"Faturamento {mes_nome}/{contexto['ano_atual']}", historia)
+
+
+MOTORES = {
+    "clientes": clientes,
+    "faturamento": faturamento,
+}
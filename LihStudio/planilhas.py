@@ -0,0 +1,162 @@
+"""
+Planilhas (CSV e XLSX) geradas em fluxo.
+
+As linhas vêm de um iterador (consulta com .iterator()) e cada bloco é
+enviado assim que fica pronto pelo StreamingHttpResponse: o download
+começa na hora e a memória não cresce com o tamanho do período.
+
+O XLSX é montado à mão com zipfile (só o mínimo do formato: uma aba,
+textos inline), porque openpyxl precisa do arquivo inteiro na memória ou
+em disco antes de enviar o primeiro byte.
+"""
+import csv
+import re
+import zipfile
+from datetime import date, time
+from decimal import Decimal
+from itertools import chain
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+LINHAS_POR_BLOCO = 500
+
+
+def resposta(formato, nome_arquivo, cabecalho, linhas):
+    """StreamingHttpResponse com a planilha; `formato` deve estar em FORMATOS."""
+    gerador = csv_em_fluxo if formato == "csv" else xlsx_em_fluxo
+    response = StreamingHttpResponse(gerador(cabecalho, linhas), content_type=FORMATOS[formato])
+    response["Content-Disposition"] = f'attachment; filename="{nome_arquivo}.{formato}"'
+    return response
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, date):
+        return valor.strftime("%d/%m/%Y")
+    if isinstance(valor, time):
+        return valor.strftime("%H:%M")
+    return valor
+
+
+# ------------------------------------------------------------------
+# CSV
+# ------------------------------------------------------------------
+
+class _Eco:
+    """"Arquivo" que só devolve o que o csv.writer escreve."""
+
+    def write(self, valor):
+        return valor
+
+
+def csv_em_fluxo(cabecalho, linhas):
+    escritor = csv.writer(_Eco())
+    for linha in chain([cabecalho], linhas):
+        yield escritor.writerow([_texto(v) for v in linha])
+
+
+# ------------------------------------------------------------------
+# XLSX
+# ------------------------------------------------------------------
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Dados" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_ABA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_ABA_FIM = '</sheetData></worksheet>'
+
+# Caracteres de controle não são válidos em XML
+_INVALIDOS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class _Saida:
+    """Destino do ZipFile que acumula os bytes até o gerador entregá-los."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b"".join(self.partes)
+        self.partes = []
+        return dados
+
+
+def _celula(valor):
+    if isinstance(valor, bool):
+        valor = "Sim" if valor else "Não"
+    if isinstance(valor, (int, float, Decimal)):
+        return f"<c><v>{valor}</v></c>"
+    texto = _INVALIDOS.sub("", str(_texto(valor)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+
+
+def _linha(valores):
+    return "<row>" + "".join(_celula(v) for v in valores) + "</row>"
+
+
+def xlsx_em_fluxo(cabecalho, linhas):
+    saida = _Saida()
+    # Sem seek no destino, o zipfile grava o tamanho de cada arquivo depois do conteúdo
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as pacote:
+        pacote.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        pacote.writestr("_rels/.rels", _RELS)
+        pacote.writestr("xl/workbook.xml", _WORKBOOK)
+        pacote.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield saida.esvaziar()
+
+        with pacote.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as aba:
+            aba.write(_ABA_INICIO.encode())
+            aba.write(_linha(cabecalho).encode())
+            for n, valores in enumerate(linhas, 1):
+                aba.write(_linha(valores).encode())
+                if n % LINHAS_POR_BLOCO == 0:
+                    yield saida.esvaziar()
+            aba.write(_ABA_FIM.encode())
+    yield saida.esvaziar()
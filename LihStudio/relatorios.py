@@ -0,0 +1,322 @@
+"""
+Relatórios em PDF gerados fora da requisição.
+
+A view chama `solicitar(tipo, filtros)`, que grava um ExportacaoRelatorio
+com chave = hash(tipo, filtros, versão dos dados). Se já existe um pedido
+com a mesma chave, ele é reaproveitado: enquanto os dados não mudam, o
+mesmo PDF serve todo mundo. O comando `gerar_relatorios` renderiza os
+pedidos pendentes (renderizar é pesado e prenderia o worker web por
+vários segundos) e a página de espera consulta o status até o download.
+
+Save/delete de Agendamento, Serviço ou Profissional incrementa a versão
+dos dados; caminhos com QuerySet.update() chamam `invalidar()`. O
+incremento roda depois do commit (a linha do contador não fica travada
+durante a transação do agendamento) e um save com update_fields que não
+toca nenhum campo lido pelos relatórios (preferência de pagamento,
+lembretes...) não muda a versão.
+
+O PDF é desenhado pelo motor de settings.RELATORIOS_MOTOR: 'reportlab'
+(pdf_reportlab.py, padrão) ou 'html' (templates *_pdf.html + xhtml2pdf).
+"""
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.utils import timezone
+from xhtml2pdf import pisa
+
+from .clientes import resumo_por_cliente
+from .models import Agendamento, Cliente, ExportacaoRelatorio, Profissional, Servico, VersaoDados
+from . import busca, faturamento, pdf_reportlab
+
+VERSAO = "relatorios"
+
+# Parâmetros da querystring que mudam cada relatório (o resto é ignorado)
+CAMPOS_FILTRO = {
+    "clientes": ("nome", "servico", "data_inicio", "data_fim", "profissional", "status"),
+    "faturamento": ("mes", "ano", "profissional"),
+}
+
+TAMANHO_BLOCO = 2000
+
+# Campos do agendamento que aparecem (ou filtram) nos relatórios
+CAMPOS_AGENDAMENTO = frozenset({
+    "nome", "telefone", "data", "hora", "hora_backup", "status", "pagamento_status", "contabilizar",
+    "valor_total", "profissional", "servico", "servico_nome_snapshot", "cliente",
+})
+
+MESES = {1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho", 7: "Julho",
+         8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"}
+
+
+# ------------------------------------------------------------------
+# Versão dos dados
+# ------------------------------------------------------------------
+
+def versao_dados():
+    return VersaoDados.atual(VERSAO)
+
+
+def invalidar():
+    transaction.on_commit(lambda: VersaoDados.incrementar(VERSAO))
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+@receiver(post_save, sender=Servico)
+@receiver(post_delete, sender=Servico)
+@receiver(post_save, sender=Profissional)
+@receiver(post_delete, sender=Profissional)
+def _dados_alterados(sender, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if sender is Agendamento and update_fields:
+        campos = {Agendamento._meta.get_field(campo).name for campo in update_fields}
+        if not campos & CAMPOS_AGENDAMENTO:
+            return
+    invalidar()
+
+
+# ------------------------------------------------------------------
+# Pedidos
+# ------------------------------------------------------------------
+
+def filtros_de(tipo, params):
+    """
+    Só os filtros que importam para o relatório, sem valores vazios. No
+    faturamento o mês/ano padrão (o atual) entra explícito, senão o PDF do
+    mês passado seria reaproveitado na virada do mês. ValueError se inválido.
+    """
+    filtros = {campo: params[campo] for campo in CAMPOS_FILTRO[tipo] if params.get(campo)}
+    if tipo == "faturamento":
+        mes, ano = _mes_ano(filtros)
+        if not 1 <= mes <= 12:
+            raise ValueError("Mês inválido")
+        filtros.update(mes=str(mes), ano=str(ano))
+    return filtros
+
+
+def chave(tipo, filtros, versao):
+    # O motor entra na chave: trocar de motor gera arquivos novos
+    dados = json.dumps({"tipo": tipo, "filtros": filtros, "versao": versao, "motor": motor()}, sort_keys=True)
+    return hashlib.sha256(dados.encode()).hexdigest()
+
+
+def caminho(exportacao):
+    return os.path.join(settings.RELATORIOS_DIR, exportacao.arquivo)
+
+
+def solicitar(tipo, filtros, usuario=None):
+    """Devolve o pedido com esses filtros e dados, criando (ou reabrindo) se preciso."""
+    versao = versao_dados()
+    ch = chave(tipo, filtros, versao)
+    exportacao, criada = ExportacaoRelatorio.objects.get_or_create(chave=ch, defaults={
+        "tipo": tipo,
+        "filtros": filtros,
+        "versao_dados": versao,
+        "arquivo": f"{tipo}_{ch}.pdf",
+        "nome_download": nome_download(tipo, filtros),
+        "solicitado_por": usuario if usuario and usuario.is_authenticated else None,
+    })
+    if not criada and (
+        exportacao.status == "falhou"
+        or (exportacao.status == "pronto" and not os.path.exists(caminho(exportacao)))
+    ):
+        # Falhou antes ou o arquivo sumiu do disco: volta para a fila
+        ExportacaoRelatorio.objects.filter(pk=exportacao.pk).update(
+            status="pendente", tentativas=0, reservado_ate=None, erro="", concluido_em=None
+        )
+        exportacao.refresh_from_db()
+    return exportacao
+
+
+def nome_download(tipo, filtros):
+    if tipo == "faturamento":
+        mes, ano = _mes_ano(filtros)
+        return f"faturamento_{MESES.get(mes, '')}_{ano}.pdf"
+    return "relatorio_clientes.pdf"
+
+
+# ------------------------------------------------------------------
+# Renderização (roda no comando gerar_relatorios)
+# ------------------------------------------------------------------
+
+def motor():
+    """'reportlab' (padrão, pdf_reportlab.py) ou 'html' (templates + xhtml2pdf)."""
+    return settings.RELATORIOS_MOTOR
+
+
+def desenhar(arquivo, tipo, template, contexto, motor_pdf=None):
+    """Escreve o PDF em `arquivo` (caminho ou arquivo binário aberto)."""
+    if (motor_pdf or motor()) == "reportlab":
+        pdf_reportlab.MOTORES[tipo](arquivo, contexto)
+        return
+
+    html = get_template(template).render(contexto)
+    if isinstance(arquivo, str):
+        with open(arquivo, "wb") as saida:
+            pisa_status = pisa.CreatePDF(html, dest=saida)
+    else:
+        pisa_status = pisa.CreatePDF(html, dest=arquivo)
+    if pisa_status.err:
+        raise RuntimeError(f"xhtml2pdf retornou {pisa_status.err} erro(s)")
+
+
+def renderizar(exportacao):
+    """Gera o PDF do pedido em RELATORIOS_DIR; levanta exceção se a renderização falhar."""
+    template, contexto = MONTADORES[exportacao.tipo](exportacao.filtros)
+
+    destino = caminho(exportacao)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f"{destino}.tmp"
+    try:
+        with open(temporario, "wb") as arquivo:
+            desenhar(arquivo, exportacao.tipo, template, contexto)
+    except Exception:
+        os.remove(temporario)
+        raise
+    # Troca atômica: quem baixar nunca vê um PDF pela metade
+    os.replace(temporario, destino)
+
+
+def agendamentos_clientes(filtros):
+    """Agendamentos que entram na lista de clientes (mesmos filtros da tela)."""
+    agendamentos = Agendamento.objects.all()
+    if filtros.get("nome"):
+        agendamentos = agendamentos.filter(busca.filtro_nome(filtros["nome"], campo="cliente_id"))
+    if filtros.get("servico"):
+        agendamentos = agendamentos.filter(servico=filtros["servico"])
+    if filtros.get("data_inicio"):
+        agendamentos = agendamentos.filter(data__gte=filtros["data_inicio"])
+    if filtros.get("data_fim"):
+        agendamentos = agendamentos.filter(data__lte=filtros["data_fim"])
+    if filtros.get("profissional"):
+        agendamentos = agendamentos.filter(profissional__slug=filtros["profissional"])
+    if filtros.get("status"):
+        agendamentos = agendamentos.filter(status=filtros["status"])
+    return agendamentos
+
+
+def montar_clientes(filtros):
+    descricao = []
+    if filtros.get("nome"):
+        descricao.append(f"Nome: {filtros['nome']}")
+    if filtros.get("servico"):
+        servico = Servico.objects.filter(id=filtros["servico"]).first()
+        servico_display = servico.nome if servico else f"ID {filtros['servico']} (desconhecido)"
+        descricao.append(f"Serviço: {servico_display}")
+    if filtros.get("profissional"):
+        profissional = Profissional.objects.filter(slug=filtros["profissional"]).first()
+        if profissional:
+            descricao.append(f"Profissional: {profissional.nome}")
+    if filtros.get("status"):
+        descricao.append(f"Status: {dict(Agendamento.STATUS_CHOICES).get(filtros['status'], filtros['status'])}")
+    if filtros.get("data_inicio") or filtros.get("data_fim"):
+        periodo = []
+        if filtros.get("data_inicio"):
+            periodo.append(f"de {filtros['data_inicio']}")
+        if filtros.get("data_fim"):
+            periodo.append(f"até {filtros['data_fim']}")
+        descricao.append(f"Período: {' '.join(periodo)}")
+
+    return "LihStudio/clientes_pdf.html", {
+        # Uma linha por cliente, agregada no banco e lida em blocos
+        "clientes": resumo_por_cliente(agendamentos_clientes(filtros)),
+        "filtros_aplicados": " • ".join(descricao) if descricao else "Nenhum filtro aplicado",
+    }
+
+
+def _mes_ano(filtros):
+    hoje = timezone.now().date()
+    return int(filtros.get("mes") or hoje.month), int(filtros.get("ano") or hoje.year)
+
+
+def agendamentos_faturamento(filtros):
+    """
+    Agendamentos faturados no período dos filtros: o mês/ano, ou o ano
+    inteiro quando não há "mes" (planilha anual).
+    """
+    mes = int(filtros["mes"]) if filtros.get("mes") else None
+    agendamentos = faturamento.faturados().filter(data__range=faturamento.periodo(int(filtros["ano"]), mes))
+    if filtros.get("profissional") and filtros["profissional"] != "todos":
+        agendamentos = agendamentos.filter(profissional__slug=filtros["profissional"])
+    return agendamentos
+
+
+def montar_faturamento(filtros):
+    mes_atual, ano_atual = _mes_ano(filtros)
+    prof_slug_filtro = filtros.get("profissional")
+
+    # Totais e análise por profissional vêm do consolidado mensal
+    resumo = faturamento.resumo_mes(ano_atual, mes_atual, prof_slug_filtro)
+    faturamento_mes_query = agendamentos_faturamento({**filtros, "mes": mes_atual, "ano": ano_atual})
+
+    agendamentos_detalhados = faturamento_mes_query.select_related(
+        "hora", "profissional", "servico"
+    ).order_by("data", "hora_backup")
+
+    return "LihStudio/faturamento_pdf.html", {
+        **resumo,
+        "agendamentos_detalhados": agendamentos_detalhados,
+        "mes_atual": mes_atual,
+        "ano_atual": ano_atual,
+        "prof_slug_filtro": prof_slug_filtro,
+        "mes_nome": MESES.get(mes_atual, ""),
+        "hoje": timezone.now(),
+    }
+
+
+MONTADORES = {
+    "clientes": montar_clientes,
+    "faturamento": montar_faturamento,
+}
+
+
+# ------------------------------------------------------------------
+# Planilhas (CSV/XLSX em fluxo, ver planilhas.py)
+# ------------------------------------------------------------------
+
+# Mesmas colunas da tela de clientes
+CABECALHO_CLIENTES = ("Nome", "Telefone", "Profissional", "Última visita", "Último serviço", "Visitas concluídas")
+CABECALHO_FATURAMENTO = ("Data", "Hora", "Cliente", "Telefone", "Profissional", "Serviço",
+                         "Valor (R$)", "Pagamento")
+
+
+def linhas_clientes(filtros):
+    """Uma tupla por cliente, lida em blocos do banco."""
+    if set(filtros) <= {"nome"}:
+        # Sem filtro de agendamento: o cadastro de clientes já tem tudo
+        clientes = Cliente.objects.order_by("nome", "id")
+        if filtros.get("nome"):
+            clientes = clientes.filter(busca.filtro_nome(filtros["nome"]))
+        yield from (
+            (nome, telefone, profissional or "", ultima_visita, ultimo_servico, visitas)
+            for nome, telefone, profissional, ultima_visita, ultimo_servico, visitas in clientes.values_list(
+                "nome", "telefone", "ultimo_profissional__nome", "ultima_visita", "ultimo_servico",
+                "visitas_concluidas",
+            ).iterator(chunk_size=TAMANHO_BLOCO)
+        )
+        return
+
+    for c in resumo_por_cliente(agendamentos_clientes(filtros)):
+        yield (c["nome"], c["telefone"], c["profissional"], c["ultima_visita"], c["ultimo_servico"],
+               c["total_visitas"])
+
+
+def linhas_faturamento(filtros):
+    """Uma tupla por agendamento faturado, em ordem cronológica, lida em blocos do banco."""
+    pagamentos = dict(Agendamento._meta.get_field("pagamento_status").choices)
+    consulta = agendamentos_faturamento(filtros).order_by("data", "hora_backup", "id").values_list(
+        "data", "hora_backup", "nome", "telefone", "profissional__nome",
+        "servico_nome_snapshot", "servico__nome", "valor_total", "pagamento_status",
+    )
+    for data, hora, nome, telefone, profissional, snapshot, servico, valor, pagamento in consulta.iterator(
+        chunk_size=TAMANHO_BLOCO
+    ):
+        yield (data, hora, nome, telefone, profissional, snapshot or servico or "", valor,
+               pagamentos.get(pagamento, pagamento))
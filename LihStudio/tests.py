@@ -1,12 +1,41 @@
 # LihStudio/tests.py
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import re
+import socketserver
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.template.loader import get_template
+from django.test import TestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
 from datetime import date, time, timedelta
 from decimal import Decimal # Importe o Decimal para preços
 from django.core.exceptions import ValidationError
 
+from . import busca, faturamento, gateway, horarios, pagamentos, painel, pdf_reportlab, relatorios, transicoes
+from .clientes import normalizar_telefone, resumo_por_cliente
+
 # Importe TODOS os modelos que você vai precisar
-from .models import HorarioDisponivel, Agendamento, Profissional, Servico
+from .models import (
+    HorarioDisponivel, Agendamento, Profissional, Servico, Cliente, EmailSaida, ExcecaoDisponibilidade,
+    ExportacaoRelatorio, FaturamentoMensal, NotificacaoPagamento, RegraDisponibilidade,
+)
 
 class AgendamentoModelTest(TestCase):
     
@@ -104,4 +133,1357 @@ class AgendamentoModelTest(TestCase):
         )
         
         with self.assertRaises(ValidationError, msg="Não levantou ValidationError para hora passada."):
-            agendamento.full_clean()
\ No newline at end of file
+            agendamento.full_clean()
+
+
+class DisponibilidadeCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = Profissional.objects.create(nome="Cache Pro", slug="cache-pro")
+        self.servico = Servico.objects.create(nome="Servico Cache", preco=Decimal("80.00"))
+        self.data = timezone.now().date() + timedelta(days=3)
+        self.horario = HorarioDisponivel.objects.create(
+            profissional=self.profissional, data=self.data, hora=time(10, 0)
+        )
+        self.url = reverse('agendar_servico') + "?profissional=cache-pro"
+
+    def test_pagina_com_cache_quente_faz_uma_consulta(self):
+        """Com o calendário em cache, a página só consulta a lista de profissionais."""
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(list(response.context['datas_disponiveis']), [self.data])
+
+    def test_alterar_servico_invalida_a_lista_do_formulario(self):
+        self.assertEqual(self.client.get(self.url).context['servicos'], [self.servico])
+
+        novo = Servico.objects.create(nome="Outro Servico", preco=Decimal("40.00"), ordem=-1)
+        self.assertEqual(self.client.get(self.url).context['servicos'], [novo, self.servico])
+
+        self.servico.ativo = False
+        self.servico.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['servicos'], [novo])
+        self.assertNotContains(response, "Servico Cache")
+
+    def test_reserva_invalida_o_calendario(self):
+        """Ocupar o horário pelo POST tira a data do calendário."""
+        self.client.get(self.url)
+        self.client.post(reverse('agendar_servico'), {
+            'nome': "Cliente", 'telefone': "11999999999", 'email': "c@example.com",
+            'servico': self.servico.id, 'data': self.data.isoformat(),
+            'hora': self.horario.id, 'profissional': self.profissional.id,
+        })
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context['datas_disponiveis']), [])
+
+    def test_liberar_horario_invalida_o_calendario(self):
+        """Salvar o horário (criar/liberar) também muda a versão da agenda."""
+        self.horario.disponivel = False
+        self.horario.save()
+        self.assertEqual(list(self.client.get(self.url).context['datas_disponiveis']), [])
+
+        self.horario.disponivel = True
+        self.horario.save()
+        self.assertEqual(list(self.client.get(self.url).context['datas_disponiveis']), [self.data])
+
+
+class DisponibilidadeApiTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = Profissional.objects.create(nome="Api Pro", slug="api-pro")
+        self.data = timezone.now().date() + timedelta(days=2)
+        self.horario = HorarioDisponivel.objects.create(
+            profissional=self.profissional, data=self.data, hora=time(9, 30)
+        )
+        self.url = reverse('disponibilidade_api')
+        self.params = {'profissional': 'api-pro', 'mes': self.data.strftime('%Y-%m')}
+
+    def test_retorna_horarios_do_mes(self):
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['datas'], {self.data.isoformat(): [[self.horario.id, "09:30"]]})
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_revalidacao_devolve_304_ate_a_agenda_mudar(self):
+        etag = self.client.get(self.url, self.params)['ETag']
+
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.horario.disponivel = False
+        self.horario.save()
+        response = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['datas'], {})
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(self.url, {'profissional': 'nao-existe'}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'profissional': 'api-pro', 'mes': '2025-13'}).status_code, 400)
+
+    def test_pagina_sem_data_ja_traz_o_formulario_ligado_a_api(self):
+        """Escolher a data não recarrega a página: o formulário vem pronto e a data chega pela API."""
+        response = self.client.get(reverse('agendar_servico'), {'profissional': 'api-pro'})
+        self.assertContains(response, 'id="agendamento-form"')
+        self.assertContains(response, f'data-disponibilidade-url="{self.url}?profissional=api-pro"')
+
+        # O POST montado pelo navegador (data + horário vindos do JSON) é aceito
+        servico = Servico.objects.create(nome="Servico Api", preco=Decimal("60.00"))
+        horario_id, _ = self.client.get(self.url, self.params).json()['datas'][self.data.isoformat()][0]
+        self.client.post(reverse('agendar_servico'), {
+            'nome': "Cliente", 'telefone': "11999999999", 'email': "c@example.com",
+            'servico': servico.id, 'data': self.data.isoformat(),
+            'hora': horario_id, 'profissional': self.profissional.id,
+        })
+        self.assertTrue(Agendamento.objects.filter(hora_id=horario_id).exists())
+
+
+class PlanoDeConsultaTest(TestCase):
+    """
+    Captura as consultas das telas mais acessadas e confere, via EXPLAIN,
+    que nenhuma delas varre Agendamento/HorarioDisponivel sem índice.
+    """
+
+    TABELAS = (Agendamento._meta.db_table, HorarioDisponivel._meta.db_table)
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = Profissional.objects.create(nome="Plano Pro", slug="plano-pro")
+        self.servico = Servico.objects.create(nome="Servico Plano", preco=Decimal("50.00"))
+        hoje = timezone.now().date()
+        for offset in range(-3, 4):
+            horario = HorarioDisponivel.objects.create(
+                profissional=self.profissional, data=hoje + timedelta(days=offset), hora=time(10, 0)
+            )
+            Agendamento.objects.create(
+                profissional=self.profissional, servico=self.servico, nome=f"Cliente {offset}",
+                telefone="1199999000{}".format(offset + 3), email="c@example.com",
+                data=horario.data, hora=horario if offset > 0 else None,
+                status="concluido" if offset < 0 else "pendente", contabilizar=True,
+            )
+        self.admin = User.objects.create_superuser("dona", "dona@example.com", "senha-forte-123")
+
+    @contextmanager
+    def capturar_consultas(self):
+        consultas = []
+
+        def wrapper(execute, sql, params, many, context):
+            consultas.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield consultas
+
+    def varreduras_completas(self, consultas):
+        """Retorna os planos que leem uma das tabelas quentes sem índice."""
+        problemas = []
+        for sql, params in consultas:
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            if not any(f'"{tabela}"' in sql for tabela in self.TABELAS):
+                continue
+            with connection.cursor() as cursor:
+                if connection.vendor == "postgresql":
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                    cursor.execute("EXPLAIN " + sql, params)
+                    plano = [linha[0] for linha in cursor.fetchall()]
+                    ruins = [l for l in plano if any(f"Seq Scan on {t.lower()}" in l.lower() for t in self.TABELAS)]
+                else:
+                    cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                    plano = [linha[-1] for linha in cursor.fetchall()]
+                    ruins = [l for l in plano if self.tabelas_varridas(l, sql) & set(self.TABELAS)]
+            if ruins:
+                problemas.append((sql, plano))
+        return problemas
+
+    @staticmethod
+    def tabelas_varridas(linha, sql):
+        """
+        Tabelas lidas por inteiro numa linha do plano do SQLite: 'SCAN t',
+        'SCAN t AS U0', 'SCAN U0' (apelido de subconsulta) ou 'SCAN t USING
+        INDEX i' (o índice inteiro e as linhas). 'USING COVERING INDEX' passa:
+        só o índice é lido (é o caso dos contadores do painel).
+        """
+        varredura = re.fullmatch(r"SCAN (\w+)(?: AS (\w+))?(?: USING (.*))?", linha)
+        if not varredura or (varredura[3] or "").startswith("COVERING INDEX"):
+            return set()
+        # Apelidos do Django nas subconsultas: "LihStudio_agendamento" U0
+        apelidos = {apelido: tabela for tabela, apelido in re.findall(r'"(\w+)"\s+(?:AS\s+)?"?([A-Z]\d+)\b', sql)}
+        return {apelidos.get(nome, nome) for nome in varredura.group(1, 2) if nome}
+
+    def test_reconhece_varreduras_com_apelido(self):
+        agendamento = Agendamento._meta.db_table
+        sql = f'SELECT 1 FROM "{agendamento}" WHERE id IN (SELECT U0."id" FROM "{agendamento}" U0)'
+        for linha in ("SCAN U0", f"SCAN {agendamento} AS U0", f"SCAN {agendamento} USING INDEX x"):
+            self.assertEqual(self.tabelas_varridas(linha, sql), {agendamento})
+        self.assertEqual(self.tabelas_varridas(f"SCAN {agendamento} USING COVERING INDEX x", sql), set())
+        self.assertEqual(self.tabelas_varridas(f"SEARCH {agendamento} USING INDEX x (id=?)", sql), set())
+
+    def assertUsaIndices(self, url):
+        with self.capturar_consultas() as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.varreduras_completas(consultas), [])
+
+    def test_painel_dona(self):
+        self.client.force_login(self.admin)
+        self.assertUsaIndices(reverse('painel_dona'))
+
+    def test_lista_cliente(self):
+        self.client.force_login(self.admin)
+        self.assertUsaIndices(reverse('lista_clientes'))
+
+    def test_relatorio_faturamento(self):
+        self.client.force_login(self.admin)
+        self.assertUsaIndices(reverse('relatorio_faturamento'))
+
+    def test_agendar_servico(self):
+        data = (timezone.now().date() + timedelta(days=1)).isoformat()
+        self.assertUsaIndices(reverse('agendar_servico') + f"?profissional=plano-pro&data={data}")
+
+
+class SmtpSink:
+    """
+    Servidor SMTP local mínimo para testes: aceita tudo e guarda as
+    mensagens recebidas. Com `falhar=True` recusa o DATA (erro 451).
+    """
+
+    def __init__(self, falhar=False):
+        self.mensagens = []
+        self.conexoes = 0
+        self.falhar = falhar
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def responder(self, texto):
+                self.wfile.write((texto + "\r\n").encode())
+
+            def handle(self):
+                sink.conexoes += 1
+                self.responder("220 sink ESMTP")
+                for linha in self.rfile:
+                    comando = linha.decode().strip().upper()
+                    if comando == "DATA":
+                        self.responder("354 termine com <CRLF>.<CRLF>")
+                        corpo = []
+                        for linha_dados in self.rfile:
+                            if linha_dados in (b".\r\n", b".\n"):
+                                break
+                            corpo.append(linha_dados)
+                        if sink.falhar:
+                            self.responder("451 tente mais tarde")
+                        else:
+                            sink.mensagens.append(b"".join(corpo))
+                            self.responder("250 OK")
+                    elif comando == "QUIT":
+                        self.responder("221 tchau")
+                        return
+                    else:  # EHLO/HELO, MAIL, RCPT, RSET, NOOP
+                        self.responder("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.porta = self.server.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def settings(self):
+        return override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.porta,
+            EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+        )
+
+
+class CaixaDeSaidaTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Email Pro", slug="email-pro")
+        self.servico = Servico.objects.create(nome="Servico Email", preco=Decimal("70.00"))
+        self.data = timezone.now().date() + timedelta(days=4)
+        self.horario = HorarioDisponivel.objects.create(
+            profissional=self.profissional, data=self.data, hora=time(15, 0)
+        )
+
+    def agendar(self):
+        return self.client.post(reverse('agendar_servico'), {
+            'nome': "Cliente", 'telefone': "11999999999", 'email': "cliente@example.com",
+            'servico': self.servico.id, 'data': self.data.isoformat(),
+            'hora': self.horario.id, 'profissional': self.profissional.id,
+        })
+
+    def test_agendamento_enfileira_em_vez_de_enviar(self):
+        self.assertRedirects(self.agendar(), reverse('sucesso'))
+        self.assertEqual(len(mail.outbox), 0)
+        email = EmailSaida.objects.get()
+        self.assertEqual(email.destinatarios, ["cliente@example.com"])
+        self.assertEqual(email.status, "pendente")
+        self.assertIn("RM Studio", email.html)
+
+    def test_worker_envia_tudo_em_uma_conexao(self):
+        for _ in range(3):
+            EmailSaida.objects.create(assunto="Oi", texto="corpo", html="<p>corpo</p>",
+                                      remetente="studio@example.com", destinatarios=["a@example.com"])
+
+        with SmtpSink() as sink, sink.settings():
+            call_command('enviar_emails', stdout=StringIO())
+
+        self.assertEqual(len(sink.mensagens), 3)
+        self.assertEqual(sink.conexoes, 1)
+        self.assertFalse(EmailSaida.objects.exclude(status="enviado").exists())
+
+    def test_falha_reagenda_com_backoff(self):
+        email = EmailSaida.objects.create(assunto="Oi", texto="corpo", destinatarios=["a@example.com"])
+
+        with SmtpSink(falhar=True) as sink, sink.settings():
+            call_command('enviar_emails', stdout=StringIO(), stderr=StringIO())
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, "pendente")
+        self.assertEqual(email.tentativas, 1)
+        self.assertGreater(email.proxima_tentativa, timezone.now())
+        self.assertIn("451", email.ultimo_erro)
+
+
+class BenchmarkAgendamentosTest(TestCase):
+
+    def test_recusa_sem_debug_nem_confirmacao(self):
+        with self.assertRaisesMessage(CommandError, "--confirmar"):
+            call_command('benchmark_agendamentos', stdout=StringIO())
+        self.assertFalse(Profissional.objects.exists())
+
+
+class GeracaoHorariosTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Gera Pro", slug="gera-pro")
+        self.admin = User.objects.create_superuser("dona-gera", "dona@example.com", "senha-forte-123")
+        self.client.force_login(self.admin)
+        # Próxima segunda-feira
+        hoje = timezone.now().date()
+        self.segunda = hoje + timedelta(days=7 - hoje.weekday())
+        HorarioDisponivel.objects.create(profissional=self.profissional, data=self.segunda, hora=time(9, 0))
+
+    def gerar(self, **extra):
+        dados = {
+            'dias': ['1'], 'horario_inicio': '09:00', 'horario_fim': '10:00', 'intervalo': 30,
+            'profissional': 'gera-pro', 'data_inicio_auto': self.segunda.isoformat(),
+            'data_fim_auto': (self.segunda + timedelta(days=7)).isoformat(),
+        }
+        dados.update(extra)
+        return self.client.post(reverse('gerar_horarios'), dados, follow=True)
+
+    def test_simulacao_conta_sem_gravar(self):
+        self.profissional.refresh_from_db()
+        versao = self.profissional.versao_disponibilidade
+        response = self.gerar(simular='1')
+        # Duas segundas x (09:00, 09:30, 10:00), uma já existente
+        self.assertContains(response, "5 novos horários seriam criados e 1 já existem")
+        self.assertEqual(HorarioDisponivel.objects.count(), 1)
+        self.profissional.refresh_from_db()
+        self.assertEqual(self.profissional.versao_disponibilidade, versao)
+
+    def test_geracao_cria_apenas_os_faltantes(self):
+        self.profissional.refresh_from_db()
+        versao = self.profissional.versao_disponibilidade
+        self.gerar()
+        self.assertEqual(HorarioDisponivel.objects.filter(profissional=self.profissional).count(), 6)
+        self.profissional.refresh_from_db()
+        self.assertEqual(self.profissional.versao_disponibilidade, versao + 1)
+
+        self.gerar()
+        self.assertEqual(HorarioDisponivel.objects.count(), 6)
+
+
+class RegraDisponibilidadeTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = Profissional.objects.create(nome="Regra Pro", slug="regra-pro")
+        self.amanha = timezone.now().date() + timedelta(days=1)
+        self.regra = RegraDisponibilidade.objects.create(
+            profissional=self.profissional, dias_semana="1,2,3,4,5,6,7",
+            hora_inicio=time(9, 0), hora_fim=time(10, 0), intervalo=30,
+            valida_de=self.amanha, valida_ate=self.amanha + timedelta(days=1),
+        )
+        ExcecaoDisponibilidade.objects.create(
+            profissional=self.profissional, data=self.amanha, hora_inicio=time(9, 30), hora_fim=time(10, 0),
+        )
+        self.url = reverse('agendar_servico') + "?profissional=regra-pro"
+
+    def horas(self, data):
+        return list(HorarioDisponivel.objects.filter(profissional=self.profissional, data=data)
+                    .values_list("hora", flat=True))
+
+    def test_regra_materializa_ao_salvar_respeitando_excecoes(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(list(response.context['datas_disponiveis']),
+                         [self.amanha, self.amanha + timedelta(days=1)])
+        self.assertEqual(self.horas(self.amanha), [time(9, 0)])
+        self.assertEqual(self.horas(self.amanha + timedelta(days=1)), [time(9, 0), time(9, 30), time(10, 0)])
+
+    def test_pagina_nao_grava(self):
+        HorarioDisponivel.objects.all().delete()
+        RegraDisponibilidade.objects.update(materializada_ate=None)
+        cache.clear()
+
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context['datas_disponiveis']), [])
+        self.assertFalse(HorarioDisponivel.objects.exists())
+        self.assertIsNone(RegraDisponibilidade.objects.get().materializada_ate)
+
+    def test_horario_excluido_nao_volta(self):
+        call_command('materializar_horarios', stdout=StringIO())
+        HorarioDisponivel.objects.get(data=self.amanha, hora=time(9, 0)).delete()
+
+        call_command('materializar_horarios', stdout=StringIO())
+        cache.clear()
+        self.client.get(self.url)
+        self.assertEqual(self.horas(self.amanha), [])
+
+    def test_excluir_excecao_devolve_os_horarios(self):
+        call_command('materializar_horarios', stdout=StringIO())
+        ExcecaoDisponibilidade.objects.get().delete()
+        self.assertEqual(self.horas(self.amanha), [time(9, 0), time(9, 30), time(10, 0)])
+
+    def test_excecao_criada_por_engano_nao_apaga_horario_manual(self):
+        depois = self.amanha + timedelta(days=1)
+        HorarioDisponivel.objects.create(profissional=self.profissional, data=depois, hora=time(14, 0))
+
+        excecao = ExcecaoDisponibilidade.objects.create(profissional=self.profissional, data=depois)
+        self.assertEqual(self.horas(depois), [time(14, 0)])
+
+        excecao.delete()
+        self.assertEqual(self.horas(depois), [time(9, 0), time(9, 30), time(10, 0), time(14, 0)])
+
+
+class ExclusaoEmLoteTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Lote Pro", slug="lote-pro")
+        self.servico = Servico.objects.create(nome="Servico Lote", preco=Decimal("30.00"))
+        hoje = timezone.now().date()
+        self.horarios = [
+            HorarioDisponivel.objects.create(profissional=self.profissional, data=hoje - timedelta(days=d), hora=time(8, 0))
+            for d in range(1, 6)
+        ]
+        self.agendamento = Agendamento.objects.create(
+            profissional=self.profissional, servico=self.servico, nome="Cliente", telefone="11999999999",
+            email="c@example.com", data=self.horarios[0].data, hora=self.horarios[0],
+        )
+        # Linha antiga, gravada antes de existir o backup
+        Agendamento.objects.filter(pk=self.agendamento.pk).update(hora_backup=None)
+
+    def test_exclui_em_lotes_soltando_os_agendamentos(self):
+        chamadas = []
+        with mock.patch.object(horarios, "TAMANHO_LOTE", 2):
+            total = horarios.excluir_horarios(HorarioDisponivel.objects.all(), progresso=lambda *a: chamadas.append(a))
+
+        self.assertEqual(total, 5)
+        self.assertEqual(chamadas, [(2, 5), (4, 5), (5, 5)])
+        self.assertFalse(HorarioDisponivel.objects.exists())
+        self.agendamento.refresh_from_db()
+        self.assertIsNone(self.agendamento.hora)
+        self.assertEqual(self.agendamento.hora_backup, time(8, 0))
+
+    def test_comando_por_periodo(self):
+        inicio, fim = self.horarios[2].data, self.horarios[1].data
+        saida = StringIO()
+        call_command('excluir_horarios', '--periodo', inicio.isoformat(), fim.isoformat(), stdout=saida)
+        self.assertIn("2/2 horários excluídos", saida.getvalue())
+        self.assertEqual(HorarioDisponivel.objects.count(), 3)
+
+
+class ContadoresPainelTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = Profissional.objects.create(nome="Painel Pro", slug="painel-pro")
+        hoje = timezone.now().date()
+        dados = dict(profissional=self.profissional, email="c@example.com")
+        self.pendente = Agendamento.objects.create(nome="Ana", telefone="1", data=hoje, **dados)
+        Agendamento.objects.create(nome="Ana", telefone="1", data=hoje + timedelta(days=2), status="confirmado", **dados)
+        Agendamento.objects.create(nome="Bia", telefone="2", data=hoje - timedelta(days=1), status="cancelado", **dados)
+
+    def test_uma_consulta_e_cache(self):
+        # Uma agregação em Agendamento + a contagem da tabela Cliente
+        with self.assertNumQueries(2):
+            contadores = painel.contadores()
+        self.assertEqual(contadores, {
+            'hoje': 1, 'confirmados': 1, 'pendentes': 1, 'cancelados': 1, 'futuros': 1,
+            'pagamento_pendente': 1, 'passados_pendentes': 0, 'clientes': 2,
+        })
+        with self.assertNumQueries(0):
+            painel.contadores()
+
+    def test_mudanca_de_status_invalida(self):
+        painel.contadores()
+        self.pendente.status = "cancelado"
+        self.pendente.save()
+        contadores = painel.contadores()
+        self.assertEqual((contadores['pendentes'], contadores['cancelados'], contadores['hoje']), (0, 2, 0))
+
+
+class ListasPainelTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Lista Pro", slug="lista-pro")
+        self.servico = Servico.objects.create(nome="Servico Lista", preco=Decimal("40.00"))
+        hoje = date.today()
+        for i in range(30):
+            Agendamento.objects.create(
+                profissional=self.profissional, servico=self.servico, nome=f"Futuro {i}", telefone="1",
+                email="c@example.com", data=hoje + timedelta(days=1 + i % 3), hora_backup=time(8 + i % 4, 0),
+            )
+        self.admin = User.objects.create_superuser("dona-lista", "dona@example.com", "senha-forte-123")
+        self.client.force_login(self.admin)
+
+    def test_rolagem_percorre_tudo_sem_repetir(self):
+        response = self.client.get(reverse('painel_dona'))
+        nomes = [ag.nome for ag in response.context['agendamentos_futuros']]
+        proximo = response.context['proximo_futuros']
+        self.assertEqual(len(nomes), painel.TAMANHO_PAGINA)
+
+        url = reverse('painel_lista', args=['futuros'])
+        while proximo:
+            # Uma consulta por página (sessão/usuário à parte), sem N+1 nas linhas
+            with self.assertNumQueries(3):
+                dados = self.client.get(url, {'apos': proximo}).json()
+            nomes += re.findall(r"<strong>(Futuro \d+)</strong>", dados['html'])
+            proximo = dados['proximo']
+
+        self.assertEqual(sorted(nomes), sorted(f"Futuro {i}" for i in range(30)))
+
+    def test_cursor_invalido_e_lista_desconhecida(self):
+        self.assertEqual(self.client.get(reverse('painel_lista', args=['futuros']), {'apos': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('painel_lista', args=['nada'])).status_code, 404)
+
+    def test_painel_funcionario_e_lista_restrita(self):
+        funcionario = User.objects.create_user("func-lista", "f@example.com", "senha-forte-123", is_staff=True)
+        self.client.force_login(funcionario)
+        response = self.client.get(reverse('painel_funcionario'))
+        self.assertEqual(len(response.context['agendamentos_futuros']), painel.TAMANHO_PAGINA)
+        self.assertContains(response, 'data-alvo=".lista-paginada"')
+
+        proximo = response.context['proximo_futuros']
+        self.assertEqual(self.client.get(reverse('painel_lista', args=['funcionario_futuros']), {'apos': proximo}).status_code, 200)
+        self.assertEqual(self.client.get(reverse('painel_lista', args=['futuros']), {'apos': proximo}).status_code, 403)
+
+
+class GradeHorariosApiTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Grade Pro", slug="grade-pro")
+        HorarioDisponivel.objects.bulk_create(
+            HorarioDisponivel(profissional=self.profissional, data=date(2025, 1, 1) + timedelta(days=d), hora=time(h, 0))
+            for d in range(40) for h in (9, 10, 11)
+        )
+        self.admin = User.objects.create_superuser("dona-grade", "dona@example.com", "senha-forte-123")
+        self.client.force_login(self.admin)
+        self.url = reverse('buscar_horarios_api')
+
+    def test_modo_cursor_percorre_em_ordem_sem_count(self):
+        vistos, cursor = [], ''
+        while True:
+            with self.capturar() as consultas:
+                dados = self.client.get(self.url, {'cursor': cursor}).json()
+            self.assertFalse(any("COUNT(" in sql.upper() for sql in consultas))
+            self.assertNotIn('total_items', dados)
+            vistos += [(h['data'], h['hora']) for h in dados['horarios']]
+            if not dados['has_next']:
+                break
+            cursor = dados['proximo']
+
+        self.assertEqual(len(vistos), 120)
+        self.assertEqual(len(set(vistos)), 120)
+        self.assertEqual(vistos[:2], [("01/01/2025", "09:00"), ("01/01/2025", "10:00")])
+
+    def test_busca_dia_mes_usa_intervalos(self):
+        with self.capturar() as consultas:
+            dados = self.client.get(self.url, {'cursor': '', 'search': '05/02'}).json()
+        self.assertEqual({h['data'] for h in dados['horarios']}, {"05/02/2025"})
+        self.assertFalse(any("django_date_extract" in sql or "EXTRACT(" in sql.upper() for sql in consultas))
+
+        dados = self.client.get(self.url, {'cursor': '', 'search': '/2'}).json()
+        self.assertEqual(len(dados['horarios']), 9 * 3)  # 01/02 a 09/02
+
+        # Modo antigo por página continua igual
+        dados = self.client.get(self.url, {'page': 2, 'search': '1'}).json()
+        self.assertEqual(dados['total_items'], (31 + 1) * 3)  # janeiro inteiro + 01/02
+
+    @contextmanager
+    def capturar(self):
+        consultas = []
+
+        def wrapper(execute, sql, params, many, context):
+            consultas.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(wrapper):
+            yield consultas
+
+
+class ClienteTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Cli Pro", slug="cli-pro")
+        self.servico = Servico.objects.create(nome="Servico Cli", preco=Decimal("60.00"))
+        self.admin = User.objects.create_superuser("dona-cli", "dona@example.com", "senha-forte-123")
+
+    def agendar(self, telefone, data, **extra):
+        return Agendamento.objects.create(
+            profissional=self.profissional, servico=self.servico, nome="Carla", telefone=telefone,
+            email="carla@example.com", data=data, **extra
+        )
+
+    def test_normalizar_telefone(self):
+        self.assertEqual(normalizar_telefone("(83) 99999-0000"), "83999990000")
+        self.assertEqual(normalizar_telefone("+55 83 99999 0000"), "83999990000")
+
+    def test_mantido_a_cada_agendamento(self):
+        hoje = timezone.now().date()
+        primeiro = self.agendar("(83) 99999-0000", hoje - timedelta(days=10), status="concluido")
+        segundo = self.agendar("83 999990000", hoje - timedelta(days=2))
+
+        cliente = Cliente.objects.get()
+        self.assertEqual((primeiro.cliente_id, segundo.cliente_id), (cliente.id, cliente.id))
+        self.assertEqual(cliente.visitas_concluidas, 1)
+        self.assertEqual(cliente.ultima_visita, hoje - timedelta(days=2))
+        self.assertEqual(cliente.ultimo_servico, "Servico Cli")
+
+        segundo.status = "concluido"
+        segundo.save()
+        self.assertEqual(Cliente.objects.get().visitas_concluidas, 2)
+
+        primeiro.delete()
+        segundo.delete()
+        self.assertFalse(Cliente.objects.exists())
+
+    def test_lista_le_a_tabela_de_clientes(self):
+        self.agendar("83999990000", timezone.now().date(), status="concluido")
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(5):  # sessão, usuário, clientes, serviços, profissionais
+            response = self.client.get(reverse('lista_clientes'))
+        self.assertEqual([(c['nome'], c['total_visitas']) for c in response.context['clientes']], [("Carla", 1)])
+
+        response = self.client.get(reverse('lista_clientes'), {'status': 'pendente'})
+        self.assertEqual(response.context['clientes'], [])
+
+    def test_popular_clientes(self):
+        ag = self.agendar("83999990000", timezone.now().date())
+        Agendamento.objects.filter(pk=ag.pk).update(cliente=None)
+        Cliente.objects.all().delete()
+
+        call_command('popular_clientes', stdout=StringIO())
+        call_command('popular_clientes', stdout=StringIO())  # repetir não duplica
+
+        cliente = Cliente.objects.get()
+        ag.refresh_from_db()
+        self.assertEqual(ag.cliente_id, cliente.id)
+        self.assertEqual(cliente.ultima_visita, ag.data)
+
+    def test_migracao_preenche_clientes(self):
+        migracao = importlib.import_module("LihStudio.migrations.0009_cliente")
+        hoje = timezone.now().date()
+        self.agendar("(83) 99999-0000", hoje - timedelta(days=3), status="concluido")
+        self.agendar("83999990000", hoje)
+        Agendamento.objects.update(cliente=None)
+        Cliente.objects.all().delete()
+
+        migracao.popular_clientes(apps, None)
+
+        cliente = Cliente.objects.get()
+        self.assertEqual((cliente.visitas_concluidas, cliente.ultima_visita), (1, hoje))
+        self.assertEqual(set(Agendamento.objects.values_list("cliente_id", flat=True)), {cliente.id})
+
+
+class BuscaClienteTest(TestCase):
+
+    def setUp(self):
+        profissional = Profissional.objects.create(nome="Busca Pro", slug="busca-pro")
+        servico = Servico.objects.create(nome="Servico Busca", preco=Decimal("40.00"))
+        for nome, telefone in [("Cláudia Souza", "83911110000"), ("Ana Júlia", "83922220000"), ("Marta", "83933330000")]:
+            Agendamento.objects.create(
+                profissional=profissional, servico=servico, nome=nome, telefone=telefone,
+                data=timezone.now().date(),
+            )
+        self.admin = User.objects.create_superuser("dona-busca", "dona@example.com", "senha-forte-123")
+
+    def buscar(self, termo):
+        return sorted(Cliente.objects.filter(busca.filtro_nome(termo)).values_list("nome", flat=True))
+
+    def test_normalizar_nome(self):
+        self.assertEqual(busca.normalizar_nome("  Cláudia  MARIA "), "claudia maria")
+
+    def test_ignora_acentos_e_maiusculas(self):
+        self.assertEqual(self.buscar("claudia"), ["Cláudia Souza"])
+        self.assertEqual(self.buscar("JULIA"), ["Ana Júlia"])
+        self.assertEqual(self.buscar("a"), ["Ana Júlia", "Cláudia Souza", "Marta"])  # termo curto
+        self.assertEqual(self.buscar('"x'), [])
+
+    def test_views_usam_a_busca(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('lista_clientes'), {'nome': 'claudia'})
+        self.assertEqual([c['nome'] for c in response.context['clientes']], ["Cláudia Souza"])
+
+        response = self.client.get(reverse('lista_clientes'), {'nome': 'claudia', 'status': 'pendente'})
+        self.assertEqual([c['nome'] for c in response.context['clientes']], ["Cláudia Souza"])
+
+
+class ResumoClientesTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Resumo Pro", slug="resumo-pro")
+        self.servico = Servico.objects.create(nome="Servico Atual", preco=Decimal("50.00"))
+        self.admin = User.objects.create_superuser("dona-resumo", "dona@example.com", "senha-forte-123")
+
+    def agendar(self, nome, dias_atras, **extra):
+        return Agendamento.objects.create(
+            profissional=self.profissional, servico=self.servico, nome=nome, telefone="83944440000",
+            data=timezone.now().date() - timedelta(days=dias_atras), **extra
+        )
+
+    def test_uma_linha_por_cliente_com_o_ultimo_agendamento(self):
+        self.agendar("Bia", 30, status="concluido")
+        self.agendar("Bia", 20, status="concluido", servico_nome_snapshot="Servico Antigo")
+        self.agendar("Caio", 5, status="cancelado")
+
+        linhas = list(resumo_por_cliente(Agendamento.objects.all()))
+        self.assertEqual([(l["nome"], l["total_visitas"], l["ultimo_servico"], l["status"]) for l in linhas], [
+            ("Bia", 2, "Servico Antigo", "concluido"),
+            ("Caio", 0, "Servico Atual", "cancelado"),
+        ])
+
+    def test_pdf_nao_faz_uma_consulta_por_agendamento(self):
+        for dias in range(6):
+            self.agendar(f"Cliente {dias}", dias)
+        template, contexto = relatorios.montar_clientes({})
+        with self.assertNumQueries(1):
+            get_template(template).render(contexto)
+
+
+class ExportacaoRelatorioTest(TestCase):
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        configuracao = override_settings(RELATORIOS_DIR=self.diretorio.name)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.addCleanup(self.diretorio.cleanup)
+
+        self.profissional = Profissional.objects.create(nome="Export Pro", slug="export-pro")
+        self.servico = Servico.objects.create(nome="Servico Export", preco=Decimal("70.00"))
+        self.agendar()
+        self.admin = User.objects.create_superuser("dona-export", "dona@example.com", "senha-forte-123")
+        self.client.force_login(self.admin)
+
+    def agendar(self):
+        return Agendamento.objects.create(
+            profissional=self.profissional, servico=self.servico, nome="Eva", telefone="83955550000",
+            data=timezone.now().date(), status="concluido", valor_total=Decimal("70.00"), contabilizar=True,
+        )
+
+    def test_pedido_igual_reaproveita_o_arquivo(self):
+        response = self.client.get(reverse('exportar_clientes_pdf'), {'nome': 'eva'})
+        self.assertTemplateUsed(response, 'LihStudio/exportacao_aguarde.html')
+        self.client.get(reverse('exportar_clientes_pdf'), {'nome': 'eva', 'ignorado': '1'})
+        exportacao = ExportacaoRelatorio.objects.get()
+
+        call_command('gerar_relatorios', stdout=StringIO())
+        exportacao.refresh_from_db()
+        self.assertEqual(exportacao.status, 'pronto')
+        self.assertTrue(os.path.exists(relatorios.caminho(exportacao)))
+
+        status = self.client.get(reverse('status_exportacao', args=[exportacao.id])).json()
+        self.assertEqual(status['download'], reverse('baixar_exportacao', args=[exportacao.id]))
+
+        response = self.client.get(reverse('exportar_clientes_pdf'), {'nome': 'eva'})
+        self.assertRedirects(response, status['download'], fetch_redirect_response=False)
+        response = self.client.get(status['download'])
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+
+    def test_dados_novos_geram_outro_pedido(self):
+        self.client.get(reverse('exportar_faturamento_pdf'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.agendar()
+        self.client.get(reverse('exportar_faturamento_pdf'))
+        self.assertEqual(ExportacaoRelatorio.objects.count(), 2)
+        hoje = timezone.now().date()
+        self.assertEqual(ExportacaoRelatorio.objects.first().filtros, {'mes': str(hoje.month), 'ano': str(hoje.year)})
+
+        call_command('gerar_relatorios', stdout=StringIO())
+        self.assertEqual(set(ExportacaoRelatorio.objects.values_list('status', flat=True)), {'pronto'})
+
+    def test_filtro_invalido(self):
+        response = self.client.get(reverse('exportar_faturamento_pdf'), {'mes': '13'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_versao_muda_depois_do_commit_e_so_com_campos_do_relatorio(self):
+        agendamento = Agendamento.objects.get()
+        versao = relatorios.versao_dados()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            agendamento.preferencia_id = "pref-1"
+            agendamento.save(update_fields=["preferencia_id"])
+        self.assertEqual((callbacks, relatorios.versao_dados()), ([], versao))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            agendamento.valor_total = Decimal("75.00")
+            agendamento.save(update_fields=["valor_total"])
+            self.assertEqual(relatorios.versao_dados(), versao)  # ainda dentro da transação
+        self.assertEqual(relatorios.versao_dados(), versao + 1)
+
+
+class PlanilhasTest(TestCase):
+
+    def setUp(self):
+        profissional = Profissional.objects.create(nome="Planilha Pro", slug="planilha-pro")
+        servico = Servico.objects.create(nome="Servico Planilha", preco=Decimal("90.00"))
+        hoje = timezone.now().date()
+        for nome, data in [("Gabi", hoje.replace(month=1, day=10)), ("Helô <&>", hoje.replace(month=2, day=3))]:
+            Agendamento.objects.create(
+                profissional=profissional, servico=servico, nome=nome, telefone="83966660000", data=data,
+                hora_backup=time(9, 0), status="concluido", valor_total=Decimal("90.00"), contabilizar=True,
+            )
+        self.ano = hoje.year
+        self.client.force_login(User.objects.create_superuser("dona-planilha", "dona@example.com", "senha-forte-123"))
+
+    def baixar(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_csv_de_clientes(self):
+        conteudo = self.baixar(reverse('exportar_clientes_planilha'), formato='csv', nome='helo')
+        linhas = list(csv.reader(io.StringIO(conteudo.decode())))
+        self.assertEqual(linhas[0][0], "Nome")
+        self.assertEqual([l[0] for l in linhas[1:]], ["Helô <&>"])
+
+    def test_xlsx_do_ano_inteiro(self):
+        conteudo = self.baixar(reverse('exportar_faturamento_planilha'), formato='xlsx', periodo='ano',
+                               ano=self.ano, mes=1)
+        with zipfile.ZipFile(io.BytesIO(conteudo)) as pacote:
+            self.assertIn("xl/workbook.xml", pacote.namelist())
+            aba = pacote.read("xl/worksheets/sheet1.xml").decode()
+        self.assertEqual(aba.count("<row>"), 3)  # cabeçalho + 2 agendamentos
+        self.assertIn("Helô &lt;&amp;&gt;", aba)
+        self.assertIn("<c><v>90.00</v></c>", aba)
+
+    def test_formato_invalido(self):
+        response = self.client.get(reverse('exportar_clientes_planilha'), {'formato': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MotorPdfTest(TestCase):
+
+    def setUp(self):
+        profissional = Profissional.objects.create(nome="Motor Pro", slug="motor-pro")
+        servico = Servico.objects.create(nome="Servico Motor", preco=Decimal("80.00"))
+        for i in range(5):
+            Agendamento.objects.create(
+                profissional=profissional, servico=servico, nome=f"Cliente <{i}>", telefone="83977770000",
+                data=timezone.now().date(), status="concluido", valor_total=Decimal("80.00"), contabilizar=True,
+            )
+
+    def desenhar(self, tipo, filtros, motor):
+        template, contexto = relatorios.MONTADORES[tipo](filtros)
+        saida = io.BytesIO()
+        relatorios.desenhar(saida, tipo, template, contexto, motor_pdf=motor)
+        return saida.getvalue()
+
+    def test_reportlab_desenha_os_dois_relatorios(self):
+        with mock.patch.object(pdf_reportlab, "LINHAS_POR_TABELA", 2):
+            for tipo in ("clientes", "faturamento"):
+                filtros = relatorios.filtros_de(tipo, {})
+                self.assertTrue(self.desenhar(tipo, filtros, "reportlab").startswith(b"%PDF"))
+
+    def test_html_continua_disponivel(self):
+        self.assertTrue(self.desenhar("clientes", {}, "html").startswith(b"%PDF"))
+
+    def test_motor_entra_na_chave(self):
+        with override_settings(RELATORIOS_MOTOR="reportlab"):
+            reportlab = relatorios.chave("clientes", {}, 1)
+        with override_settings(RELATORIOS_MOTOR="html"):
+            html = relatorios.chave("clientes", {}, 1)
+        self.assertNotEqual(reportlab, html)
+
+
+class FaturamentoMensalTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Fat Pro", slug="fat-pro")
+        self.servico = Servico.objects.create(nome="Servico Fat", preco=Decimal("100.00"))
+
+    def agendar(self, data, valor="100.00", **extra):
+        dados = dict(status="concluido", contabilizar=True, valor_total=Decimal(valor))
+        dados.update(extra)
+        return Agendamento.objects.create(
+            profissional=self.profissional, servico=self.servico, nome="Fátima", telefone="83988880000",
+            data=data, **dados
+        )
+
+    def consolidado(self):
+        return list(FaturamentoMensal.objects.order_by("ano", "mes").values_list(
+            "ano", "mes", "faturamento_bruto", "total_servicos", "comissao"))
+
+    def test_mantido_a_cada_mudanca(self):
+        ag = self.agendar(date(2025, 3, 10))
+        self.agendar(date(2025, 3, 20), valor="50.00")
+        self.agendar(date(2025, 3, 21), status="pendente")  # não conta
+        self.assertEqual(self.consolidado(), [(2025, 3, Decimal("150.00"), 2, Decimal("45.00"))])
+
+        ag.data = date(2025, 4, 1)
+        ag.save()
+        self.assertEqual(self.consolidado(), [
+            (2025, 3, Decimal("50.00"), 1, Decimal("15.00")),
+            (2025, 4, Decimal("100.00"), 1, Decimal("30.00")),
+        ])
+
+        ag.status = "cancelado"
+        ag.save()
+        self.assertEqual(self.consolidado(), [(2025, 3, Decimal("50.00"), 1, Decimal("15.00"))])
+
+        Agendamento.objects.all().delete()
+        self.assertEqual(self.consolidado(), [])
+
+    def test_reconstruir(self):
+        self.agendar(date(2025, 1, 5))
+        self.agendar(date(2025, 2, 5), valor="80.00")
+        esperado = self.consolidado()
+        FaturamentoMensal.objects.all().delete()
+
+        call_command('reconstruir_faturamento', stdout=StringIO())
+        self.assertEqual(self.consolidado(), esperado)
+
+    def test_migracao_preenche_consolidado(self):
+        self.agendar(date(2025, 1, 5))
+        self.agendar(date(2025, 1, 9), valor="80.00")
+        esperado = self.consolidado()
+        FaturamentoMensal.objects.all().delete()
+
+        importlib.import_module("LihStudio.migrations.0012_faturamento_mensal").consolidar(apps, None)
+        self.assertEqual(self.consolidado(), esperado)
+
+    def test_relatorio_le_o_consolidado(self):
+        self.agendar(date(2025, 6, 2))
+        self.agendar(date(2024, 6, 2), valor="40.00")
+        admin = User.objects.create_superuser("dona-fat", "dona@example.com", "senha-forte-123")
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('relatorio_faturamento'), {'mes': 6, 'ano': 2025})
+        self.assertEqual(response.context['total_bruto_mes'], Decimal("100.00"))
+        self.assertEqual(response.context['faturamento_total_bruto'], Decimal("140.00"))
+        self.assertEqual(response.context['total_comissao_mes'], Decimal("30.00"))
+        self.assertEqual([a['profissional__slug'] for a in response.context['analise_profissionais']], ["fat-pro"])
+
+
+class ServicoFaturamentoTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.profissional = Profissional.objects.create(nome="Serv Pro", slug="serv-pro",
+                                                        comissao_percentual=Decimal("40.00"))
+        self.servico = Servico.objects.create(nome="Servico Serv", preco=Decimal("100.00"))
+
+    def agendar(self, data, valor="100.00"):
+        return Agendamento.objects.create(
+            profissional=self.profissional, servico=self.servico, nome="Sérvulo", telefone="83977770000",
+            data=data, status="concluido", contabilizar=True, valor_total=Decimal(valor),
+        )
+
+    def test_comissao_por_profissional(self):
+        self.agendar(date(2025, 5, 3))
+        self.assertEqual(faturamento.resumo_mes(2025, 5)["total_comissao_mes"], Decimal("40.00"))
+
+        self.profissional.comissao_percentual = Decimal("25.50")
+        self.profissional.save()
+        self.assertEqual(FaturamentoMensal.objects.get().comissao, Decimal("25.50"))
+        self.assertEqual(faturamento.resumo_mes(2025, 5)["total_comissao_mes"], Decimal("25.50"))
+
+    def test_memorizado_ate_mudar_a_versao(self):
+        self.agendar(date(2025, 5, 3))
+        faturamento.resumo_mes(2025, 5)
+        with self.assertNumQueries(1):  # só a leitura da versão
+            resumo = faturamento.resumo_mes(2025, 5)
+        self.assertEqual(resumo["total_bruto_mes"], Decimal("100.00"))
+
+        self.agendar(date(2025, 5, 4), valor="50.00")
+        self.assertEqual(faturamento.resumo_mes(2025, 5)["total_bruto_mes"], Decimal("150.00"))
+
+
+class SerieFaturamentoTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana = Profissional.objects.create(nome="Ana Série", slug="ana-serie")
+        self.bia = Profissional.objects.create(nome="Bia Série", slug="bia-serie")
+        self.servico = Servico.objects.create(nome="Servico Série", preco=Decimal("100.00"))
+        for profissional, data, valor in [(self.ana, date(2024, 12, 5), "100.00"), (self.ana, date(2025, 2, 5), "80.00"),
+                                          (self.bia, date(2025, 2, 9), "50.00"), (self.bia, date(2025, 4, 1), "70.00")]:
+            Agendamento.objects.create(
+                profissional=profissional, servico=self.servico, nome="Cliente Série", telefone="83966660000",
+                data=data, status="concluido", contabilizar=True, valor_total=Decimal(valor),
+            )
+        admin = User.objects.create_superuser("dona-serie", "serie@example.com", "senha-forte-123")
+        self.client.force_login(admin)
+
+    def test_serie_em_uma_consulta(self):
+        with self.assertNumQueries(2):  # versão + consolidado
+            serie = faturamento.serie_mensal((2024, 12), (2025, 3))
+        self.assertEqual(serie["meses"], ["2024-12", "2025-01", "2025-02", "2025-03"])
+        self.assertEqual(serie["total"]["faturamento"],
+                         [Decimal("100.00"), Decimal("0.00"), Decimal("130.00"), Decimal("0.00")])
+        self.assertEqual(serie["total"]["servicos"], [1, 0, 2, 0])
+        bia = next(p for p in serie["profissionais"] if p["slug"] == "bia-serie")
+        self.assertEqual(bia["faturamento"], [Decimal("0.00"), Decimal("0.00"), Decimal("50.00"), Decimal("0.00")])
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('faturamento_serie'),
+                                   {'de': '2025-01', 'ate': '2025-04', 'profissional': 'bia-serie'})
+        self.assertEqual(response.status_code, 200)
+        dados = response.json()
+        self.assertEqual(dados["total"]["faturamento"], ["0.00", "50.00", "0.00", "70.00"])
+        self.assertEqual([p["slug"] for p in dados["profissionais"]], ["bia-serie"])
+
+        response = self.client.get(reverse('faturamento_serie'), {'ate': '2025-04'})
+        self.assertEqual(len(response.json()["meses"]), 12)
+        self.assertEqual(response.json()["meses"][0], "2024-05")
+
+        self.assertEqual(self.client.get(reverse('faturamento_serie'), {'de': '2025-13'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('faturamento_serie'), {'de': '2020-01', 'ate': '2025-12'}).status_code, 400)
+
+        self.client.logout()
+        self.assertRedirects(self.client.get(reverse('faturamento_serie')), reverse('login'),
+                             fetch_redirect_response=False)
+
+
+class WebhookPagamentoTest(TestCase):
+
+    def setUp(self):
+        configuracao = override_settings(MERCADOPAGO_GATEWAY="falso")  # um GatewayFalso novo por teste
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        profissional = Profissional.objects.create(nome="Pag Pro", slug="pag-pro")
+        servico = Servico.objects.create(nome="Servico Pag", preco=Decimal("90.00"))
+        self.agendamento = Agendamento.objects.create(
+            profissional=profissional, servico=servico, nome="Paula", telefone="83955550000",
+            email="paula@example.com", data=date(2030, 1, 10), pagamento_status="pendente",
+        )
+        self.aviso = {"type": "payment", "action": "payment.updated", "data": {"id": "777"}}
+
+    def notificar(self, dados):
+        return self.client.post(reverse('webhook_mercadopago'), json.dumps(dados), content_type="application/json")
+
+    def test_reenvio_nao_duplica(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):  # INSERT ... ON CONFLICT DO UPDATE
+                self.assertEqual(self.notificar(self.aviso).status_code, 200)
+        self.assertEqual(self.notificar({"type": "merchant_order", "data": {"id": "1"}}).status_code, 200)
+        self.assertEqual(list(NotificacaoPagamento.objects.values_list("recurso_id", "acao", "entregas")),
+                         [("777", "payment.updated", 2)])
+        self.assertEqual(self.notificar("lixo").status_code, 400)
+
+    def test_worker_aplica_uma_vez(self):
+        self.notificar(self.aviso)
+        falso = gateway.gateway()
+        falso.pagar(self.agendamento.pk, pagamento_id="777")
+        call_command('processar_pagamentos', stdout=StringIO())
+        call_command('processar_pagamentos', stdout=StringIO())
+
+        self.agendamento.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.pagamento_status), ("confirmado", "aprovado"))
+        self.assertEqual(falso.chamadas, ["consultar_pagamento"])
+        self.assertEqual(EmailSaida.objects.count(), 1)
+        self.assertEqual(NotificacaoPagamento.objects.get().status, "processada")
+
+    def test_falha_volta_para_fila(self):
+        self.notificar(self.aviso)  # o gateway ainda não conhece o pagamento 777
+        call_command('processar_pagamentos', stdout=StringIO(), stderr=StringIO())
+
+        notificacao = NotificacaoPagamento.objects.get()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ("pendente", 1))
+        self.assertGreater(notificacao.proxima_tentativa, timezone.now())
+        self.assertIn("404", notificacao.ultimo_erro)
+
+        # Um worker atrasado que tente processar de novo não reaplica nada
+        gateway.gateway().pagar(self.agendamento.pk, pagamento_id="777")
+        pagamentos.processar(notificacao)
+        self.assertEqual(pagamentos.processar(notificacao), "Já processada")
+        self.assertEqual(EmailSaida.objects.count(), 1)
+
+    def test_nova_mudanca_do_mesmo_pagamento_volta_para_fila(self):
+        falso = gateway.gateway()
+        falso.pagar(self.agendamento.pk, status="in_process", pagamento_id="777")
+        self.notificar(self.aviso)
+        call_command('processar_pagamentos', stdout=StringIO())
+        self.agendamento.refresh_from_db()
+        self.assertEqual(self.agendamento.pagamento_status, "processando")
+
+        # Mesma chave (payment, 777, payment.updated), pagamento agora aprovado
+        falso.pagar(self.agendamento.pk, status="approved", pagamento_id="777")
+        self.notificar(self.aviso)
+        notificacao = NotificacaoPagamento.objects.get()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ("pendente", 0))
+        call_command('processar_pagamentos', stdout=StringIO())
+
+        self.agendamento.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.pagamento_status), ("confirmado", "aprovado"))
+        self.assertEqual(falso.chamadas, ["consultar_pagamento", "consultar_pagamento"])
+        self.assertEqual(NotificacaoPagamento.objects.get().status, "processada")
+
+    def test_entrega_durante_a_consulta_nao_se_perde(self):
+        """Um estorno notificado enquanto o worker consulta o pagamento é consultado de novo."""
+        falso = gateway.gateway()
+        falso.pagar(self.agendamento.pk, pagamento_id="777")
+        self.notificar(self.aviso)
+
+        consultar = falso.consultar_pagamento
+
+        def consultar_e_estornar(pagamento_id):
+            resposta = consultar(pagamento_id)  # ainda aprovado
+            falso.pagar(self.agendamento.pk, status="refunded", pagamento_id="777")
+            self.notificar(self.aviso)
+            return resposta
+
+        with mock.patch.object(falso, "consultar_pagamento", consultar_e_estornar):
+            call_command('processar_pagamentos', stdout=StringIO())
+
+        notificacao = NotificacaoPagamento.objects.get()
+        self.assertEqual((notificacao.status, notificacao.entregas, notificacao.tentativas), ("pendente", 2, 0))
+        self.agendamento.refresh_from_db()
+        self.assertEqual(self.agendamento.pagamento_status, "pendente")  # a aprovação velha foi desfeita
+        self.assertFalse(EmailSaida.objects.exists())
+
+        call_command('processar_pagamentos', stdout=StringIO())
+        self.agendamento.refresh_from_db()
+        self.assertEqual(self.agendamento.pagamento_status, "rejeitado")
+        self.assertEqual(NotificacaoPagamento.objects.get().status, "processada")
+
+
+class GatewayTest(TestCase):
+
+    def test_disjuntor(self):
+        agora = [0.0]
+        disjuntor = gateway.Disjuntor(limite=2, espera=30, relogio=lambda: agora[0])
+        disjuntor.falha()
+        disjuntor.verificar()
+        disjuntor.falha()
+        with self.assertRaises(gateway.GatewayIndisponivel):
+            disjuntor.verificar()
+
+        agora[0] = 31  # passou a espera: uma chamada de teste passa, uma falha reabre
+        disjuntor.verificar()
+        disjuntor.falha()
+        with self.assertRaises(gateway.GatewayIndisponivel):
+            disjuntor.verificar()
+
+    @override_settings(MERCADOPAGO_GATEWAY="mercadopago", MERCADOPAGO_ACCESS_TOKEN="TEST-token",
+                       MERCADOPAGO_TIMEOUT_CONEXAO=1.5, MERCADOPAGO_TIMEOUT_LEITURA=4)
+    def test_cliente_unico_com_timeouts(self):
+        cliente = gateway.gateway()
+        self.assertIs(gateway.gateway(), cliente)
+        self.assertEqual(cliente.http.timeout, (1.5, 4))
+        self.assertIs(cliente.sdk.http_client, cliente.http)
+        tentativas = cliente.http.sessao.get_adapter("https://api.mercadopago.com").max_retries
+        self.assertEqual((tentativas.connect, tentativas.read, tentativas.status), (gateway.TENTATIVAS_HTTP, 0, 0))
+
+        with mock.patch.object(cliente.http.sessao, "request",
+                               return_value=mock.Mock(status_code=200, content=b'{"id": 1}', json=lambda: {"id": 1})) as chamada:
+            self.assertEqual(cliente.consultar_pagamento(1), {"status": 200, "response": {"id": 1}})
+        self.assertEqual(chamada.call_args.kwargs["timeout"], (1.5, 4))
+
+
+class PreferenciaPagamentoTest(TestCase):
+
+    def setUp(self):
+        configuracao = override_settings(MERCADOPAGO_GATEWAY="falso")
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        self.servico = Servico.objects.create(nome="Servico Pref", preco=Decimal("120.00"))
+        self.agendamento = Agendamento.objects.create(
+            profissional=Profissional.objects.create(nome="Pref Pro", slug="pref-pro"), servico=self.servico,
+            nome="Priscila", telefone="83944440000", email="pri@example.com", data=date(2030, 2, 1),
+        )
+        self.url = reverse('criar_pagamento_agendamento', args=[self.agendamento.pk])
+
+    def test_reaproveita_preferencia(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['init_point'], "https://mercadopago.falso/checkout/pref-1")
+        self.agendamento.refresh_from_db()
+        self.assertEqual(self.agendamento.preferencia_valor, Decimal("120.00"))
+        self.assertGreater(self.agendamento.preferencia_expira_em, timezone.now() + timedelta(hours=23))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['preference_id'], "pref-1")
+        self.assertEqual(gateway.gateway().chamadas, ["criar_preferencia"])
+
+    def test_preco_novo_ou_expirada_gera_outra(self):
+        self.client.get(self.url)
+        self.servico.preco = Decimal("150.00")
+        self.servico.save()
+        self.assertEqual(self.client.get(self.url).context['preference_id'], "pref-2")
+
+        Agendamento.objects.filter(pk=self.agendamento.pk).update(preferencia_expira_em=timezone.now())
+        self.assertEqual(self.client.get(self.url).context['preference_id'], "pref-3")
+        self.assertEqual(gateway.gateway().preferencias["pref-3"]["items"][0]["unit_price"], 150.0)
+
+    def test_guardar_preferencia_nao_sobrescreve_status(self):
+        # O worker aprova o pagamento enquanto a view espera a API
+        Agendamento.objects.filter(pk=self.agendamento.pk).update(pagamento_status="aprovado")
+        preferencia = gateway.gateway().criar_preferencia({})["response"]
+        pagamentos.guardar_preferencia(self.agendamento, preferencia, Decimal("120.00"), timezone.now())
+
+        self.agendamento.refresh_from_db()
+        self.assertEqual((self.agendamento.preferencia_id, self.agendamento.pagamento_status), ("pref-1", "aprovado"))
+
+
+class ConciliacaoPagamentosTest(TestCase):
+
+    def setUp(self):
+        configuracao = override_settings(MERCADOPAGO_GATEWAY="falso")
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+        profissional = Profissional.objects.create(nome="Conc Pro", slug="conc-pro")
+        servico = Servico.objects.create(nome="Servico Conc", preco=Decimal("60.00"))
+        self.agendamentos = [
+            Agendamento.objects.create(
+                profissional=profissional, servico=servico, nome=f"Conciliada {i}", telefone=f"8393333000{i}",
+                email=f"conc{i}@example.com", data=date(2030, 3, 1), preferencia_id=f"pref-{i}",
+            )
+            for i in range(3)
+        ]
+        # Criados há uma hora: o webhook já deveria ter chegado
+        Agendamento.objects.update(criado_em=timezone.now() - timedelta(hours=1))
+        self.falso = gateway.gateway()
+
+    def status(self):
+        return [Agendamento.objects.values_list("pagamento_status", flat=True).get(pk=a.pk) for a in self.agendamentos]
+
+    def test_aplica_em_lote(self):
+        aprovado, recusado, sem_pagamento = self.agendamentos
+        self.falso.pagar(aprovado.pk, status="rejected")
+        self.falso.pagar(aprovado.pk, status="approved")
+        self.falso.pagar(recusado.pk, status="rejected")
+
+        call_command('conciliar_pagamentos', stdout=StringIO())
+        self.assertEqual(self.status(), ["aprovado", "rejeitado", "pendente"])
+        self.assertEqual(self.falso.chamadas, ["buscar_pagamentos"])
+        self.assertEqual(EmailSaida.objects.count(), 1)
+
+        # De novo: só o que continua pendente é conferido, sem e-mail repetido
+        call_command('conciliar_pagamentos', stdout=StringIO())
+        self.assertEqual(self.status(), ["aprovado", "rejeitado", "pendente"])
+        self.assertEqual(EmailSaida.objects.count(), 1)
+
+    def test_uma_busca_por_rodada_e_janela(self):
+        Agendamento.objects.filter(pk=self.agendamentos[0].pk).update(criado_em=timezone.now())  # recente demais
+        saida = StringIO()
+        call_command('conciliar_pagamentos', stdout=saida)
+        self.assertEqual(self.falso.chamadas, ["buscar_pagamentos"])
+        self.assertIn("2 agendamento(s) conferido(s)", saida.getvalue())
+
+
+class TransicoesAgendamentoTest(TestCase):
+
+    def setUp(self):
+        self.profissional = Profissional.objects.create(nome="Trans Pro", slug="trans-pro")
+        servico = Servico.objects.create(nome="Servico Trans", preco=Decimal("80.00"))
+        self.horario = HorarioDisponivel.objects.create(profissional=self.profissional, data=date(2030, 4, 2),
+                                                        hora=time(10, 0), disponivel=True)
+        self.agendamento = Agendamento.objects.create(
+            profissional=self.profissional, servico=servico, nome="Tereza", telefone="83922220000",
+            email="tereza@example.com", data=date(2030, 4, 2), hora=self.horario,
+            contabilizar=True, valor_total=Decimal("80.00"),
+        )
+        self.admin = User.objects.create_superuser("dona-trans", "trans@example.com", "senha-forte-123")
+
+    def test_webhook_e_retorno_juntos_processam_uma_vez(self):
+        # Retorno do checkout (pagamento_sucesso) vence; o webhook logo depois não reaplica
+        self.assertIsNotNone(transicoes.aprovar_pagamento(self.agendamento.pk, "55"))
+        resultado = pagamentos.aplicar({"id": 55, "status": "approved", "external_reference": str(self.agendamento.pk)})
+
+        self.assertIn("sem mudança", resultado)
+        self.assertEqual(EmailSaida.objects.count(), 0)
+        self.agendamento.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.pagamento_status), ("confirmado", "aprovado"))
+        self.horario.refresh_from_db()
+        self.assertFalse(self.horario.disponivel)
+
+        # Retorno de falha atrasado (pagamento_falha) não desfaz a aprovação
+        self.assertIsNone(transicoes.recusar_pagamento(self.agendamento.pk))
+        self.agendamento.refresh_from_db()
+        self.assertEqual(self.agendamento.pagamento_status, "aprovado")
+
+    def test_perdedor_custa_um_update(self):
+        Agendamento.objects.filter(pk=self.agendamento.pk).update(status="cancelado")
+        with self.assertNumQueries(3):  # SAVEPOINT, UPDATE sem linhas, RELEASE
+            self.assertIsNone(transicoes.concluir(self.agendamento.pk))
+
+    def test_concluir_e_cancelar_mantem_derivados(self):
+        self.client.force_login(self.admin)
+        versao = self.profissional.versao_disponibilidade
+
+        self.client.get(reverse('concluir_agendamento', args=[self.agendamento.pk]))
+        self.client.get(reverse('concluir_agendamento', args=[self.agendamento.pk]))
+        self.assertEqual(EmailSaida.objects.count(), 1)
+        self.assertEqual(FaturamentoMensal.objects.get().faturamento_bruto, Decimal("80.00"))
+        self.assertEqual(Cliente.objects.get().visitas_concluidas, 1)
+
+        self.client.get(reverse('cancelar_agendamento', args=[self.agendamento.pk]))
+        self.agendamento.refresh_from_db()
+        self.horario.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.hora_id), ("cancelado", None))
+        self.assertTrue(self.horario.disponivel)
+        self.assertFalse(FaturamentoMensal.objects.exists())
+        self.profissional.refresh_from_db()
+        self.assertGreater(self.profissional.versao_disponibilidade, versao)
+
+    def test_estorno_cancela_agendamento_pago(self):
+        transicoes.aprovar_pagamento(self.agendamento.pk, "56")
+        resultado = pagamentos.aplicar({"id": 56, "status": "refunded", "external_reference": str(self.agendamento.pk)})
+
+        self.assertIn("refunded", resultado)
+        self.agendamento.refresh_from_db()
+        self.horario.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.pagamento_status), ("cancelado", "rejeitado"))
+        self.assertTrue(self.horario.disponivel)
+
+    def test_falha_nao_libera_agendamento_confirmado(self):
+        transicoes.confirmar(self.agendamento.pk)  # confirmado pelo studio, pagamento ainda pendente
+        self.assertIsNone(transicoes.recusar_pagamento(self.agendamento.pk))
+
+        self.agendamento.refresh_from_db()
+        self.horario.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.pagamento_status), ("confirmado", "pendente"))
+        self.assertFalse(self.horario.disponivel)
+
+    def test_aprovacao_atrasada_nao_toma_horario_de_outro(self):
+        transicoes.recusar_pagamento(self.agendamento.pk, "57")
+        outro = Agendamento.objects.create(
+            profissional=self.profissional, servico=self.agendamento.servico, nome="Olga", telefone="83922221111",
+            email="olga@example.com", data=date(2030, 4, 2), hora=self.horario,
+        )
+        transicoes.confirmar(outro.pk)
+
+        resultado = pagamentos.aplicar({"id": 58, "status": "approved", "external_reference": str(self.agendamento.pk)})
+
+        self.assertIn("já foi ocupado", resultado)
+        self.assertEqual(EmailSaida.objects.count(), 0)
+        self.agendamento.refresh_from_db()
+        self.assertEqual((self.agendamento.status, self.agendamento.pagamento_status), ("pendente", "aprovado"))
+        outro.refresh_from_db()
+        self.assertEqual(outro.status, "confirmado")
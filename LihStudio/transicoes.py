@@ -0,0 +1,158 @@
+"""
+Transições de estado do agendamento (status e pagamento).
+
+Cada transição é um único UPDATE condicional
+
+    UPDATE agendamento SET ... WHERE id = %s AND status IN (...) [AND pagamento_status IN (...)]
+
+e o horário é ocupado/liberado na mesma transação. Quem altera a linha
+venceu e recebe o agendamento atualizado (para mandar o e-mail etc.); quem
+recebe None sabe que outro evento chegou antes. Webhook e retorno do
+checkout chegando juntos, ou dois cliques em "concluir", processam uma vez.
+
+QuerySet.update() não dispara sinais, então `_transicionar` chama
+explicitamente os mesmos ganchos dos save(): painel, clientes,
+disponibilidade, relatórios e faturamento.
+
+Ocupar o horário não é garantido: uma recusa libera o horário de um
+agendamento pendente, e outro agendamento pode tomá-lo antes de chegar uma
+aprovação atrasada. Nesse caso a transição é desfeita com HorarioOcupado.
+"""
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+
+from . import clientes, disponibilidade, faturamento, painel, relatorios
+from .models import Agendamento, HorarioDisponivel
+
+ATIVOS = ("pendente", "confirmado")
+NAO_APROVADO = ("pendente", "processando", "rejeitado")
+# Agendamentos que seguram o horário: um pendente com pagamento recusado já o liberou
+SEGURA_HORARIO = Q(status="confirmado") | (Q(status="pendente") & ~Q(pagamento_status="rejeitado"))
+
+
+class HorarioOcupado(Exception):
+    """O horário do agendamento foi tomado por outro agendamento ativo."""
+
+
+def _transicionar(agendamento_id, para, status=None, pagamento=None, horario_livre=None, soltar_horario=False):
+    """
+    Aplica `para` se o agendamento está num dos `status` (e num dos
+    `pagamento`, se informados). `horario_livre` True/False libera/ocupa o
+    horário; `soltar_horario` desliga o agendamento do horário liberado.
+    Devolve o agendamento atualizado, ou None se perdeu. Levanta
+    HorarioOcupado (e nada muda) se for ocupar um horário que outro
+    agendamento segura.
+    """
+    with transaction.atomic():
+        alvo = Agendamento.objects.filter(pk=agendamento_id)
+        if status is not None:
+            alvo = alvo.filter(status__in=status)
+        if pagamento is not None:
+            alvo = alvo.filter(pagamento_status__in=pagamento)
+        if not alvo.update(**para):
+            return None
+
+        agendamento = Agendamento.objects.select_related("hora", "profissional", "servico").get(pk=agendamento_id)
+        if agendamento.hora_id and horario_livre is False:
+            ocupado = Agendamento.objects.filter(SEGURA_HORARIO, hora_id=agendamento.hora_id).exclude(pk=agendamento_id)
+            if ocupado.exists():
+                raise HorarioOcupado(f"Horário do agendamento {agendamento_id} já foi ocupado")
+        if agendamento.hora_id and horario_livre is not None:
+            mudou = HorarioDisponivel.objects.filter(pk=agendamento.hora_id).exclude(
+                disponivel=horario_livre
+            ).update(disponivel=horario_livre)
+            agendamento.hora.disponivel = horario_livre
+            if mudou:
+                disponibilidade.invalidar(agendamento.profissional_id)
+            if soltar_horario:
+                Agendamento.objects.filter(pk=agendamento_id).update(hora=None)
+                agendamento.hora = None
+
+        painel.invalidar()
+        relatorios.invalidar()
+        if agendamento.cliente_id:
+            clientes.atualizar(agendamento.cliente_id)
+        if "status" in para and "concluido" in (para["status"], *(status or ())):
+            faturamento.atualizar_meses([agendamento])
+        return agendamento
+
+
+# ------------------------------------------------------------------
+# Pagamento
+# ------------------------------------------------------------------
+
+def aprovar_pagamento(agendamento_id, pagamento_id=None):
+    """Pagamento aprovado de um agendamento ativo: confirma e ocupa o horário."""
+    para = {"status": "confirmado", "confirmado": True, "pagamento_status": "aprovado"}
+    if pagamento_id:
+        para["pagamento_id"] = str(pagamento_id)
+    return _transicionar(agendamento_id, para, status=ATIVOS, pagamento=NAO_APROVADO, horario_livre=False)
+
+
+def registrar_pagamento(agendamento_id, pagamento_id=None):
+    """
+    Só registra o pagamento aprovado, sem confirmar: agendamento já
+    cancelado ou concluído, ou cujo horário foi tomado (HorarioOcupado).
+    """
+    para = {"pagamento_status": "aprovado"}
+    if pagamento_id:
+        para["pagamento_id"] = str(pagamento_id)
+    return _transicionar(agendamento_id, para, pagamento=NAO_APROVADO)
+
+
+def recusar_pagamento(agendamento_id, pagamento_id=None, estorno=False):
+    """
+    Pagamento recusado: um agendamento ainda pendente libera o horário; um
+    já confirmado pelo studio não muda. Com `estorno` (devolução ou
+    contestação de um pagamento aprovado), o agendamento ativo é cancelado
+    e o horário liberado; um concluído ou cancelado só registra.
+    """
+    para = {"pagamento_status": "rejeitado"}
+    if pagamento_id:
+        para["pagamento_id"] = str(pagamento_id)
+    if estorno:
+        estornado = (
+            _transicionar(agendamento_id, {**para, "status": "cancelado"}, status=ATIVOS,
+                          pagamento=("aprovado",), horario_livre=True)
+            or _transicionar(agendamento_id, para, status=("cancelado", "concluido"), pagamento=("aprovado",))
+        )
+        if estornado:
+            return estornado
+    return _transicionar(agendamento_id, para, status=("pendente",), pagamento=("pendente", "processando"),
+                         horario_livre=True)
+
+
+def pagamento_em_processo(agendamento_id, pagamento_id=None):
+    para = {"pagamento_status": "processando"}
+    if pagamento_id:
+        para["pagamento_id"] = str(pagamento_id)
+    return _transicionar(agendamento_id, para, pagamento=("pendente",))
+
+
+# ------------------------------------------------------------------
+# Painel
+# ------------------------------------------------------------------
+
+def confirmar(agendamento_id):
+    return _transicionar(agendamento_id, {"status": "confirmado", "confirmado": True},
+                         status=("pendente",), horario_livre=False)
+
+
+def concluir(agendamento_id):
+    """Conclui um agendamento ativo; pagamento pendente passa a aprovado (pago no studio)."""
+    para = {
+        "status": "concluido",
+        "pagamento_status": Case(When(pagamento_status="pendente", then=Value("aprovado")),
+                                 default=F("pagamento_status")),
+    }
+    return _transicionar(agendamento_id, para, status=ATIVOS)
+
+
+def cancelar(agendamento_id, pelo_studio=False):
+    """
+    Cancela e libera o horário. A cliente só cancela agendamentos ativos; o
+    studio cancela também concluídos e desliga o agendamento do horário.
+    """
+    de = ATIVOS + ("concluido",) if pelo_studio else ATIVOS
+    return _transicionar(agendamento_id, {"status": "cancelado"}, status=de,
+                         horario_livre=True, soltar_horario=pelo_studio)
@@ -8,6 +8,7 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('home/', views.home, name='home'),
     path('agendar/', views.agendar_servico, name='agendar_servico'),
+    path('agendar/disponibilidade/', views.disponibilidade_api, name='disponibilidade_api'),
     path('sucesso/', views.sucesso_view, name='sucesso'),
     
     # Autenticação
@@ -19,9 +20,13 @@ urlpatterns = [
     path('painel-funcionario/', views.painel_funcionario, name='painel_funcionario'),
     # Painel administrativo
     path('painel/', only_admin(views.painel_dona), name='painel_dona'),
+    path('painel/lista/<str:lista>/', views.painel_lista, name='painel_lista'),
     path('clientes/', views.lista_cliente, name='lista_clientes'),
     path('clientes/historico/', views.historico_cliente, name='historico_cliente'),
     path('clientes/exportar/', views.exportar_clientes_pdf, name='exportar_clientes_pdf'),
+    path('clientes/exportar/planilha/', views.exportar_clientes_planilha, name='exportar_clientes_planilha'),
+    path('exportacoes/<int:exportacao_id>/status/', views.status_exportacao, name='status_exportacao'),
+    path('exportacoes/<int:exportacao_id>/baixar/', views.baixar_exportacao, name='baixar_exportacao'),
     # Sobre Horarios
     path('adicionar_horario/', only_admin(views.adicionar_horario), name='adicionar_horario'),
     path('gerar-horarios/', only_admin(views.gerar_horarios_semanais), name='gerar_horarios'),
@@ -37,7 +42,9 @@ urlpatterns = [
     path('politica-privacidade/', views.politica_privacidade, name='politica_privacidade'),
     # SOBRE Módulo de Faturamento
     path('faturamento/', only_admin(views.relatorio_faturamento), name='relatorio_faturamento'),
+    path('faturamento/serie/', views.faturamento_serie, name='faturamento_serie'),
     path('faturamento/exportar/', only_admin(views.exportar_faturamento_pdf), name='exportar_faturamento_pdf'),
+    path('faturamento/exportar/planilha/', views.exportar_faturamento_planilha, name='exportar_faturamento_planilha'),
     # SOBRE Exclusao de Horarios
     path('excluir-horario/<int:horario_id>/', only_admin(views.excluir_horario), name='excluir_horario'),
     path('excluir-todos-horarios/', only_admin(views.excluir_todos_horarios), name='excluir_todos_horarios'),
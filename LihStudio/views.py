@@ -2,14 +2,19 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.utils import timezone
 from datetime import datetime, date, timedelta
-from django.db.models import F, Q
+from django.db.models import F
 from django.core.mail import send_mail
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.db import transaction
 from .forms import AgendamentoForm, HorarioDisponivelForm, AgendamentoAdminForm
-from .models import HorarioDisponivel, Agendamento, Profissional, Servico
+from .clientes import resumo_por_cliente
+from .models import HorarioDisponivel, Agendamento, Cliente, ExportacaoRelatorio, Profissional, Servico
+from . import (
+    busca, disponibilidade, emails, faturamento, gateway, horarios, pagamentos, painel, planilhas, relatorios,
+    transicoes,
+)
 from .forms import (
     AgendamentoForm, 
     HorarioDisponivelForm, 
@@ -17,13 +22,18 @@ from .forms import (
     ServicoForm
 )
 from django.core.mail import EmailMultiAlternatives
-from django.http import Http404, HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest
 from django.urls import reverse
 from django.db import models
 from django.utils.dateparse import parse_date
+import calendar
 import json
+from functools import wraps
 from django.http import JsonResponse
 from django.core.paginator import Paginator
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.template.loader import render_to_string
 
 def index(request):
     """Renderiza a nova landing page (index.html)"""
@@ -47,6 +57,20 @@ def only_staff(view_func):
     return _wrapped_view
 
 
+def atomic_em_post(view_func):
+    """
+    Executa a view dentro de uma transação apenas em POST, para que a
+    mudança de status e o e-mail na caixa de saída sejam gravados juntos.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if request.method == "POST":
+            with transaction.atomic():
+                return view_func(request, *args, **kwargs)
+        return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
 # ------------------------- VIEWS PÚBLICAS -------------------------
 
 def home(request):
@@ -55,6 +79,7 @@ def home(request):
 def sucesso_view(request):
     return render(request, 'LihStudio/sucesso.html')
 
+@atomic_em_post
 def agendar_servico(request):
     # -------------------------------------------------------------
     # 1.  Pega o slug do profissional e a data vindos da URL (?profissional=...&data=...)
@@ -62,11 +87,9 @@ def agendar_servico(request):
     prof_slug = request.GET.get("profissional")        # ex.: 'elisama'
     data_str  = request.GET.get("data")                # ex.: '2025-06-05'
 
-    # Converte slug → objeto ou None
-    profissional_obj = (
-        Profissional.objects.filter(slug=prof_slug, ativo=True).first()
-        if prof_slug else None
-    )
+    # Uma única consulta traz a lista do <select> e a versão da agenda
+    profissionais = disponibilidade.profissionais_ativos()
+    profissional_obj = next((p for p in profissionais if p.slug == prof_slug), None) if prof_slug else None
 
     # -------------------------------------------------------------
     # 2.  POST  → grava o agendamento
@@ -95,6 +118,8 @@ def agendar_servico(request):
                         messages.error(request, "Este horário já foi reservado por outra pessoa.")
                         return redirect(request.path)
 
+                    disponibilidade.invalidar(ag.hora.profissional_id)
+
                     # 3. Se 'updated_rows' == 1: NÓS VENCEMOS.
                     #    O horário é nosso. Podemos salvar o agendamento.
                     if not ag.valor_total and ag.servico:
@@ -225,49 +250,20 @@ def agendar_servico(request):
                 subject, text_content, "RM Studio <rmcredpb@gmail.com>", [ag.email]
             )
             msg.attach_alternative(html_content, "text/html")
-            try:
-                msg.send()
-            except Exception as e:
-                print("Falha ao enviar e-mail:", e)
+            # Vai para a caixa de saída na mesma transação do agendamento
+            emails.enfileirar(msg)
 
             return redirect("sucesso")
 
-    if profissional_obj:
-        datas_disponiveis = (
-            HorarioDisponivel.objects.filter(disponivel=True, profissional=profissional_obj)
-            .values_list("data", flat=True)
-            .distinct()
-            .order_by("data")
-        )
-    else:
-        datas_disponiveis = []
-
-    form = AgendamentoForm()
-    form.fields['data'].widget.input_type = 'hidden'
-
-    
-    datas_disponiveis = (
-        HorarioDisponivel.objects
-        .filter(
-            disponivel=True,
-            profissional=profissional_obj,
-            data__gte=timezone.now().date()  # só hoje em diante
-        )
-        .values_list('data', flat=True)
-        .distinct()
-        .order_by('data')
-    )
+    # -------------------------------------------------------------
+    # 3.  GET   → monta a página a partir do calendário em cache
+    # -------------------------------------------------------------
+    calendario = disponibilidade.calendario(profissional_obj) if profissional_obj else {}
+    datas_disponiveis = list(calendario)
 
-    # Filtra horários por data e profissional
     # Horários do dia escolhido
-    if data_str and profissional_obj:
-        horas_do_dia = HorarioDisponivel.objects.filter(
-            disponivel=True,
-            data=parse_date(data_str),
-            profissional=profissional_obj
-        ).order_by("hora")
-    else:
-        horas_do_dia = HorarioDisponivel.objects.none()
+    data_escolhida = parse_date(data_str) if data_str else None
+    horas_do_dia = calendario.get(data_escolhida, [])
 
     # Formulário já vem com data + profissional como *initial*
     initial = {}
@@ -279,20 +275,74 @@ def agendar_servico(request):
     form = AgendamentoForm(initial=initial)
     form.fields["data"].widget.input_type = "hidden"
     form.fields["profissional"].widget.input_type = "hidden"
-    form.fields["hora"].queryset = horas_do_dia
 
     return render(
         request,
         "LihStudio/agendar.html",
         {
-            "profissionais": Profissional.objects.filter(ativo=True),  # p/ <select>
+            "profissionais": profissionais,  # p/ <select>
             "profissional_selecionada": prof_slug,
             "datas_disponiveis": datas_disponiveis,
             "data_selecionada": data_str,
+            "horas_do_dia": horas_do_dia,
+            "servicos": disponibilidade.servicos_ativos(),  # do cache, como o calendário
             "form": form,
         },
     )
 
+def disponibilidade_api(request):
+    """
+    Datas e horários livres de uma profissional em JSON compacto
+    (?profissional=<slug>&mes=YYYY-MM). O ETag vem da versão da agenda,
+    então navegador e proxy revalidam com 304 sem remontar nada.
+    """
+    prof_slug = request.GET.get("profissional")
+    mes_str = request.GET.get("mes")
+
+    profissional_obj = (
+        Profissional.objects.filter(slug=prof_slug, ativo=True)
+        .only("id", "slug", "versao_disponibilidade", "disponibilidade_atualizada_em")
+        .first()
+        if prof_slug else None
+    )
+    if not profissional_obj:
+        return JsonResponse({"erro": "Profissional não encontrada."}, status=404)
+
+    mes = None
+    if mes_str:
+        try:
+            mes = datetime.strptime(mes_str, "%Y-%m").date()
+        except ValueError:
+            return JsonResponse({"erro": "Mês inválido, use AAAA-MM."}, status=400)
+
+    # O dia entra no ETag porque as datas passadas saem do calendário
+    hoje = timezone.now().date()
+    etag = f'"{profissional_obj.pk}-{profissional_obj.versao_disponibilidade}-{mes_str or "todos"}-{hoje:%Y%m%d}"'
+    last_modified = profissional_obj.disponibilidade_atualizada_em
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is None:
+        datas = {}
+        for data, horas in disponibilidade.calendario(profissional_obj).items():
+            if mes and (data.year, data.month) != (mes.year, mes.month):
+                continue
+            datas[data.isoformat()] = [[horario_id, hora.strftime("%H:%M")] for horario_id, hora in horas]
+
+        response = JsonResponse(
+            {"profissional": profissional_obj.slug, "mes": mes_str, "datas": datas},
+            json_dumps_params={"separators": (",", ":")},
+        )
+
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
 # ------------------------- AUTENTICAÇÃO -------------------------
 
 # Em LihStudio/views.py
@@ -368,35 +418,53 @@ def painel_dona(request):
     agendamentos_hoje = Agendamento.objects.filter(data=hoje).exclude(status='cancelado') \
         .select_related('hora', 'profissional', 'servico') \
         .order_by('hora__hora')
-    agendamentos_confirmados = Agendamento.objects.filter(status='confirmado')
-    agendamentos_pendentes = Agendamento.objects.filter(status='pendente')
-    agendamentos_cancelados = Agendamento.objects.filter(status='cancelado')
-    total_clientes = Agendamento.objects.values('nome', 'telefone').distinct().count()
-    agendamentos_futuros = Agendamento.objects.filter(data__gte=hoje).exclude(data=hoje).exclude(status='cancelado').order_by('data', 'hora__hora')
-    
-    # Agendamentos com pagamento pendente
-    agendamentos_pagamento_pendente = Agendamento.objects.filter(
-        status='pendente', 
-        pagamento_status='pendente'
-    )
 
-    agendamentos_passados_pendentes = Agendamento.objects.filter(
-    data__lt=hoje,
-    status__in=['pendente', 'confirmado']
-    ).select_related('hora', 'profissional', 'servico').order_by('-data')
+    # Só a primeira página; o resto vem de painel_lista conforme a rolagem
+    agendamentos_futuros, proximo_futuros = painel.pagina(painel.agendamentos_futuros(hoje))
+    agendamentos_passados_pendentes, proximo_passados = painel.pagina(
+        painel.agendamentos_passados_pendentes(hoje), descendente=True
+    )
     
     return render(request, 'LihStudio/painel_dona.html', {
         'agendamentos_hoje': agendamentos_hoje,
-        'agendamentos_confirmados': agendamentos_confirmados,
-        'agendamentos_pendentes': agendamentos_pendentes,
-        'agendamentos_cancelados': agendamentos_cancelados,
         'agendamentos_futuros': agendamentos_futuros,
-        'agendamentos_pagamento_pendente': agendamentos_pagamento_pendente,
-        'total_clientes': total_clientes,
+        'proximo_futuros': proximo_futuros,
+        # Todos os números dos cards em uma consulta (com cache curto)
+        'contadores': painel.contadores(hoje),
         'hoje': hoje,
         'agendamentos_passados_pendentes': agendamentos_passados_pendentes,
+        'proximo_passados': proximo_passados,
     })
 
+
+# lista → (queryset, descendente, template das linhas, variável do template, só a dona?)
+LISTAS_PAINEL = {
+    'futuros': (painel.agendamentos_futuros, False, 'LihStudio/painel_dona_futuros.html', 'agendamentos_futuros', True),
+    'passados': (painel.agendamentos_passados_pendentes, True, 'LihStudio/painel_dona_passados.html', 'agendamentos_passados_pendentes', True),
+    'funcionario_futuros': (painel.agendamentos_futuros, False, 'LihStudio/painel_funcionario_futuros.html', 'agendamentos_futuros', False),
+}
+
+@only_staff
+def painel_lista(request, lista):
+    """
+    Próxima página de uma lista dos painéis (?apos=<cursor>), como JSON com
+    o HTML das linhas já renderizado e o cursor da página seguinte.
+    """
+    if lista not in LISTAS_PAINEL:
+        raise Http404("Lista não encontrada.")
+    queryset, descendente, template, variavel, somente_dona = LISTAS_PAINEL[lista]
+    if somente_dona and not request.user.is_superuser:
+        return JsonResponse({"erro": "Acesso restrito a administradores."}, status=403)
+
+    try:
+        itens, proximo = painel.pagina(queryset(date.today()), request.GET.get('apos'), descendente=descendente)
+    except ValueError:
+        return JsonResponse({"erro": "Cursor inválido."}, status=400)
+
+    html = render_to_string(template, {variavel: itens}, request=request)
+    return JsonResponse({"html": html, "proximo": proximo})
+
+@atomic_em_post
 def cancelar_agendamento_cliente(request, agendamento_id, token):
     ag = get_object_or_404(Agendamento, id=agendamento_id)
 
@@ -415,14 +483,13 @@ def cancelar_agendamento_cliente(request, agendamento_id, token):
         }, status=403)
     
     if request.method == 'POST':
-        # Marcar como cancelado em vez de deletar
-        ag.status = 'cancelado'
-        ag.save()
-        
-        # Liberar horário se existir
-        if ag.hora:
-            ag.hora.disponivel = True
-            ag.hora.save()
+        # Marca como cancelado e libera o horário; um segundo envio não repete o e-mail
+        ag = transicoes.cancelar(ag.id)
+        if ag is None:
+            return render(request, 'LihStudio/mensagem.html', {
+                'titulo': "Cancelamento não disponível",
+                'mensagem': "Este agendamento já foi concluído ou cancelado e não pode mais ser alterado."
+            }, status=403)
 
         if ag.hora:
             # Se tem um slot de horário, usa ele
@@ -527,7 +594,7 @@ def cancelar_agendamento_cliente(request, agendamento_id, token):
             [ag.email]
         )
         msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        emails.enfileirar(msg)
         
         return render(request, 'LihStudio/agendamento_cancelado.html')
     
@@ -537,15 +604,17 @@ def cancelar_agendamento_cliente(request, agendamento_id, token):
     })
 
 @only_staff
+@transaction.atomic
 def confirmar_agendamento(request, agendamento_id):
-    ag = get_object_or_404(Agendamento, id=agendamento_id)
-    ag.confirmado = True
-    ag.status = 'confirmado'
-    ag.save()
-
-    if ag.hora:
-        ag.hora.disponivel = False
-        ag.hora.save()
+    try:
+        ag = transicoes.confirmar(agendamento_id)
+    except transicoes.HorarioOcupado:
+        messages.error(request, 'O horário deste agendamento já foi ocupado por outro agendamento. Remarque antes de confirmar.')
+        return redirect('painel_dona' if request.user.is_superuser else 'painel_funcionario')
+    if ag is None:
+        get_object_or_404(Agendamento, id=agendamento_id)
+        messages.warning(request, 'Este agendamento não está mais pendente.')
+        return redirect('painel_dona' if request.user.is_superuser else 'painel_funcionario')
 
     # Gerar link para Google Agenda
     data_evento = ag.hora.data if ag.hora else ag.data
@@ -687,7 +756,7 @@ def confirmar_agendamento(request, agendamento_id):
         [ag.email]
     )
     msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    emails.enfileirar(msg)
     
     messages.success(request, 'Agendamento confirmado com sucesso!')
 
@@ -698,7 +767,6 @@ def confirmar_agendamento(request, agendamento_id):
 
 # ------------------------- VIEWS MERCADO PAGO -------------------------
 
-import mercadopago
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 
@@ -707,9 +775,13 @@ from django.views.decorators.csrf import csrf_exempt
 @csrf_exempt
 def criar_pagamento_agendamento(request, agendamento_id):
     """
-    Cria uma preferência de pagamento no Mercado Pago para um agendamento específico
+    Página de pagamento de um agendamento. A preferência do Mercado Pago é
+    criada na primeira visita e reaproveitada nas seguintes enquanto vale
+    e o preço não muda: reabrir o link custa uma consulta e nenhuma chamada à API.
     """
-    agendamento = get_object_or_404(Agendamento, id=agendamento_id)
+    agendamento = get_object_or_404(
+        Agendamento.objects.select_related("servico", "profissional"), id=agendamento_id
+    )
 
     # Validações de status
     if agendamento.status in ['confirmado', 'cancelado', 'concluido']:
@@ -720,17 +792,20 @@ def criar_pagamento_agendamento(request, agendamento_id):
         messages.info(request, "Este agendamento já foi pago e confirmado.")
         return redirect('home')
 
-    # Inicialização do SDK com tratamento de erro
+    # Obter preço do serviço
+    preco = agendamento.servico.preco if agendamento.servico else Decimal('100.00')
+
+    if pagamentos.preferencia_valida(agendamento, preco):
+        return _pagina_pagamento(request, agendamento, preco)
+
+    # Cliente do Mercado Pago do processo (conexões reaproveitadas, ver gateway.py)
     try:
-        sdk = mercadopago.SDK(access_token=settings.MERCADOPAGO_ACCESS_TOKEN)
+        cliente_mp = gateway.gateway()
     except Exception as e:
         print(f"Erro ao inicializar SDK Mercado Pago: {e}")
         messages.error(request, "Erro na configuração do pagamento. Tente novamente.")
         return redirect('home')
 
-    # Obter preço do serviço
-    preco = agendamento.servico.preco if agendamento.servico else Decimal('100.00')
-
     # URLs de retorno - Usando build_absolute_uri para URLs completas
     success_url = request.build_absolute_uri(reverse('pagamento_sucesso'))
     failure_url = request.build_absolute_uri(reverse('pagamento_falha'))  
@@ -740,6 +815,7 @@ def criar_pagamento_agendamento(request, agendamento_id):
     notification_url = getattr(settings, 'MERCADOPAGO_WEBHOOK_URL', None)
 
     # Configuração da preferência de pagamento
+    inicio, expira_em = pagamentos.validade_preferencia()
     preference_data = {
         "items": [
             {
@@ -763,8 +839,8 @@ def criar_pagamento_agendamento(request, agendamento_id):
         "external_reference": str(agendamento.id),
         "statement_descriptor": "RM STUDIO",
         "expires": True,  # Preferência expira
-        "expiration_date_from": None,
-        "expiration_date_to": None,
+        "expiration_date_from": inicio.isoformat(timespec="milliseconds"),
+        "expiration_date_to": expira_em.isoformat(timespec="milliseconds"),
     }
 
     # Adicionar notification_url apenas se estiver configurada
@@ -773,7 +849,7 @@ def criar_pagamento_agendamento(request, agendamento_id):
 
     try:
         # Criar preferência no Mercado Pago
-        preference_response = sdk.preference().create(preference_data)
+        preference_response = cliente_mp.criar_preferencia(preference_data)
         
         # Log para debug
         print("Resposta do Mercado Pago:")
@@ -792,24 +868,16 @@ def criar_pagamento_agendamento(request, agendamento_id):
             messages.error(request, "Erro na resposta do Mercado Pago")
             return redirect('home')
         
-        preference_id = preference["id"]
-        init_point = preference["init_point"]
-        
-        # Salvar dados do pagamento no agendamento
-        agendamento.pagamento_id = preference_id
-        agendamento.pagamento_status = "pendente"
-        agendamento.save()
+        # Guardar a preferência no agendamento para as próximas visitas
+        pagamentos.guardar_preferencia(agendamento, preference, preco, expira_em)
 
-        print(f"✅ Preferência criada: {preference_id}")
+        print(f"✅ Preferência criada: {preference['id']}")
         
-        # Renderizar página de pagamento
-        return render(request, "LihStudio/pagamento.html", {
-            "agendamento": agendamento,
-            "preco": preco,
-            "preference_id": preference_id,
-            "public_key": settings.MERCADOPAGO_PUBLIC_KEY,
-            "init_point": init_point,
-        })
+        return _pagina_pagamento(request, agendamento, preco)
+
+    except gateway.GatewayIndisponivel:
+        messages.error(request, "O Mercado Pago está indisponível no momento. Tente novamente em alguns minutos.")
+        return redirect('home')
 
     except Exception as e:
         print(f"❌ Exceção ao criar pagamento: {str(e)}")
@@ -819,144 +887,42 @@ def criar_pagamento_agendamento(request, agendamento_id):
         return redirect('home')
 
 
+def _pagina_pagamento(request, agendamento, preco):
+    return render(request, "LihStudio/pagamento.html", {
+        "agendamento": agendamento,
+        "preco": preco,
+        "preference_id": agendamento.preferencia_id,
+        "public_key": settings.MERCADOPAGO_PUBLIC_KEY,
+        "init_point": agendamento.preferencia_url,
+    })
+
+
 @csrf_exempt
 def webhook_mercadopago(request):
     """
-    Webhook para receber notificações do Mercado Pago - VERSÃO CORRIGIDA
+    Webhook do Mercado Pago: valida, registra a notificação e responde na hora.
+    O pagamento é consultado e aplicado pelo comando `processar_pagamentos`;
+    reenvios da mesma notificação só somam uma entrega na mesma linha (ver pagamentos.py).
     """
     if request.method != "POST":
         return HttpResponse("Method not allowed", status=405)
 
     try:
-        # Inicializar SDK
-        sdk = mercadopago.SDK(access_token=settings.MERCADOPAGO_ACCESS_TOKEN)
-        
-        # Obter dados do webhook
-        data = json.loads(request.body.decode('utf-8'))
-        print(f"Webhook recebido: {json.dumps(data, indent=2)}")
-
-        # Extrair informações do webhook
-        topic = data.get("topic") or data.get("type")
-        
-        if topic != "payment":
-            print(f"Tópico não tratado: {topic}")
-            return HttpResponse("OK", status=200)
-
-        resource_id = data.get("data", {}).get("id") or data.get("id")
-        if not resource_id:
-            print("Pagamento sem ID")
-            return HttpResponse("OK", status=200)
-
-        print(f"Processando {topic} - ID: {resource_id}")
-
-        # Buscar informações do pagamento
-        payment_info = sdk.payment().get(resource_id)
-        
-        if payment_info.get("status") != 200:
-            print(f"Erro ao buscar pagamento: {payment_info}")
-            return HttpResponse("Error fetching payment", status=400)
-            
-        payment_data = payment_info.get("response", {})
-        
-        # Extrair dados importantes
-        payment_status = payment_data.get("status")
-        external_reference = payment_data.get("external_reference")
-        payment_id = payment_data.get("id")
-        
-        print(f"Status: {payment_status}, Referência: {external_reference}, ID: {payment_id}")
-
-        if not external_reference:
-            print("Pagamento sem referência externa")
-            return HttpResponse("OK", status=200)
-
-        # Buscar agendamento
-        try:
-            agendamento = Agendamento.objects.get(id=int(external_reference))
-            print(f"Agendamento encontrado: {agendamento.id}")
-        except (Agendamento.DoesNotExist, ValueError):
-            print(f"Agendamento não encontrado para ID: {external_reference}")
-            return HttpResponse("OK", status=200)
-
-        # Salvar status anterior para comparação
-        old_status = agendamento.pagamento_status
-        
-        # Atualizar status conforme o status do pagamento
-        if payment_status == "approved":
-
-            # --- INÍCIO DA CORREÇÃO 2: WEBHOOK RACE CONDITION ---
-            if agendamento.status not in ['pendente', 'confirmado']:
-                # O admin já cancelou ou concluiu este agendamento.
-                # Apenas registramos o pagamento, mas não mudamos o status.
-                print(f"Webhook: Pagamento {payment_id} aprovado, mas agendamento {agendamento.id} está {agendamento.status}. Ignorando mudança de status.")
-                
-                agendamento.pagamento_status = "aprovado"
-                agendamento.pagamento_id = str(payment_id)
-                agendamento.save()
-                
-                # Retorna OK, pois o pagamento foi processado,
-                # mas o status do agendamento não foi alterado.
-                return HttpResponse("OK (Ignorado, status não pendente)", status=200)
-            # --- FIM DA CORREÇÃO 2 ---
-
-            # Se chegou aqui, o status é 'pendente' (ou 'confirmado', webhook duplicado)
-            agendamento.status = "confirmado"
-            agendamento.confirmado = True
-            agendamento.pagamento_status = "aprovado"
-            agendamento.pagamento_id = str(payment_id)
-            
-            # Bloquear horário
-            if agendamento.hora:
-                agendamento.hora.disponivel = False
-                agendamento.hora.save()
-                
-            # Enviar email apenas se mudou de status
-            if old_status != "aprovado":
-                try:
-                    enviar_email_confirmacao_automatica(agendamento)
-                except Exception as e:
-                    print(f"Erro ao enviar email: {e}")
-                    
-        elif payment_status == "rejected":
-            agendamento.pagamento_status = "rejeitado"
-            agendamento.pagamento_id = str(payment_id)
-            
-            # Liberar horário se rejeitado
-            if agendamento.hora:
-                agendamento.hora.disponivel = True
-                agendamento.hora.save()
-
-        elif payment_status in ["in_process", "pending"]:
-            if agendamento.pagamento_status == 'pendente':
-                agendamento.pagamento_status = "processando"
-                agendamento.pagamento_id = str(payment_id)
-            else:
-                print(f"Webhook: 'pending' recebido, mas status já é {agendamento.pagamento_status}. Ignorando.")
-
-        elif payment_status in ["cancelled", "refunded", "charged_back"]:
-            agendamento.pagamento_status = "rejeitado"
-            agendamento.pagamento_id = str(payment_id)
-            
-            # Liberar horário
-            if agendamento.hora:
-                agendamento.hora.disponivel = True
-                agendamento.hora.save()
+        data = json.loads(request.body or b"{}")
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return HttpResponse("Invalid JSON", status=400)
+    if not isinstance(data, dict):
+        return HttpResponse("Invalid JSON", status=400)
 
-        agendamento.save()
-        print(f"Status atualizado: {old_status} → {agendamento.pagamento_status}")
-        
-        return HttpResponse("OK", status=200)
+    topico, recurso_id, acao = pagamentos.ler_notificacao(data, request.GET)
+    if topico != pagamentos.TOPICO or not recurso_id:
+        return HttpResponse("OK", status=200)  # tópico não tratado
 
-    except json.JSONDecodeError:
-        print("Erro ao decodificar JSON do webhook")
-        return HttpResponse("Invalid JSON", status=400)
-        
-    except Exception as e:
-        print(f"Erro no webhook Mercado Pago: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return HttpResponse("Internal Server Error", status=500)
+    pagamentos.registrar(topico, recurso_id, acao, data)
+    return HttpResponse("OK", status=200)
 
 
+@transaction.atomic
 def pagamento_sucesso(request):
     """
     Página de retorno quando o pagamento é aprovado
@@ -972,19 +938,15 @@ def pagamento_sucesso(request):
         try:
             agendamento = Agendamento.objects.get(id=int(external_reference))
             
-            # Se o status ainda está pendente, atualizar manualmente
-            if status == 'approved' and agendamento.pagamento_status == 'pendente':
-                agendamento.status = "confirmado"
-                agendamento.confirmado = True
-                agendamento.pagamento_status = "aprovado"
-                agendamento.pagamento_id = payment_id or agendamento.pagamento_id
-                agendamento.save()
-                
-                # Bloquear horário
-                if agendamento.hora:
-                    agendamento.hora.disponivel = False
-                    agendamento.hora.save()
-                
+            # Se o webhook ainda não confirmou, confirma aqui; se os dois chegarem
+            # juntos, só um vence a transição e manda o e-mail
+            try:
+                confirmado = transicoes.aprovar_pagamento(agendamento.id, payment_id) if status == 'approved' else None
+            except transicoes.HorarioOcupado:
+                # O webhook registra o pagamento e o studio remarca
+                confirmado = None
+            if confirmado:
+                agendamento = confirmado
                 # Enviar email de confirmação
                 try:
                     enviar_email_confirmacao_automatica(agendamento)
@@ -1016,18 +978,11 @@ def pagamento_falha(request):
     
     print(f"❌ Retorno de falha - Payment ID: {payment_id}, Ref: {external_reference}")
     
-    # Liberar horário se houve falha
+    # Liberar horário se houve falha (não desfaz um pagamento que o webhook já aprovou)
     if external_reference:
         try:
-            agendamento = Agendamento.objects.get(id=int(external_reference))
-            agendamento.pagamento_status = "rejeitado"
-            agendamento.save()
-            
-            if agendamento.hora:
-                agendamento.hora.disponivel = True
-                agendamento.hora.save()
-                
-        except Agendamento.DoesNotExist:
+            transicoes.recusar_pagamento(int(external_reference), payment_id)
+        except ValueError:
             pass
     
     messages.error(request, "Falha no processamento do pagamento. O horário foi liberado. Tente novamente.")
@@ -1045,11 +1000,8 @@ def pagamento_pendente(request):
     
     if external_reference:
         try:
-            agendamento = Agendamento.objects.get(id=int(external_reference))
-            agendamento.pagamento_status = "processando"
-            agendamento.pagamento_id = payment_id or agendamento.pagamento_id
-            agendamento.save()
-        except Agendamento.DoesNotExist:
+            transicoes.pagamento_em_processo(int(external_reference), payment_id)
+        except ValueError:
             pass
     
     messages.info(request, "Seu pagamento está sendo processado. Você receberá uma confirmação em breve.")
@@ -1140,32 +1092,25 @@ def enviar_email_confirmacao_automatica(agendamento):
             [agendamento.email]
         )
         msg.attach_alternative(html_content, "text/html")
-        msg.send()
-        print(f"Email de confirmação enviado para {agendamento.email}")
+        emails.enfileirar(msg)
+        print(f"Email de confirmação enfileirado para {agendamento.email}")
         return True
     except Exception as e:
         print(f"Erro ao enviar email: {e}")
         return False
 
 @only_staff
+@transaction.atomic
 def concluir_agendamento(request, agendamento_id):
-    ag = get_object_or_404(Agendamento, id=agendamento_id)
-    
-    # Verificar se está cancelado
-    if ag.status == 'cancelado':
-        messages.error(request, 'Não é possível concluir um agendamento cancelado!')
-        # --- MUDANÇA NO REDIRECIONAMENTO ---
-        if request.user.is_superuser:
-            return redirect('painel_dona')
+    # Só conclui agendamento ativo (pagamento pendente vira aprovado); um segundo clique não repete o e-mail
+    ag = transicoes.concluir(agendamento_id)
+    if ag is None:
+        atual = get_object_or_404(Agendamento, id=agendamento_id)
+        if atual.status == 'cancelado':
+            messages.error(request, 'Não é possível concluir um agendamento cancelado!')
         else:
-            return redirect('painel_funcionario')
-    
-    ag.status = 'concluido'
-
-    if ag.pagamento_status == 'pendente':
-        ag.pagamento_status = 'aprovado'
-
-    ag.save()
+            messages.warning(request, 'Este agendamento já estava concluído.')
+        return redirect('painel_dona' if request.user.is_superuser else 'painel_funcionario')
 
     # Enviar e-mail de confirmação de conclusão
     subject = '🌟 Seu Serviço no RM Studio Foi Concluído!'
@@ -1258,7 +1203,7 @@ def concluir_agendamento(request, agendamento_id):
         [ag.email]
     )
     msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    emails.enfileirar(msg)
 
     messages.success(request, 'Serviço marcado como concluído e e-mail enviado!')
 
@@ -1268,34 +1213,18 @@ def concluir_agendamento(request, agendamento_id):
         return redirect('painel_funcionario')
 
 @only_admin
+@transaction.atomic
 def cancelar_agendamento(request, agendamento_id):
-    ag = get_object_or_404(Agendamento, id=agendamento_id)
-    
-    # Verificar se já está cancelado
-    if ag.status == 'cancelado':
+    # Cancela, libera o horário online (se houver) e desliga o agendamento dele
+    ag = transicoes.cancelar(agendamento_id, pelo_studio=True)
+    if ag is None:
+        get_object_or_404(Agendamento, id=agendamento_id)
         messages.warning(request, 'Este agendamento já estava cancelado.')
         return redirect('painel_dona')
-    
-    # Guarda os dados para o e-mail ANTES de modificar
+
     email = ag.email
     nome = ag.nome
 
-    # --- INÍCIO DA CORREÇÃO ---
-    
-    # 1. Apenas mudamos o status.
-    ag.status = 'cancelado'
-    
-    # 2. Verificamos se existe um horário ONLINE (ag.hora) para liberar.
-    #    Se for um agendamento manual (como o seu), 'ag.hora' será None, 
-    #    e este 'if' será pulado.
-    if ag.hora:
-        # Libera o horário online
-        ag.hora.disponivel = True
-        ag.hora.save()
-        ag.hora = None  # Remove a referência ao slot de horário
-    
-    ag.save() # Salva as alterações (status e/ou ag.hora=None)
-
     # O resto da função (enviar e-mail) continua igual...
     subject = '⚠️ Informação Importante: Seu Agendamento no RM Studio Foi Cancelado'
     text_content = f"""
@@ -1392,7 +1321,7 @@ def cancelar_agendamento(request, agendamento_id):
         [email]
     )
     msg.attach_alternative(html_content, "text/html")
-    msg.send()
+    emails.enfileirar(msg)
     
     messages.error(request, 'Agendamento cancelado com sucesso! Um e-mail foi enviado ao cliente.')
     return redirect('painel_dona')
@@ -1408,9 +1337,11 @@ def buscar_horarios_api(request):
     periodo = request.GET.get('periodo')
     search = request.GET.get('search', '').lower()
     page_number = request.GET.get('page', 1)
+    # Modo cursor (?cursor= ou ?cursor=<token>): sem COUNT, continua após a última linha
+    cursor = request.GET.get('cursor')
 
-    # 2. Query base (ordenada pela data/hora correta)
-    query = HorarioDisponivel.objects.select_related('profissional').order_by('data', 'hora')
+    # 2. Query base (a ordem data/hora/id é aplicada na paginação)
+    query = HorarioDisponivel.objects.all()
 
     # 3. Aplicar filtros
     if prof_slug and prof_slug != 'all':
@@ -1419,38 +1350,12 @@ def buscar_horarios_api(request):
     if status and status != 'all':
         query = query.filter(disponivel=(status == 'available'))
         
-    # ==========================================================
-    # ✅ INÍCIO DA CORREÇÃO (Substitui o 'if search:' antigo)
-    # ==========================================================
+    # Busca "dd/mm", "dd/", "/mm" ou número solto, traduzida em intervalos de data.
+    # Algo não-numérico (ex: 'abc') apenas ignora o filtro para não quebrar.
     if search:
-        try:
-            # Tenta dividir "dd/mm"
-            if '/' in search:
-                parts = search.split('/')
-                day_str = parts[0].strip()
-                month_str = parts[1].strip()
-                
-                q_objects = Q()
-                if day_str:
-                    q_objects &= Q(data__day=int(day_str))
-                if month_str:
-                    q_objects &= Q(data__month=int(month_str))
-                
-                query = query.filter(q_objects)
-            
-            # Se não tem '/', busca no dia OU no mês
-            else:
-                search_int = int(search)
-                query = query.filter(
-                    Q(data__day=search_int) | Q(data__month=search_int)
-                )
-        except (ValueError, IndexError):
-            # O usuário digitou algo não-numérico (ex: 'abc') ou "12/"
-            # Apenas ignora o filtro de busca para não quebrar.
-            pass
-    # ==========================================================
-    # ✅ FIM DA CORREÇÃO
-    # ==========================================================
+        filtro_busca = horarios.filtro_dia_mes(search)
+        if filtro_busca is not None:
+            query = query.filter(filtro_busca)
         
     if periodo and periodo != 'all':
         today = timezone.now().date()
@@ -1465,33 +1370,47 @@ def buscar_horarios_api(request):
             end_week = today + timedelta(days=6) # Corrigido na etapa anterior
             query = query.filter(data__range=[today, end_week]) 
         elif periodo == 'this_month':
-            query = query.filter(data__year=today.year, data__month=today.month)
+            ultimo_dia = calendar.monthrange(today.year, today.month)[1]
+            query = query.filter(data__range=[today.replace(day=1), today.replace(day=ultimo_dia)])
 
     # 4. Paginar os resultados (50 por página)
-    paginator = Paginator(query, 50)
-    page_obj = paginator.get_page(page_number)
-    
-    # 5. Serializar (transformar em JSON)
-    horarios_list = []
-    for h in page_obj:
-        horarios_list.append({
-            'id': h.id,
-            'data': h.data.strftime('%d/%m/%Y'),
-            'hora': h.hora.strftime('%H:%M'),
-            'profissional': h.profissional.nome,
-            'profissional_slug': h.profissional.slug,
-            'disponivel': h.disponivel,
+    if cursor is not None:
+        try:
+            linhas, proximo = horarios.pagina_grade(query, cursor, 50)
+        except ValueError:
+            return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+        pagina_info = {'has_next': proximo is not None, 'proximo': proximo}
+    else:
+        paginator = Paginator(
+            query.order_by('data', 'hora', 'id')
+            .values_list('id', 'data', 'hora', 'disponivel', 'profissional__nome', 'profissional__slug'),
+            50,
+        )
+        page_obj = paginator.get_page(page_number)
+        linhas = page_obj.object_list
+        pagina_info = {
+            'has_next': page_obj.has_next(),
+            'total_items': paginator.count,
+            'page_number': page_obj.number,
+        }
+    
+    # 5. Serializar (transformar em JSON) direto das tuplas, sem instanciar modelos
+    horarios_list = [
+        {
+            'id': horario_id,
+            'data': data.strftime('%d/%m/%Y'),
+            'hora': hora.strftime('%H:%M'),
+            'profissional': prof_nome,
+            'profissional_slug': prof_slug_linha,
+            'disponivel': disponivel,
             # Gera a URL de exclusão
-            'delete_url': reverse('excluir_horario', args=[h.id]) 
-        })
+            'delete_url': reverse('excluir_horario', args=[horario_id]),
+        }
+        for horario_id, data, hora, disponivel, prof_nome, prof_slug_linha in linhas
+    ]
         
-    # 7. Retornar os dados como JSON
-    return JsonResponse({
-        'horarios': horarios_list,
-        'has_next': page_obj.has_next(),
-        'total_items': paginator.count,
-        'page_number': page_obj.number,
-    })
+    # 6. Retornar os dados como JSON
+    return JsonResponse({'horarios': horarios_list, **pagina_info})
 
 @only_admin
 def adicionar_horario(request):
@@ -1613,43 +1532,21 @@ def gerar_horarios_semanais(request):
             messages.error(request, "A data de início não pode ser maior que a data de fim.")
             return redirect("adicionar_horario")
         
-        # Calcula o número de dias para o loop
-        total_dias = (data_fim - data_inicio).days + 1
+        if intervalo <= 0:
+            messages.error(request, "O intervalo deve ser maior que zero.")
+            return redirect("adicionar_horario")
 
+        # 5. Calcula todos os horários do período em memória e grava em lote
+        simular = bool(request.POST.get("simular"))
+        novos, existentes = horarios.gerar_horarios(
+            profissionais, data_inicio, data_fim, dias_selecionados,
+            inicio_time, fim_time, intervalo, simular=simular,
+        )
 
-        # 5.  Gera horários para o PERÍODO selecionado (substitui o range(7))
-        horarios_criados = 0
-        for prof in profissionais:
-            
-            # Loop dinâmico baseado no total de dias
-            for offset in range(total_dias):
-                data = data_inicio + timedelta(days=offset) # dia analisado
-                
-                # A verificação do dia da semana continua a mesma
-                if str(data.isoweekday()) not in dias_selecionados:
-                    continue                                # pula dias fora da seleção
-
-                # Lógica interna do loop (é a mesma que você já tinha)
-                inicio_dt = datetime.combine(data, inicio_time)
-                fim_dt    = datetime.combine(data, fim_time)
-
-                hora_atual = inicio_dt
-                while hora_atual <= fim_dt:
-                    # Usamos get_or_create para não duplicar horários
-                    obj, created = HorarioDisponivel.objects.get_or_create(
-                        profissional=prof,
-                        data=hora_atual.date(),
-                        hora=hora_atual.time(),
-                        defaults={"disponivel": True},
-                    )
-                    if created:
-                        horarios_criados += 1 # Conta apenas os horários realmente novos
-                    
-                    hora_atual += timedelta(minutes=intervalo)
-        
-        # Mensagem de sucesso melhorada
-        if horarios_criados > 0:
-            messages.success(request, f"{horarios_criados} novos horários gerados com sucesso no período selecionado!")
+        if simular:
+            messages.info(request, f"Pré-visualização: {novos} novos horários seriam criados e {existentes} já existem no período.")
+        elif novos > 0:
+            messages.success(request, f"{novos} novos horários gerados com sucesso no período selecionado!")
         else:
             messages.info(request, "Nenhum horário novo foi criado (provavelmente já existiam).")
             
@@ -1661,15 +1558,8 @@ def gerar_horarios_semanais(request):
 @only_admin
 def excluir_todos_horarios(request):
     if request.method == 'POST':
-        # Primeiro liberar os horários nos agendamentos
-        agendamentos_com_horario = Agendamento.objects.filter(hora__isnull=False)
-        for ag in agendamentos_com_horario:
-            ag.hora = None  # Remove a referência ao horário
-            ag.save()
-        
-        # Depois deletar todos os horários
-        count = HorarioDisponivel.objects.all().count()
-        HorarioDisponivel.objects.all().delete()
+        # Solta os agendamentos e apaga os horários em lotes (ver horarios.excluir_horarios)
+        count = horarios.excluir_horarios(HorarioDisponivel.objects.all())
         
         messages.success(request, f"Todos os {count} horários foram excluídos com sucesso!")
         return redirect('adicionar_horario')
@@ -1680,15 +1570,14 @@ def excluir_todos_horarios(request):
 def excluir_horarios_passados(request):
     if request.method == 'POST':
         hoje = timezone.now().date()
-        horarios_passados = HorarioDisponivel.objects.filter(data__lt=hoje)
-        count = horarios_passados.count()
-        horarios_passados.delete()
+        count = horarios.excluir_horarios(HorarioDisponivel.objects.filter(data__lt=hoje))
         
         messages.success(request, f'{count} horários passados foram excluídos com sucesso!')
         return redirect('adicionar_horario')
     
     return redirect('adicionar_horario')
 
+@only_admin
 def excluir_horarios_periodo(request):
     if request.method == 'GET':
         data_inicio = request.GET.get('inicio')
@@ -1702,9 +1591,9 @@ def excluir_horarios_periodo(request):
                 messages.error(request, 'A data de início não pode ser maior que a data de fim!')
                 return redirect('adicionar_horario')
             
-            horarios_periodo = HorarioDisponivel.objects.filter(data__gte=data_inicio, data__lte=data_fim)
-            count = horarios_periodo.count()
-            horarios_periodo.delete()
+            count = horarios.excluir_horarios(
+                HorarioDisponivel.objects.filter(data__gte=data_inicio, data__lte=data_fim)
+            )
             
             messages.success(request, f'{count} horários no período selecionado foram excluídos com sucesso!')
             return redirect('adicionar_horario')
@@ -1717,14 +1606,10 @@ def excluir_horarios_periodo(request):
 
 # ------------------------- VIEWS LISTA DE CLIENTES -------------------------
 
-from django.db.models import Count, Max, Sum, DecimalField, ExpressionWrapper
 from decimal import Decimal
 
 @only_admin
 def lista_cliente(request):
-    # Inicia com todos os agendamentos
-    agendamentos = Agendamento.objects.filter()
-
     # Aplicar filtros
     nome = request.GET.get('nome')
     data_inicio = request.GET.get('data_inicio')
@@ -1732,71 +1617,28 @@ def lista_cliente(request):
     status_filtro = request.GET.get('status')
     profissional_filtro = request.GET.get('profissional')
     servico_filtro_id = request.GET.get('servico')
-    
-    if nome:
-        agendamentos = agendamentos.filter(nome__icontains=nome)
-    if data_inicio:
-        agendamentos = agendamentos.filter(data__gte=data_inicio)
-    if data_fim:
-        agendamentos = agendamentos.filter(data__lte=data_fim)
-    if servico_filtro_id:
-        agendamentos = agendamentos.filter(servico__id=servico_filtro_id)
-    if status_filtro:
-        agendamentos = agendamentos.filter(status=status_filtro)
-    if profissional_filtro:
-        agendamentos = agendamentos.filter(profissional__slug=profissional_filtro)
-    
-    
-    # --- INÍCIO DA CORREÇÃO ---
-    
-    # 1. Criamos a base da subconsulta
-    subquery_agendamentos = Agendamento.objects.filter(
-        nome=models.OuterRef('nome'),
-        telefone=models.OuterRef('telefone')
-    )
 
-    # 2. Aplicamos os MESMOS filtros da consulta principal na subconsulta
-    #    (O filtro 'nome' não é necessário aqui, pois já está no OuterRef)
-    if data_inicio:
-        subquery_agendamentos = subquery_agendamentos.filter(data__gte=data_inicio)
-    if data_fim:
-        subquery_agendamentos = subquery_agendamentos.filter(data__lte=data_fim)
-    if servico_filtro_id:
-        subquery_agendamentos = subquery_agendamentos.filter(servico__id=servico_filtro_id)
-    if status_filtro:
-        subquery_agendamentos = subquery_agendamentos.filter(status=status_filtro)
-    if profissional_filtro:
-        subquery_agendamentos = subquery_agendamentos.filter(profissional__slug=profissional_filtro)
-
-    # 3. Criamos as anotações usando a subconsulta JÁ FILTRADA
-    clientes = agendamentos.values('nome', 'telefone').annotate(
-        
-        # O total de visitas SÓ considera os filtros, está correto
-        total_visitas=Count('id', filter=Q(status='concluido')),
-        
-        # A última visita SÓ considera os filtros, está correto
-        ultima_visita=Max('data'),
-        
-        # Agora as subconsultas também respeitam os filtros
-        ultimo_profissional=models.Subquery(
-            subquery_agendamentos.order_by('-data', '-hora_backup').values('profissional__nome')[:1]
-        ),
-        ultimo_servico=models.Subquery(
-            subquery_agendamentos.order_by('-data', '-hora_backup').values('servico__nome')[:1]
-        )
-    ).order_by('nome')
-    
-    # --- FIM DA CORREÇÃO ---
-
-    # Renomear o campo profissional__nome para profissional
-    clientes = [{
-        'nome': c['nome'],
-        'telefone': c['telefone'],
-        'profissional': c['ultimo_profissional'],
-        'total_visitas': c['total_visitas'],
-        'ultima_visita': c['ultima_visita'],
-        'ultimo_servico': c['ultimo_servico']
-    } for c in clientes]
+    if not (data_inicio or data_fim or status_filtro or profissional_filtro or servico_filtro_id):
+        # Caso comum: lê o cadastro de clientes já consolidado (ordem pelo índice de nome)
+        consulta = Cliente.objects.order_by('nome')
+        if nome:
+            consulta = consulta.filter(busca.filtro_nome(nome))
+        clientes = [{
+            'id': c['id'],
+            'nome': c['nome'],
+            'telefone': c['telefone'],
+            'profissional': c['ultimo_profissional__nome'],
+            'total_visitas': c['visitas_concluidas'],
+            'ultima_visita': c['ultima_visita'],
+            'ultimo_servico': c['ultimo_servico'],
+        } for c in consulta.values(
+            'id', 'nome', 'telefone', 'ultimo_profissional__nome', 'visitas_concluidas', 'ultima_visita', 'ultimo_servico'
+        )]
+    else:
+        # Com filtros de agendamento, os números valem só para os agendamentos
+        # filtrados; o agrupamento é pelo cliente (chave estrangeira indexada)
+        agendamentos = relatorios.agendamentos_clientes(relatorios.filtros_de('clientes', request.GET))
+        clientes = list(resumo_por_cliente(agendamentos))
     
     # Obter choices de serviços para o filtro
     servicos = Servico.objects.filter(ativo=True).order_by('ordem', 'nome')
@@ -1810,13 +1652,19 @@ def lista_cliente(request):
 
 @only_admin
 def historico_cliente(request):
+    cliente_id = request.GET.get('cliente')
     nome = request.GET.get('nome')
     telefone = request.GET.get('telefone')
-    
-    historico = Agendamento.objects.filter(
-        nome=nome,
-        telefone=telefone
-    ).order_by('-data', '-hora_backup')  # Ordena pelo backup se hora for None
+
+    if cliente_id:
+        # Todos os agendamentos do cliente, inclusive com o telefone escrito de outro jeito
+        historico = Agendamento.objects.filter(cliente_id=cliente_id)
+    else:
+        historico = Agendamento.objects.filter(
+            nome=nome,
+            telefone=telefone
+        )
+    historico = historico.order_by('-data', '-hora_backup')  # Ordena pelo backup se hora for None
     
     return render(request, 'LihStudio/historico_cliente.html', {
         'historico': historico,
@@ -1824,103 +1672,70 @@ def historico_cliente(request):
         'cliente_telefone': telefone
     })
 
-from django.template.loader import get_template
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from xhtml2pdf import pisa
-from itertools import groupby
+def _exportar(request, tipo):
+    """Pede o PDF ao worker (ou reaproveita um igual) e mostra a página de espera."""
+    try:
+        filtros = relatorios.filtros_de(tipo, request.GET)
+    except ValueError:
+        return HttpResponseBadRequest('Filtros inválidos')
+
+    exportacao = relatorios.solicitar(tipo, filtros, request.user)
+    if exportacao.status == 'pronto':
+        return redirect('baixar_exportacao', exportacao_id=exportacao.id)
+    return render(request, 'LihStudio/exportacao_aguarde.html', {'exportacao': exportacao})
+
 
 @only_admin
 def exportar_clientes_pdf(request):
-    # --- INÍCIO DA CORREÇÃO ---
-    # Renomeamos as variáveis de filtro para evitar conflito
-    nome_filtro = request.GET.get('nome')
-    servico_filtro_id = request.GET.get('servico')
-    data_inicio_filtro = request.GET.get('data_inicio')
-    data_fim_filtro = request.GET.get('data_fim')
-    profissional_filtro_slug = request.GET.get('profissional')
-    status_filtro = request.GET.get('status')
-    
-    agendamentos = Agendamento.objects.all()
-    
-    # Aplicar filtros usando as novas variáveis
-    if nome_filtro:
-        agendamentos = agendamentos.filter(nome__icontains=nome_filtro)
-    if servico_filtro_id:
-        agendamentos = agendamentos.filter(servico=servico_filtro_id)
-    if data_inicio_filtro and data_fim_filtro:
-        agendamentos = agendamentos.filter(data__range=[data_inicio_filtro, data_fim_filtro])
-    elif data_inicio_filtro:
-        agendamentos = agendamentos.filter(data__gte=data_inicio_filtro)
-    elif data_fim_filtro:
-        agendamentos = agendamentos.filter(data__lte=data_fim_filtro)
-    if profissional_filtro_slug:
-        agendamentos = agendamentos.filter(profissional__slug=profissional_filtro_slug)
-    if status_filtro:
-        agendamentos = agendamentos.filter(status=status_filtro)
-    
-    # Agrupar por cliente e preparar dados para o template
-    clientes_data = []
-    for nome, group in groupby(
-        agendamentos.order_by('nome', '-data', '-hora__hora'),
-        key=lambda x: (x.nome, x.telefone)
-    ):
-        ags = list(group)
-        ultimo = ags[0]
-        
-        clientes_data.append({
-            'nome': ultimo.nome,
-            'telefone': ultimo.telefone,
-            'profissional': ultimo.profissional.nome if ultimo.profissional else '',
-            'ultima_visita': ultimo.data,
-            'ultimo_servico': ultimo.get_servico_display(),
-            'status': ultimo.status,
-            'total_visitas': sum(1 for a in ags if a.status == 'concluido')
-        })
-    
-    # Construir string de filtros usando as variáveis corretas
-    filtros = []
-    if nome_filtro: 
-        filtros.append(f"Nome: {nome_filtro}") # ⬅️ CORRIGIDO
-    if servico_filtro_id: 
-        try:
-            servico_obj = Servico.objects.get(id=servico_filtro_id)
-            servico_display = servico_obj.nome
-        except Servico.DoesNotExist:
-            servico_display = f"ID {servico_filtro_id} (desconhecido)"
-        filtros.append(f"Serviço: {servico_display}") # ⬅️ CORRIGIDO
-    if profissional_filtro_slug:
-        profissional = Profissional.objects.filter(slug=profissional_filtro_slug).first()
-        if profissional:
-            filtros.append(f"Profissional: {profissional.nome}") # ⬅️ CORRIGIDO
-    if status_filtro: 
-        status_display = dict(Agendamento.STATUS_CHOICES).get(status_filtro, status_filtro)
-        filtros.append(f"Status: {status_display}") # ⬅️ CORRIGIDO
-    if data_inicio_filtro or data_fim_filtro:
-        periodo = []
-        if data_inicio_filtro:
-            periodo.append(f"de {data_inicio_filtro}")
-        if data_fim_filtro:
-            periodo.append(f"até {data_fim_filtro}")
-        filtros.append(f"Período: {' '.join(periodo)}") # ⬅️ CORRIGIDO
-    
-    # Contexto
-    context = {
-        'clientes': clientes_data,
-        'filtros_aplicados': ' • '.join(filtros) if filtros else "Nenhum filtro aplicado",
-        'request': request
-    }
-    
-    template = get_template('LihStudio/clientes_pdf.html')
-    html = template.render(context)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="relatorio_clientes.pdf"'
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('Erro ao gerar PDF', status=500)
-    return response
+    return _exportar(request, 'clientes')
+
+
+def _planilha(request, tipo, nome_arquivo, cabecalho, linhas):
+    formato = request.GET.get('formato', 'csv')
+    if formato not in planilhas.FORMATOS:
+        return HttpResponseBadRequest('Formato inválido')
+    try:
+        filtros = relatorios.filtros_de(tipo, request.GET)
+    except ValueError:
+        return HttpResponseBadRequest('Filtros inválidos')
+    if tipo == 'faturamento' and request.GET.get('periodo') == 'ano':
+        filtros.pop('mes')
+        nome_arquivo = f"faturamento_{filtros['ano']}"
+    elif tipo == 'faturamento':
+        nome_arquivo = f"faturamento_{filtros['ano']}_{int(filtros['mes']):02d}"
+    return planilhas.resposta(formato, nome_arquivo, cabecalho, linhas(filtros))
+
+
+@only_admin
+def exportar_clientes_planilha(request):
+    return _planilha(request, 'clientes', 'clientes', relatorios.CABECALHO_CLIENTES, relatorios.linhas_clientes)
+
+
+@only_admin
+def exportar_faturamento_planilha(request):
+    return _planilha(request, 'faturamento', 'faturamento', relatorios.CABECALHO_FATURAMENTO,
+                     relatorios.linhas_faturamento)
+
+
+@only_admin
+def status_exportacao(request, exportacao_id):
+    exportacao = get_object_or_404(ExportacaoRelatorio, id=exportacao_id)
+    return JsonResponse({
+        'status': exportacao.status,
+        'erro': exportacao.erro if exportacao.status == 'falhou' else '',
+        'download': reverse('baixar_exportacao', args=[exportacao.id]) if exportacao.status == 'pronto' else None,
+    })
+
+
+@only_admin
+def baixar_exportacao(request, exportacao_id):
+    exportacao = get_object_or_404(ExportacaoRelatorio, id=exportacao_id, status='pronto')
+    try:
+        arquivo = open(relatorios.caminho(exportacao), 'rb')
+    except FileNotFoundError:
+        raise Http404('Arquivo do relatório não encontrado')
+    return FileResponse(arquivo, as_attachment=True, filename=exportacao.nome_download,
+                        content_type='application/pdf')
 
 def pagina_erro_404(request, exception=None):
     return render(request, 'LihStudio/404.html', status=404)
@@ -1977,59 +1792,16 @@ def relatorio_faturamento(request):
     mes_atual = int(mes_filtro) if mes_filtro else hoje.month
     ano_atual = int(ano_filtro) if ano_filtro else hoje.year
 
-    # Query base: Apenas agendamentos CONCLUÍDOS, com valor E MARCADOS PARA CONTABILIZAR
-    faturamento_base = Agendamento.objects.filter(
-        status='concluido',
-        valor_total__isnull=False,
-        contabilizar=True  # ⬅️ NOVA CONDIÇÃO AQUI
-    )
-    
-    # Aplicar filtro de Mês e Ano
-    faturamento_mes_query = faturamento_base.filter(
-        data__year=ano_atual,
-        data__month=mes_atual
-    )
-    
-    # Aplicar filtro de Profissional, se houver
-    if prof_slug_filtro and prof_slug_filtro != 'todos':
-        faturamento_mes_query = faturamento_mes_query.filter(profissional__slug=prof_slug_filtro)
-
-    # 1. Estatísticas Gerais (Total)
-    faturamento_total_bruto = faturamento_base.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-
-    # 2. Estatísticas do Período Filtrado
-    faturamento_mes_aggr = faturamento_mes_query.aggregate(
-        total_bruto=Sum('valor_total'),
-        total_servicos=Count('id')
-    )
-    
-    total_bruto_mes = faturamento_mes_aggr['total_bruto'] or Decimal('0.00')
-    total_servicos_mes = faturamento_mes_aggr['total_servicos']
-    total_comissao_mes = total_bruto_mes * Decimal('0.30')
-    
-    # 3. Análise por Profissional (para a tabela)
-    analise_profissionais = faturamento_mes_query.values(
-        'profissional__nome', 
-        'profissional__slug'
-    ).annotate(
-        total_servicos=Count('id'),
-        faturamento_bruto=Sum('valor_total'),
-        comissao_prof=ExpressionWrapper(
-            Sum('valor_total') * Decimal('0.30'), 
-            output_field=DecimalField()
-        ) 
-    ).order_by('-faturamento_bruto')
+    # Totais, histórico e análise por profissional vêm do consolidado mensal
+    # (FaturamentoMensal): o custo não cresce com o histórico
+    resumo = faturamento.resumo_mes(ano_atual, mes_atual, prof_slug_filtro)
     
     # Obter nome do mês
     meses = {1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho", 7: "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"}
     mes_nome = meses.get(mes_atual, "")
     
     context = {
-        'faturamento_total_bruto': faturamento_total_bruto,
-        'total_bruto_mes': total_bruto_mes,
-        'total_servicos_mes': total_servicos_mes,
-        'total_comissao_mes': total_comissao_mes,
-        'analise_profissionais': analise_profissionais,
+        **resumo,
         'profissionais': Profissional.objects.filter(ativo=True), # Para o filtro
         
         # Variáveis de filtro para manter o estado
@@ -2041,90 +1813,35 @@ def relatorio_faturamento(request):
     }
     return render(request, 'LihStudio/faturamento.html', context)
 
+def _mes_param(valor, padrao):
+    if not valor:
+        return padrao
+    data = datetime.strptime(valor, "%Y-%m").date()
+    return data.year, data.month
+
+
 @only_admin
-def exportar_faturamento_pdf(request):
+def faturamento_serie(request):
+    """
+    Evolução do faturamento mês a mês em JSON
+    (?de=AAAA-MM&ate=AAAA-MM&profissional=<slug>); sem `de`, os 12 meses até `ate`.
+    """
     hoje = timezone.now().date()
-    agora = timezone.now()
-    
-    # 1. COPIAMOS EXATAMENTE A MESMA LÓGICA DE FILTRO DA OUTRA VIEW
-    mes_filtro = request.GET.get('mes')
-    ano_filtro = request.GET.get('ano')
-    prof_slug_filtro = request.GET.get('profissional')
-
-    mes_atual = int(mes_filtro) if mes_filtro else hoje.month
-    ano_atual = int(ano_filtro) if ano_filtro else hoje.year
+    try:
+        fim = _mes_param(request.GET.get('ate'), (hoje.year, hoje.month))
+        inicio = _mes_param(request.GET.get('de'), (fim[0], 1) if fim[1] == 12 else (fim[0] - 1, fim[1] + 1))
+    except ValueError:
+        return JsonResponse({"erro": "Mês inválido, use AAAA-MM."}, status=400)
 
-    faturamento_base = Agendamento.objects.filter(
-        status='concluido',
-        valor_total__isnull=False,
-        contabilizar=True
-    )
-    
-    faturamento_mes_query = faturamento_base.filter(
-        data__year=ano_atual,
-        data__month=mes_atual
-    )
-    
-    if prof_slug_filtro and prof_slug_filtro != 'todos':
-        faturamento_mes_query = faturamento_mes_query.filter(profissional__slug=prof_slug_filtro)
+    try:
+        serie = faturamento.serie_mensal(inicio, fim, request.GET.get('profissional'))
+    except ValueError as erro:
+        return JsonResponse({"erro": str(erro)}, status=400)
+    return JsonResponse(serie, json_dumps_params={"separators": (",", ":")})
 
-    # 2. COPIAMOS OS CÁLCULOS
-    faturamento_total_bruto = faturamento_base.aggregate(total=Sum('valor_total'))['total'] or Decimal('0.00')
-    
-    faturamento_mes_aggr = faturamento_mes_query.aggregate(
-        total_bruto=Sum('valor_total'),
-        total_servicos=Count('id')
-    )
-    
-    total_bruto_mes = faturamento_mes_aggr['total_bruto'] or Decimal('0.00')
-    total_servicos_mes = faturamento_mes_aggr['total_servicos']
-    total_comissao_mes = total_bruto_mes * Decimal('0.30')
-    
-    analise_profissionais = faturamento_mes_query.values(
-        'profissional__nome', 
-        'profissional__slug'
-    ).annotate(
-        total_servicos=Count('id'),
-        faturamento_bruto=Sum('valor_total'),
-        comissao_prof=ExpressionWrapper(
-            Sum('valor_total') * Decimal('0.30'), 
-            output_field=DecimalField()
-        ) 
-    ).order_by('-faturamento_bruto')
-    
-    meses = {1: "Janeiro", 2: "Fevereiro", 3: "Março", 4: "Abril", 5: "Maio", 6: "Junho", 7: "Julho", 8: "Agosto", 9: "Setembro", 10: "Outubro", 11: "Novembro", 12: "Dezembro"}
-    mes_nome = meses.get(mes_atual, "")
-    # 3. [NOVO] BUSCAMOS OS AGENDAMENTOS DETALHADOS (necessário para o PDF)
-    agendamentos_detalhados = faturamento_mes_query.select_related(
-        'hora', 'profissional', 'servico'
-    ).order_by('data', 'hora_backup') # Usar 'hora_backup' é mais seguro
-    
-    # 4. MONTAMOS O CONTEXTO COMPLETO PARA O TEMPLATE PDF
-    context = {
-        'faturamento_total_bruto': faturamento_total_bruto,
-        'total_bruto_mes': total_bruto_mes,
-        'total_servicos_mes': total_servicos_mes,
-        'total_comissao_mes': total_comissao_mes,
-        'analise_profissionais': analise_profissionais,
-        'agendamentos_detalhados': agendamentos_detalhados, # ⬅️ Novo
-        'mes_atual': mes_atual,
-        'ano_atual': ano_atual,
-        'prof_slug_filtro': prof_slug_filtro,
-        'mes_nome': mes_nome,
-        'hoje': agora,
-    }
-    
-    # 5. RENDERIZAMOS O PDF
-    template = get_template('LihStudio/faturamento_pdf.html') #
-    html = template.render(context)
-    
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="faturamento_{mes_nome}_{ano_atual}.pdf"'
-    
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse('Erro ao gerar PDF', status=500)
-    return response
+@only_admin
+def exportar_faturamento_pdf(request):
+    return _exportar(request, 'faturamento')
 
 # ------------------------- VIEWS PAGINA ADMIN -------------------------
 
@@ -2278,25 +1995,24 @@ def painel_funcionario(request):
     """
     View "lite" para funcionários, mostrando apenas a agenda do dia e futura.
     """
+    # Superusuários veem o painel completo
+    if request.user.is_superuser:
+        return redirect('painel_dona') # Se for a dona, manda pro painel completo
+
     hoje = date.today()
     
     agendamentos_hoje = Agendamento.objects.filter(data=hoje).exclude(status='cancelado') \
         .select_related('hora', 'profissional', 'servico') \
         .order_by('hora__hora')
-    agendamentos_futuros = Agendamento.objects.filter(
-        data__gte=hoje
-    ).exclude(data=hoje).exclude(status='cancelado').order_by('data', 'hora__hora')
+    agendamentos_futuros, proximo_futuros = painel.pagina(painel.agendamentos_futuros(hoje))
     
     context = {
         'agendamentos_hoje': agendamentos_hoje,
         'agendamentos_futuros': agendamentos_futuros,
+        'proximo_futuros': proximo_futuros,
         'hoje': hoje,
         'is_superuser': request.user.is_superuser # Para exibir links de admin se for a dona
     }
     
-    # Superusuários veem o painel completo
-    if request.user.is_superuser:
-        return redirect('painel_dona') # Se for a dona, manda pro painel completo
-    
     # Funcionários comuns veem o painel lite
     return render(request, 'LihStudio/painel_funcionario.html', context)
\ No newline at end of file